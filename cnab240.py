@@ -0,0 +1,230 @@
+from cnab_core import (
+    CnabResult, _destinations, _replace_numeric_field, is_padding_line,
+    DESTINO_TODOS, LAYOUT_CNAB240, MOTIVO_TAMANHO_INSUFICIENTE, MOTIVO_ERRO
+)
+
+# Layout FEBRABAN CNAB240 (retorno de cobrança)
+# Tipo de registro (posição 8)
+TIPO_HEADER_ARQUIVO = '0'
+TIPO_HEADER_LOTE = '1'
+TIPO_DETALHE = '3'
+TIPO_TRAILER_LOTE = '5'
+TIPO_TRAILER_ARQUIVO = '9'
+TIPOS_REGISTRO = frozenset('01359')
+
+# Segmento que inicia um título no retorno de cobrança (os demais, como U e Y, o complementam)
+SEGMENTO_INICIAL = 'T'
+
+# Campos (início, fim) usados pelo parser
+CAMPO_SEQUENCIAL_LOTE = (8, 13)          # nº do registro no lote (detalhes)
+CAMPO_MOVIMENTO = (15, 17)               # código de movimento retorno (detalhes)
+CAMPO_VALOR_TITULO_T = (81, 96)          # valor nominal do título (segmento T)
+CAMPO_LOTE_QTD_REGISTROS = (17, 23)      # trailer de lote: registros do lote (com header/trailer)
+CAMPO_LOTE_QTD_TITULOS = (23, 29)        # trailer de lote: títulos em cobrança simples
+CAMPO_LOTE_VALOR_TITULOS = (29, 46)      # trailer de lote: valor total em cobrança simples
+CAMPO_ARQUIVO_QTD_LOTES = (17, 23)       # trailer de arquivo: quantidade de lotes
+CAMPO_ARQUIVO_QTD_REGISTROS = (23, 29)   # trailer de arquivo: registros do arquivo
+
+
+def _field_int(linha, campo):
+    valor = linha[campo[0]:campo[1]]
+    return int(valor) if valor.isdigit() else None
+
+
+class _Output240:
+    """
+    Estado de uma saída (principal ou perfil) durante a passada: renumera os
+    detalhes dentro do lote e reconstrói os trailers de lote e de arquivo.
+    """
+
+    __slots__ = ('operacoes', 'destino_dados', 'resultado', 'registros_lote', 'titulos_lote',
+                 'valor_lote', 'registros_arquivo', 'lotes')
+
+    def __init__(self, operacoes, destino_dados, resultado):
+        self.operacoes = operacoes
+        self.destino_dados = destino_dados
+        self.resultado = resultado
+        self.registros_lote = 0
+        self.titulos_lote = 0
+        self.valor_lote = 0
+        self.registros_arquivo = 0
+        self.lotes = 0
+
+    def accepts(self, movimento):
+        return not self.operacoes or not movimento or movimento in self.operacoes
+
+    def header_lote(self, linha):
+        self.registros_lote = 0
+        self.titulos_lote = 0
+        self.valor_lote = 0
+        self.lotes += 1
+        self.registros_arquivo += 1
+        return linha
+
+    def titulo(self, segmentos, valor):
+        self.titulos_lote += 1
+        self.valor_lote += valor
+        linhas = []
+        for segmento in segmentos:
+            self.registros_lote += 1
+            linhas.append(_replace_numeric_field(segmento, CAMPO_SEQUENCIAL_LOTE, self.registros_lote))
+        self.registros_arquivo += len(linhas)
+        return linhas
+
+    def trailer_lote(self, linha):
+        linha = _replace_numeric_field(linha, CAMPO_LOTE_QTD_REGISTROS, self.registros_lote + 2)
+        linha = _replace_numeric_field(linha, CAMPO_LOTE_QTD_TITULOS, self.titulos_lote)
+        linha = _replace_numeric_field(linha, CAMPO_LOTE_VALOR_TITULOS, self.valor_lote)
+        self.registros_arquivo += 1
+        return linha
+
+    def trailer_arquivo(self, linha):
+        linha = _replace_numeric_field(linha, CAMPO_ARQUIVO_QTD_LOTES, self.lotes)
+        return _replace_numeric_field(linha, CAMPO_ARQUIVO_QTD_REGISTROS, self.registros_arquivo + 1)
+
+
+def iter_classified_lines_240(linhas, config, resultado, perfis=None):
+    """
+    Classifica um arquivo CNAB240 em streaming, com a mesma interface de
+    cnab_core.iter_classified_lines
+
+    Os segmentos de detalhe são agrupados em títulos (um título começa no
+    segmento T; U, Y etc. o complementam) e o título inteiro é mantido ou
+    descartado conforme o código de movimento do segmento T. Apenas o título
+    atual fica em memória. Headers de arquivo/lote são mantidos, o número do
+    registro no lote é renumerado e os trailers de lote e de arquivo são
+    reconstruídos com as quantidades e valores mantidos.
+
+    CNAB240 não tem o tipo antecipado/normal da coluna 319: todos os títulos
+    vão para a saída normal. Regras multi-campo (layout CNAB400) não se aplicam.
+
+    Args:
+        linhas (iterable): Linhas do arquivo
+        config (BankConfig): Configuração compilada do banco
+        resultado (CnabResult): Objeto que acumula os contadores
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile)
+
+    Yields:
+        tuple: (str, int) - (linha, máscara de destinos DESTINO_*)
+    """
+    resultado.layout = LAYOUT_CNAB240
+    contagem_operacoes = resultado.contagem_operacoes
+    integridade = resultado.integridade
+    integridade.totais_padronizados = True
+
+    principal = _Output240(config.operations, _destinations(config)[1], resultado)
+    saidas_perfis = []
+    for perfil in perfis or ():
+        resultado_perfil = CnabResult(resultado.banco, perfil.nome)
+        resultado_perfil.layout = LAYOUT_CNAB240
+        resultado.perfis[perfil.nome] = resultado_perfil
+        saidas_perfis.append(_Output240(perfil.config.operations, _destinations(perfil.config)[1], resultado_perfil))
+
+    segmentos = []
+    registros_lidos_lote = 0
+    sequencia_esperada = 0
+    registros_lidos = 0
+    ultimo_tipo = None
+
+    def concluir_titulo():
+        """Decide o título acumulado em ``segmentos`` para cada saída"""
+        movimento = segmentos[0][CAMPO_MOVIMENTO[0]:CAMPO_MOVIMENTO[1]].strip()
+        valor = 0
+        for segmento in segmentos:
+            if segmento[13:14] == SEGMENTO_INICIAL:
+                valor = _field_int(segmento, CAMPO_VALOR_TITULO_T) or 0
+                break
+        resultado.linhas_validas += 1
+        resultado.operacoes_sem_tipo += 1
+        if movimento:
+            contagem_operacoes[movimento] = contagem_operacoes.get(movimento, 0) + 1
+
+        for saida in saidas_perfis:
+            if saida.accepts(movimento):
+                for linha in saida.titulo(segmentos, valor):
+                    saida.resultado.add_line(linha, saida.destino_dados)
+        if principal.accepts(movimento):
+            return principal.titulo(segmentos, valor)
+        return ()
+
+    for i, linha in enumerate(linhas):
+        resultado.total_linhas = i + 1
+        try:
+            linha = linha.rstrip('\n')
+            if i == 0:
+                resultado.primeira_linha = linha
+            if ultimo_tipo == TIPO_TRAILER_ARQUIVO and is_padding_line(linha):
+                # Linhas em branco/0x1A depois do trailer de arquivo
+                continue
+            tipo = linha[7:8]
+            if tipo not in TIPOS_REGISTRO or len(linha) < CAMPO_ARQUIVO_QTD_REGISTROS[1]:
+                resultado.linhas_invalidas += 1
+                resultado.linhas_rejeitadas.append(
+                    (i + 1, MOTIVO_TAMANHO_INSUFICIENTE, f"registro CNAB240 inválido ({len(linha)} caracteres)", linha))
+                continue
+            registros_lidos += 1
+            ultimo_tipo = tipo
+            if i == 0:
+                integridade.tipo_header = tipo
+
+            if tipo == TIPO_DETALHE:
+                registros_lidos_lote += 1
+                sequencia_esperada += 1
+                if _field_int(linha, CAMPO_SEQUENCIAL_LOTE) != sequencia_esperada:
+                    integridade.sequencias_divergentes += 1
+                    if integridade.primeira_sequencia_divergente is None:
+                        integridade.primeira_sequencia_divergente = i + 1
+                if linha[13:14] == SEGMENTO_INICIAL and segmentos:
+                    for mantida in concluir_titulo():
+                        resultado.linhas_mantidas += 1
+                        yield mantida, principal.destino_dados
+                    segmentos = []
+                segmentos.append(linha)
+                continue
+
+            # Registro estrutural: conclui o título pendente antes de tratá-lo
+            if segmentos:
+                for mantida in concluir_titulo():
+                    resultado.linhas_mantidas += 1
+                    yield mantida, principal.destino_dados
+                segmentos = []
+
+            if tipo == TIPO_HEADER_LOTE:
+                registros_lidos_lote = 0
+                sequencia_esperada = 0
+                for saida in saidas_perfis:
+                    saida.resultado.add_line(saida.header_lote(linha), DESTINO_TODOS)
+                linha = principal.header_lote(linha)
+            elif tipo == TIPO_TRAILER_LOTE:
+                quantidade = _field_int(linha, CAMPO_LOTE_QTD_REGISTROS)
+                if quantidade is not None and quantidade != registros_lidos_lote + 2:
+                    integridade.lotes_divergentes += 1
+                for saida in saidas_perfis:
+                    saida.resultado.add_line(saida.trailer_lote(linha), DESTINO_TODOS)
+                linha = principal.trailer_lote(linha)
+            elif tipo == TIPO_TRAILER_ARQUIVO:
+                integridade.trailer_quantidade = _field_int(linha, CAMPO_ARQUIVO_QTD_REGISTROS)
+                for saida in saidas_perfis:
+                    saida.resultado.add_line(saida.trailer_arquivo(linha), DESTINO_TODOS)
+                linha = principal.trailer_arquivo(linha)
+            else:
+                for saida in saidas_perfis:
+                    saida.registros_arquivo += 1
+                    saida.resultado.add_line(linha, DESTINO_TODOS)
+                principal.registros_arquivo += 1
+
+            resultado.linhas_mantidas += 1
+            yield linha, DESTINO_TODOS
+
+        except Exception as e:
+            resultado.linhas_invalidas += 1
+            resultado.linhas_rejeitadas.append((i + 1, MOTIVO_ERRO, str(e), linha))
+
+    # Arquivo sem trailer: conclui o último título lido
+    if segmentos:
+        for mantida in concluir_titulo():
+            resultado.linhas_mantidas += 1
+            yield mantida, principal.destino_dados
+
+    integridade.tipo_trailer = ultimo_tipo
+    integridade.registros = registros_lidos
@@ -0,0 +1,214 @@
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+# Situação de um arquivo no registro dos agregados
+REGISTRADO = 'registrado'
+DUPLICADO = 'duplicado'
+
+# Colunas da chave dos totais (também os agrupamentos aceitos pela consulta)
+COLUNAS_CHAVE = ('banco', 'operacao', 'tipo', 'vencimento')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS arquivos (
+    hash TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    banco TEXT NOT NULL,
+    registrado_em TEXT NOT NULL,
+    titulos INTEGER NOT NULL,
+    centavos INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totais (
+    banco TEXT NOT NULL,
+    operacao TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    vencimento TEXT NOT NULL,
+    centavos INTEGER NOT NULL,
+    quantidade INTEGER NOT NULL,
+    PRIMARY KEY (banco, operacao, tipo, vencimento)
+) WITHOUT ROWID;
+"""
+
+
+def aggregates_enabled():
+    """AGREGADOS=true ativa os totais por banco/operação/tipo/vencimento (padrão: desativado)"""
+    return os.getenv('AGREGADOS', 'false').lower() == 'true'
+
+
+def aggregates_path():
+    """Banco SQLite dos agregados (AGREGADOS_DB, padrão: agregados.db, relativo a este módulo)"""
+    caminho = os.getenv('AGREGADOS_DB', 'agregados.db')
+    if not os.path.isabs(caminho):
+        caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), caminho)
+    return caminho
+
+
+def connect(caminho=None):
+    """Abre o banco dos agregados, criando as tabelas se necessário"""
+    caminho = caminho or aggregates_path()
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    # WAL: consultas pela linha de comando não bloqueiam o registro de um arquivo
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.executescript(ESQUEMA)
+    return conexao
+
+
+def record_file_aggregates(nome, banco, hash_conteudo, totais, caminho=None):
+    """
+    Soma os títulos de um arquivo CNAB400 nos totais, uma única vez por conteúdo
+
+    Os totais vêm da própria classificação do arquivo (``CnabResult.totais_titulos``,
+    com ``filter_cnab(..., totais=True)``), sem reler o arquivo. O arquivo entra
+    no registro pelo SHA-256 do conteúdo descompactado, os mesmos bytes que
+    foram somados: reprocessar o mesmo arquivo (ou uma cópia com outro nome ou
+    outra compactação) não conta os valores de novo. O registro do arquivo e a
+    soma nos totais são gravados na mesma transação.
+
+    Args:
+        nome (str): Nome do arquivo .RET
+        banco (str): Banco identificado
+        hash_conteudo (str): SHA-256 do conteúdo (``CnabResult.hash_conteudo``)
+        totais (dict): {(operacao, tipo, vencimento): [centavos, quantidade]}
+        caminho (str, optional): Banco SQLite (padrão: AGREGADOS_DB)
+
+    Returns:
+        tuple: (str, int, int) - (REGISTRADO ou DUPLICADO, títulos, centavos)
+    """
+    titulos = sum(quantidade for _, quantidade in totais.values())
+    centavos = sum(valor for valor, _ in totais.values())
+    conexao = connect(caminho)
+    try:
+        anterior = conexao.execute('SELECT titulos, centavos FROM arquivos WHERE hash = ?',
+                                   (hash_conteudo,)).fetchone()
+        if anterior:
+            return (DUPLICADO,) + tuple(anterior)
+
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            conexao.execute('INSERT INTO arquivos VALUES (?, ?, ?, ?, ?, ?)',
+                            (hash_conteudo, nome, banco,
+                             datetime.now().isoformat(timespec='seconds'), titulos, centavos))
+        except sqlite3.IntegrityError:
+            # Registrado por outro processo entre a consulta e a transação
+            conexao.execute('ROLLBACK')
+            return DUPLICADO, titulos, centavos
+        conexao.executemany(
+            'INSERT INTO totais VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (banco, operacao, tipo, vencimento) '
+            'DO UPDATE SET centavos = centavos + excluded.centavos, quantidade = quantidade + excluded.quantidade',
+            [(banco, operacao, tipo, vencimento, valor, quantidade)
+             for (operacao, tipo, vencimento), (valor, quantidade) in totais.items()])
+        conexao.execute('COMMIT')
+        return REGISTRADO, titulos, centavos
+    finally:
+        conexao.close()
+
+
+def query_totals(conexao, agrupar=COLUNAS_CHAVE, banco=None, operacao=None, tipo=None, de=None, ate=None):
+    """
+    Totais agrupados pelas colunas informadas, com filtros opcionais
+
+    Returns:
+        list: Tuplas (<colunas de agrupar>..., centavos, quantidade), em ordem das colunas
+    """
+    condicoes, parametros = [], []
+    for coluna, valor in (('banco', banco), ('operacao', operacao), ('tipo', tipo)):
+        if valor:
+            condicoes.append(f"{coluna} = ?")
+            parametros.append(valor)
+    if de:
+        condicoes.append("vencimento >= ?")
+        parametros.append(de)
+    if ate:
+        condicoes.append("vencimento <= ?")
+        parametros.append(ate)
+    colunas = ', '.join(agrupar)
+    sql = f"SELECT {colunas + ', ' if colunas else ''}SUM(centavos), SUM(quantidade) FROM totais"
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    if colunas:
+        sql += f" GROUP BY {colunas} ORDER BY {colunas}"
+    return [linha for linha in conexao.execute(sql, parametros).fetchall() if linha[-1]]
+
+
+def format_money(centavos):
+    """Centavos em reais no formato brasileiro (ex: 123456 -> '1.234,56')"""
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{'-' if centavos < 0 else ''}{reais:,}".replace(',', '.') + f",{resto:02d}"
+
+
+def _parse_date(valor):
+    """Aceita DD/MM/AAAA ou AAAA-MM-DD; retorna AAAA-MM-DD"""
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(valor, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"data inválida: {valor!r} (use DD/MM/AAAA)")
+
+
+def _parse_grouping(valor):
+    colunas = tuple(coluna.strip().lower() for coluna in valor.split(',') if coluna.strip())
+    invalidas = [coluna for coluna in colunas if coluna not in COLUNAS_CHAVE]
+    if invalidas:
+        raise argparse.ArgumentTypeError(f"agrupamento inválido: {', '.join(invalidas)} "
+                                         f"(use {', '.join(COLUNAS_CHAVE)})")
+    return colunas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Totais de títulos por banco, operação, tipo e vencimento")
+    parser.add_argument('--banco', help="Filtra um banco (ex: BB, BRADESCO)")
+    parser.add_argument('--operacao', help="Filtra um código de operação (ex: 06)")
+    parser.add_argument('--tipo', help="Filtra o tipo (1 antecipado, 2 normal)")
+    parser.add_argument('--de', type=_parse_date, help="Vencimento inicial (DD/MM/AAAA)")
+    parser.add_argument('--ate', type=_parse_date, help="Vencimento final (DD/MM/AAAA)")
+    parser.add_argument('--agrupar', type=_parse_grouping, default=COLUNAS_CHAVE,
+                        help="Colunas do agrupamento, separadas por vírgula (padrão: banco,operacao,tipo,vencimento)")
+    parser.add_argument('--arquivos', action='store_true', help="Lista os arquivos já contabilizados")
+    args = parser.parse_args()
+
+    if not os.path.exists(aggregates_path()):
+        print(f"⚠️ Nenhum agregado registrado ainda ({aggregates_path()})")
+        return 1
+    conexao = connect()
+    try:
+        if args.arquivos:
+            for nome, banco, registrado_em, titulos, centavos, hash_arquivo in conexao.execute(
+                    'SELECT nome, banco, registrado_em, titulos, centavos, hash FROM arquivos ORDER BY registrado_em'):
+                print(f"{registrado_em}  {nome:<40} {banco:<10} {titulos:>8} título(s)  "
+                      f"R$ {format_money(centavos):>16}  {hash_arquivo[:12]}")
+            return 0
+
+        linhas = query_totals(conexao, args.agrupar, args.banco, args.operacao, args.tipo, args.de, args.ate)
+        if not linhas:
+            print("⚠️ Nenhum título encontrado para os filtros informados")
+            return 1
+        larguras = {'banco': 10, 'operacao': 8, 'tipo': 4, 'vencimento': 10}
+        print('  '.join(f"{coluna.capitalize():<{larguras[coluna]}}" for coluna in args.agrupar)
+              + f"{'  ' if args.agrupar else ''}{'Títulos':>9}  {'Total (R$)':>18}")
+        total_centavos, total_titulos = 0, 0
+        for linha in linhas:
+            *chave, centavos, quantidade = linha
+            if 'vencimento' in args.agrupar:
+                posicao = args.agrupar.index('vencimento')
+                ano, mes, dia = chave[posicao].split('-')
+                chave[posicao] = f"{dia}/{mes}/{ano}"
+            print('  '.join(f"{valor:<{larguras[coluna]}}" for coluna, valor in zip(args.agrupar, chave))
+                  + f"{'  ' if args.agrupar else ''}{quantidade:>9}  {format_money(centavos):>18}")
+            total_centavos += centavos
+            total_titulos += quantidade
+        print(f"\n💰 Total: {total_titulos} título(s), R$ {format_money(total_centavos)}")
+        return 0
+    finally:
+        conexao.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+import os
+import time
+import asyncio
+import signal
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+
+import network_fs
+from cnab_scanner import get_scanner
+from cnab_lease import get_lease_manager, multi_node_enabled
+from cnab_config import get_config
+from cnab_logging import get_logger, setup_worker_logging, forward_worker_logs
+from cnab_profiling import record_scan_cycle
+from cnab_retention import live_processing, start_retention_worker
+from cnab_scheduler import get_scheduler
+from cnab_concurrency import start_concurrency_controller, record_stage, set_report_snapshot, ETAPA_CPU, ETAPA_IO
+from process_cnab import (
+    resolve_bank_settings, process_cnab_file, identify_bank, read_first_line,
+    should_process_file, is_file_processed, DeferredCopies
+)
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+logger = get_logger('daemon')
+
+# Espera de um worker acima do nível de paralelismo atual antes de conferir o nível de novo
+ESPERA_NIVEL = 0.5
+
+
+def list_pending_files(directory):
+    """
+    Lista os arquivos .RET de um diretório prontos e ainda não processados
+
+    Args:
+        directory (str): Diretório a ser verificado
+
+    Returns:
+        list: Caminhos completos dos arquivos pendentes
+    """
+    is_processed = is_file_processed
+    if multi_node_enabled():
+        leases = get_lease_manager(directory)
+        is_processed = lambda nome: is_file_processed(nome) or leases.is_done(nome)
+    inicio = time.perf_counter()
+    pendentes = get_scanner(directory, accept=should_process_file, is_processed=is_processed).scan()
+    record_scan_cycle(directory, time.perf_counter() - inicio, len(pendentes))
+    return pendentes
+
+
+def init_process_worker(fila_log):
+    """
+    Inicializa um processo de processamento
+
+    Ctrl+C é tratado só pelo processo principal, que espera os arquivos em
+    andamento terminarem; as mensagens vão para os handlers do principal.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_worker_logging(fila_log)
+
+
+def process_one_file(file_path, output_dirs, tempo_fila=None, paralelismo=None):
+    """
+    Processa um arquivo gravando apenas no diretório local (executado em um processo de processamento)
+
+    O lease (modo multi-nó) é reivindicado e liberado pelo processo principal;
+    o arquivo só é concluído (registro, journal e lease) por finish_file,
+    depois das cópias para os diretórios remotos.
+
+    Args:
+        file_path (str): Caminho do arquivo CNAB
+        output_dirs (list): Diretórios de saída locais
+        tempo_fila (float, optional): Tempo em segundos que o arquivo aguardou no agendador
+        paralelismo (list, optional): Linhas de paralelismo do controlador do processo principal (relatório)
+
+    Returns:
+        tuple: (bool, DeferredCopies) - (sucesso, arquivos a copiar para os diretórios remotos)
+    """
+    set_report_snapshot(paralelismo)
+    copias = DeferredCopies()
+    config = get_config()
+    banco, operacoes_desejadas, separar_antecipacao = resolve_bank_settings(file_path, config.as_dict())
+    _, _, sucesso = process_cnab_file(file_path, operacoes_desejadas, banco, separar_antecipacao,
+                                      output_dirs, copias_adiadas=copias, tempo_fila=tempo_fila,
+                                      versao_config=config.version,
+                                      bank_config=config.enabled_bank(banco),
+                                      perfis=config.profiles_for(banco))
+    return sucesso, copias
+
+
+def copy_deferred(copias, origem, destino_dir):
+    """Copia uma saída adiada e a registra no journal (também se ela ficou em pendências)"""
+    destino = network_fs.copy_to_dir(origem, destino_dir)
+    copias.copied(origem, destino_dir)
+    return destino
+
+
+def finish_file(file_path, copias, concluido):
+    """
+    Encerra um arquivo depois das cópias adiadas
+
+    Com todas as cópias feitas ou enfileiradas (concluido=True), registra o
+    arquivo como processado, remove o journal e marca o lease como concluído.
+    Senão, só libera o lease: o journal fica e a próxima tentativa refaz
+    apenas as cópias que faltaram.
+    """
+    if concluido:
+        copias.complete()
+    if multi_node_enabled():
+        get_lease_manager(os.path.dirname(file_path)).release(os.path.basename(file_path), done=concluido)
+
+
+class AsyncCnabDaemon:
+    """
+    Orquestrador assíncrono do monitoramento de diretórios.
+
+    Cada diretório tem sua própria tarefa de varredura (com executor dedicado,
+    para que um compartilhamento lento não bloqueie o diretório local). Os
+    arquivos encontrados vão para o agendador do diretório (cnab_scheduler.py)
+    e cada worker de processamento livre retira o de maior prioridade naquele
+    momento, entre todos os diretórios (promovidos por idade, peso do banco,
+    política e orçamento de arquivos em massa). As cópias para os diretórios
+    remotos seguem por uma fila limitada, atendida por workers de I/O. Um
+    arquivo só é registrado como processado depois da sua última cópia.
+
+    A classificação e a gravação das saídas rodam em processos separados
+    (ProcessPoolExecutor): com threads, o GIL deixaria um arquivo por vez
+    na etapa de CPU. Leases, agendadores, cópias e o controlador ficam no
+    processo principal.
+
+    Com CONCORRENCIA_ADAPTATIVA=true, quantos workers de cada tipo ficam
+    ativos é decidido a cada ``tune_interval`` segundos pelo controlador
+    (cnab_concurrency.py), dentro dos limites configurados; os demais
+    aguardam sem retirar itens do agendador ou da fila de cópias.
+    """
+
+    def __init__(self, local_dir, network_dir=None, check_interval=30, process_workers=2,
+                 copy_workers=4, queue_size=100, io_timeout=30.0, tune_interval=30.0):
+        self.local_dir = local_dir
+        self.network_dir = network_dir
+        self.check_interval = check_interval
+        self.process_workers = process_workers
+        self.copy_workers = copy_workers
+        self.queue_size = queue_size
+        self.io_timeout = io_timeout
+        self.tune_interval = tune_interval
+
+        self.agendadores = {}
+        self.novos_pendentes = None
+        self.fila_copias = None
+        self.parar = None
+        self.em_andamento = set()
+        self.copias_abertas = {}  # arquivo -> [cópias em aberto, todas bem-sucedidas]
+
+        # Workers e executores dimensionados pelo limite máximo; o controlador define quantos ficam ativos
+        self.controlador = start_concurrency_controller(process_workers, copy_workers)
+        if self.controlador:
+            self.process_workers = self.controlador.niveis[ETAPA_CPU].maximo
+            self.copy_workers = self.controlador.niveis[ETAPA_IO].maximo
+
+        # spawn: os processos não herdam travas nem threads (logs, compartilhamento, leases) deste processo
+        contexto = multiprocessing.get_context('spawn')
+        self.fila_log = contexto.Queue()
+        self.executor_processamento = ProcessPoolExecutor(self.process_workers, mp_context=contexto,
+                                                          initializer=init_process_worker, initargs=(self.fila_log,))
+        self.executor_copias = ThreadPoolExecutor(self.copy_workers, thread_name_prefix='cnab-copia')
+        self.executores_varredura = {}
+
+    def _scan_executor(self, directory):
+        if directory not in self.executores_varredura:
+            self.executores_varredura[directory] = ThreadPoolExecutor(1, thread_name_prefix='cnab-scan')
+        return self.executores_varredura[directory]
+
+    async def _run_io(self, executor, func, *args):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), self.io_timeout)
+
+    async def _wait_interval(self):
+        try:
+            await asyncio.wait_for(self.parar.wait(), self.check_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def scan_directory(self, directory, descricao):
+        """Tarefa de varredura de um diretório"""
+        executor = self._scan_executor(directory)
+        while not self.parar.is_set():
+            try:
+                if network_fs.guard_for(directory):
+                    await self._run_io(executor, network_fs.flush_pending)
+                existe = await self._run_io(executor, network_fs.path_exists, directory)
+                if not existe:
+                    logger.warning(f"\nDiretório {descricao} não encontrado: {directory}")
+                else:
+                    pendentes = await self._run_io(executor, list_pending_files, directory)
+                    agendador = self.agendadores[directory]
+                    agendador.new_cycle()
+                    novos = [file_path for file_path in pendentes
+                             if file_path not in self.em_andamento and file_path not in agendador]
+                    if novos:
+                        # stat e banco no executor; a fila só é alterada aqui, no event loop
+                        agendador.add_items(await self._run_io(executor, agendador.describe, novos))
+                    if len(agendador):
+                        self.novos_pendentes.set()
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Diretório {descricao} não respondeu em {self.io_timeout:.0f}s: {directory}")
+            except Exception as e:
+                logger.error(f"Erro ao verificar diretório {directory}: {str(e)}")
+            await self._wait_interval()
+
+    async def _wait_level(self, etapa, indice, ate_parar=False):
+        """
+        Aguarda enquanto o worker ``indice`` estiver acima do nível de paralelismo da etapa
+
+        Com ``ate_parar``, a espera também termina quando a parada é solicitada.
+        """
+        while self.controlador and indice >= self.controlador.level(etapa):
+            if ate_parar and self.parar.is_set():
+                return
+            await asyncio.sleep(ESPERA_NIVEL)
+
+    def pending_count(self):
+        """Arquivos aguardando processamento em todos os agendadores"""
+        return sum(len(agendador) for agendador in self.agendadores.values())
+
+    async def _next_file(self):
+        """
+        Retira o arquivo de maior prioridade entre todos os agendadores
+
+        Returns:
+            tuple: (PendingFile, FileScheduler), ou (None, None) se a parada foi solicitada
+        """
+        while not self.parar.is_set():
+            melhor = None
+            for agendador in self.agendadores.values():
+                chave, item = agendador.best()
+                if item is not None and (melhor is None or chave < melhor[0]):
+                    melhor = (chave, item, agendador)
+            if melhor is not None:
+                _, item, agendador = melhor
+                agendador.take(item)
+                return item, agendador
+            self.novos_pendentes.clear()
+            await self.novos_pendentes.wait()
+        return None, None
+
+    async def tune_concurrency(self):
+        """Tarefa de ajuste periódico do paralelismo (CONCORRENCIA_ADAPTATIVA=true)"""
+        while not self.parar.is_set():
+            try:
+                await asyncio.wait_for(self.parar.wait(), self.tune_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.controlador.adjust(self.pending_count(), self.fila_copias.qsize())
+
+    async def _finish_file(self, file_path, copias, concluido):
+        """Conclui o arquivo fora do event loop e o libera para novas varreduras"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor_copias, finish_file, file_path, copias, concluido)
+        finally:
+            self.em_andamento.discard(file_path)
+            if not concluido:
+                get_scanner(os.path.dirname(file_path)).forget(os.path.basename(file_path))
+
+    async def process_worker(self, indice=0):
+        """Worker de processamento: executa o filtro fora do event loop"""
+        loop = asyncio.get_running_loop()
+        while not self.parar.is_set():
+            await self._wait_level(ETAPA_CPU, indice, ate_parar=True)
+            # Arquivos ainda não iniciados quando a parada é solicitada ficam para a próxima execução
+            item, agendador = await self._next_file()
+            if item is None:
+                break
+            file_path = item.path
+            filename = os.path.basename(file_path)
+            self.em_andamento.add(file_path)
+            try:
+                leases = get_lease_manager(os.path.dirname(file_path)) if multi_node_enabled() else None
+                if leases and not await loop.run_in_executor(None, leases.claim, filename):
+                    logger.info(f"Arquivo {filename} em processamento ou já processado por outro nó. Pulando...")
+                    get_scanner(os.path.dirname(file_path)).forget(filename)
+                    continue
+                sucesso = False
+                inicio = time.perf_counter()
+                try:
+                    # O arquivamento (retenção) aguarda enquanto há arquivos nos processos de processamento
+                    with live_processing():
+                        sucesso, copias = await loop.run_in_executor(
+                            self.executor_processamento, process_one_file, file_path, [self.local_dir],
+                            item.tempo_fila, self.controlador.report_lines() if self.controlador else None)
+                finally:
+                    segundos = time.perf_counter() - inicio
+                    # Orçamento de arquivos em massa do ciclo atual
+                    agendador.charge(item, segundos)
+                    if sucesso:
+                        record_stage(ETAPA_CPU, segundos, item.tamanho)
+                    elif leases:
+                        leases.release(filename)
+                if sucesso:
+                    logger.info(f"\nArquivo {os.path.basename(file_path)} processado com sucesso!")
+                    pendentes = copias.pending_for(self.network_dir) if self.network_dir else []
+                    if pendentes:
+                        # O arquivo só é concluído pelo copy_worker da última cópia
+                        self.copias_abertas[file_path] = [len(pendentes), True]
+                        for origem in pendentes:
+                            await self.fila_copias.put((file_path, copias, origem, self.network_dir))
+                        continue
+                    await self._finish_file(file_path, copias, True)
+                else:
+                    logger.error(f"\nErro ao processar o arquivo {os.path.basename(file_path)}")
+                    get_scanner(os.path.dirname(file_path)).forget(os.path.basename(file_path))
+            except FileNotFoundError:
+                logger.info(f"Arquivo {os.path.basename(file_path)} removido ou movido antes do processamento. Pulando...")
+                get_scanner(os.path.dirname(file_path)).forget(os.path.basename(file_path))
+            except Exception as e:
+                logger.error(f"❌ Erro ao processar {file_path}: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                if file_path not in self.copias_abertas:
+                    self.em_andamento.discard(file_path)
+
+    async def copy_worker(self, indice=0):
+        """Worker de cópias para os diretórios remotos; a última cópia de um arquivo o conclui"""
+        while True:
+            await self._wait_level(ETAPA_IO, indice)
+            file_path, copias, origem, destino_dir = await self.fila_copias.get()
+            ok = False
+            try:
+                if os.path.dirname(origem) != destino_dir:
+                    inicio = time.perf_counter()
+                    destino = await self._run_io(self.executor_copias, copy_deferred, copias, origem, destino_dir)
+                    if destino:
+                        record_stage(ETAPA_IO, time.perf_counter() - inicio, os.path.getsize(origem))
+                        logger.info(f"💾 Arquivo copiado: {destino}")
+                    else:
+                        record_stage(ETAPA_IO, time.perf_counter() - inicio, falha=True)
+                ok = True
+            except asyncio.TimeoutError:
+                record_stage(ETAPA_IO, self.io_timeout, falha=True)
+                logger.warning(f"⚠️ Cópia de {os.path.basename(origem)} para {destino_dir} excedeu {self.io_timeout:.0f}s")
+            except Exception as e:
+                logger.error(f"❌ Erro ao copiar {os.path.basename(origem)} para {destino_dir}: {str(e)}")
+            try:
+                abertas = self.copias_abertas[file_path]
+                abertas[0] -= 1
+                abertas[1] = abertas[1] and ok
+                if abertas[0] == 0:
+                    del self.copias_abertas[file_path]
+                    await self._finish_file(file_path, copias, abertas[1])
+            except Exception as e:
+                logger.error(f"❌ Erro ao concluir {os.path.basename(file_path)}: {str(e)}")
+            finally:
+                self.fila_copias.task_done()
+
+    def request_stop(self):
+        if not self.parar.is_set():
+            logger.info("\nInterrupção solicitada. Finalizando arquivos em andamento...")
+            self.parar.set()
+            self.novos_pendentes.set()
+
+    async def run(self):
+        self.fila_copias = asyncio.Queue(self.queue_size)
+        self.parar = asyncio.Event()
+        self.novos_pendentes = asyncio.Event()
+        self.encaminhador_log = forward_worker_logs(self.fila_log)
+        for directory in filter(None, (self.local_dir, self.network_dir)):
+            self.agendadores[directory] = get_scheduler(
+                directory, bank_of=lambda path: identify_bank(read_first_line(path)))
+
+        loop = asyncio.get_running_loop()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sinal, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C cancela a tarefa principal (tratado abaixo)
+                pass
+
+        varreduras = [asyncio.create_task(self.scan_directory(self.local_dir, 'local'))]
+        if self.network_dir:
+            varreduras.append(asyncio.create_task(self.scan_directory(self.network_dir, 'de rede')))
+        processamento = [asyncio.create_task(self.process_worker(indice)) for indice in range(self.process_workers)]
+        copias = [asyncio.create_task(self.copy_worker(indice)) for indice in range(self.copy_workers)]
+        if self.controlador:
+            varreduras.append(asyncio.create_task(self.tune_concurrency()))
+        # Arquivamento das saídas e backups antigos em segundo plano (RETENCAO_DIAS)
+        retencao = start_retention_worker(is_file_processed)
+
+        try:
+            await self.parar.wait()
+        except asyncio.CancelledError:
+            self.request_stop()
+        finally:
+            # Encerra as varreduras, aguarda os arquivos em andamento e drena as cópias
+            for tarefa in varreduras:
+                tarefa.cancel()
+            await asyncio.gather(*varreduras, return_exceptions=True)
+            await asyncio.gather(*processamento, return_exceptions=True)
+            await self.fila_copias.join()
+            for tarefa in copias:
+                tarefa.cancel()
+            await asyncio.gather(*copias, return_exceptions=True)
+
+            if retencao:
+                retencao.stop()
+            self.executor_processamento.shutdown(wait=True)
+            self.encaminhador_log.stop()
+            self.executor_copias.shutdown(wait=False)
+            for executor in self.executores_varredura.values():
+                executor.shutdown(wait=False)
+            logger.info("Processamento interrompido pelo usuário.")
+
+
+def main():
+    check_interval = int(os.getenv('CHECK_INTERVAL', '30'))
+    local_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.getenv('LOCAL_CNAB_DIR', 'cnab'))
+    network_dir = os.getenv('NETWORK_CNAB_DIR')
+
+    daemon = AsyncCnabDaemon(
+        local_dir,
+        network_dir,
+        check_interval=check_interval,
+        process_workers=int(os.getenv('ASYNC_PROCESS_WORKERS', '2')),
+        copy_workers=int(os.getenv('ASYNC_COPY_WORKERS', '4')),
+        queue_size=int(os.getenv('ASYNC_QUEUE_SIZE', '100')),
+        io_timeout=float(os.getenv('ASYNC_IO_TIMEOUT', '30')),
+        tune_interval=float(os.getenv('CONCORRENCIA_INTERVALO', '30')),
+    )
+
+    logger.info(f"Monitorando diretórios (modo assíncrono) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"Local: {local_dir}")
+    logger.info(f"Rede: {network_dir}")
+    logger.info(f"Intervalo de verificação: {check_interval} segundos")
+    if daemon.controlador:
+        logger.info(f"Paralelismo adaptativo: até {daemon.process_workers} arquivo(s) e "
+              f"{daemon.copy_workers} cópia(s) simultâneos")
+
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
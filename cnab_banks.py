@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+
+from cnab_core import detect_layout, LAYOUT_CNAB240, LAYOUT_CNAB400
+from cnab_compression import open_cnab_input, is_cnab_name
+
+# Bytes lidos do início do arquivo para a identificação (cobre o primeiro registro CNAB400 + quebra de linha)
+TAMANHO_LEITURA_PRIMEIRO_REGISTRO = 512
+
+# Onde ficam o código e o nome do banco no header de arquivo de cada layout: (início, fim)
+CAMPOS_BANCO_HEADER = {
+    LAYOUT_CNAB400: {'codigo': (76, 79), 'nome': (79, 94)},
+    LAYOUT_CNAB240: {'codigo': (0, 3), 'nome': (102, 132)},
+}
+
+
+class BankSignature:
+    """
+    Assinatura de um banco: código de compensação (FEBRABAN), chave usada
+    nas configurações (<BANCO>_OPERACAO etc.) e nome gravado no header.
+    """
+
+    __slots__ = ('banco', 'codigo', 'nome', 'descricao')
+
+    def __init__(self, banco, codigo, nome, descricao):
+        self.banco = banco
+        self.codigo = codigo
+        self.nome = nome
+        self.descricao = descricao
+
+
+class BankDetection:
+    """Resultado da identificação: banco (ou None), código lido do header e layout do arquivo"""
+
+    __slots__ = ('banco', 'codigo', 'layout')
+
+    def __init__(self, banco, codigo, layout):
+        self.banco = banco
+        self.codigo = codigo
+        self.layout = layout
+
+    def __repr__(self):
+        return f"BankDetection(banco={self.banco!r}, codigo={self.codigo!r}, layout={self.layout!r})"
+
+
+# Tabela de assinaturas (a ordem define a ordem das configurações por banco)
+ASSINATURAS_BANCOS = (
+    BankSignature('BB', '001', 'BANCO DO BRASIL', 'Banco do Brasil'),
+    BankSignature('BRADESCO', '237', 'BRADESCO', 'Bradesco'),
+    BankSignature('ITAU', '341', 'ITAU', 'Itaú'),
+    BankSignature('SANTANDER', '033', 'SANTANDER', 'Santander'),
+    BankSignature('CAIXA', '104', 'CAIXA', 'Caixa Econômica Federal'),
+    BankSignature('SICREDI', '748', 'SICREDI', 'Sicredi'),
+    BankSignature('SICOOB', '756', 'SICOOB', 'Sicoob'),
+)
+
+_POR_CODIGO = {assinatura.codigo: assinatura for assinatura in ASSINATURAS_BANCOS}
+_POR_BANCO = {assinatura.banco: assinatura for assinatura in ASSINATURAS_BANCOS}
+
+
+def bank_signature(banco):
+    """Retorna a BankSignature do banco (chave de configuração) ou None"""
+    return _POR_BANCO.get(banco)
+
+
+def detect_bank(primeiro_registro):
+    """
+    Identifica banco e layout a partir do primeiro registro do arquivo
+
+    O código de compensação é lido na posição do layout (CNAB400: 77-79;
+    CNAB240: 1-3) e procurado na tabela de assinaturas. Se o código não for
+    conhecido, o nome do banco é procurado apenas no campo de nome do header.
+    Nada é impresso.
+
+    Args:
+        primeiro_registro (str): Primeira linha do arquivo
+
+    Returns:
+        BankDetection: banco None quando não identificado (ou registro vazio/curto)
+    """
+    linha = (primeiro_registro or '').rstrip('\r\n')
+    layout = detect_layout(linha)
+    campos = CAMPOS_BANCO_HEADER[layout]
+    inicio, fim = campos['codigo']
+    if len(linha) < fim:
+        return BankDetection(None, None, layout)
+
+    codigo = linha[inicio:fim]
+    assinatura = _POR_CODIGO.get(codigo)
+    if assinatura is None:
+        inicio, fim = campos['nome']
+        nome = linha[inicio:fim].upper()
+        assinatura = next((a for a in ASSINATURAS_BANCOS if a.nome in nome), None)
+    return BankDetection(assinatura.banco if assinatura else None, codigo, layout)
+
+
+def read_first_record(caminho):
+    """
+    Lê apenas o primeiro registro de um arquivo (no máximo TAMANHO_LEITURA_PRIMEIRO_REGISTRO bytes)
+
+    Arquivos compactados (.gz, .zip, .zst) são lidos já descompactados, só
+    até o primeiro bloco. Decodifica em UTF-8 com alternativa Latin-1.
+    Retorna "" em caso de erro.
+    """
+    try:
+        with open_cnab_input(caminho) as f:
+            bloco = f.read(TAMANHO_LEITURA_PRIMEIRO_REGISTRO)
+    except Exception:
+        return ""
+    registro = bloco.split(b'\n', 1)[0]
+    try:
+        return registro.decode('utf-8')
+    except UnicodeDecodeError:
+        return registro.decode('latin-1')
+
+
+def detect_file_bank(caminho):
+    """Identifica banco e layout de um arquivo lendo só o primeiro registro"""
+    return detect_bank(read_first_record(caminho))
+
+
+def benchmark(diretorio, repeticoes=5):
+    """
+    Mede a identificação sobre um corpus de arquivos .RET
+
+    Cada arquivo é identificado ``repeticoes`` vezes (leitura do primeiro
+    registro + consulta à tabela) e o melhor tempo é usado.
+
+    Returns:
+        dict: arquivos, tempo médio por arquivo (µs), contagem por (banco, layout)
+    """
+    arquivos = sorted(
+        os.path.join(raiz, nome)
+        for raiz, _, nomes in os.walk(diretorio)
+        for nome in nomes if is_cnab_name(nome)
+    )
+    contagem = {}
+    for caminho in arquivos:
+        deteccao = detect_file_bank(caminho)
+        chave = (deteccao.banco or 'NÃO IDENTIFICADO', deteccao.layout)
+        contagem[chave] = contagem.get(chave, 0) + 1
+
+    melhor = None
+    for _ in range(max(1, repeticoes)):
+        inicio = time.perf_counter()
+        for caminho in arquivos:
+            detect_file_bank(caminho)
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+
+    return {
+        'arquivos': len(arquivos),
+        'microssegundos_por_arquivo': (melhor / len(arquivos) * 1e6) if arquivos else 0.0,
+        'contagem': contagem,
+    }
+
+
+def main():
+    diretorio = sys.argv[1] if len(sys.argv) > 1 else os.getenv('LOCAL_CNAB_DIR', 'cnab')
+    resultado = benchmark(diretorio)
+    print(f"📂 Corpus: {diretorio} ({resultado['arquivos']} arquivos .RET)")
+    print(f"⏱️ Identificação: {resultado['microssegundos_por_arquivo']:.1f} µs por arquivo (melhor de 5 passadas)")
+    for (banco, layout), quantidade in sorted(resultado['contagem'].items()):
+        print(f"  • {banco} ({layout}): {quantidade}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import gzip
+import zlib
+import shutil
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # .zst exige o pacote zstandard (pip install zstandard)
+
+from cnab_logging import get_logger
+
+# Formatos de compressão por extensão do arquivo
+CODEC_GZIP = 'gzip'
+CODEC_ZIP = 'zip'
+CODEC_ZSTD = 'zstd'
+EXTENSOES_CODEC = {'.gz': CODEC_GZIP, '.zip': CODEC_ZIP, '.zst': CODEC_ZSTD}
+EXTENSAO_POR_CODEC = {codec: extensao for extensao, codec in EXTENSOES_CODEC.items()}
+
+# Content-Encoding aceito no corpo das requisições do serviço HTTP
+CODEC_POR_CONTENT_ENCODING = {'gzip': CODEC_GZIP, 'x-gzip': CODEC_GZIP, 'zstd': CODEC_ZSTD}
+
+# Extensão assumida para o .RET de um .zip sem membro .ret
+EXTENSAO_CNAB_PADRAO = '.RET'
+
+# Bloco das cópias com compressão/descompressão em streaming
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def codec_available(codec):
+    """Indica se o codec pode ser usado neste ambiente (zstd depende do pacote zstandard)"""
+    return codec in (CODEC_GZIP, CODEC_ZIP) or (codec == CODEC_ZSTD and zstandard is not None)
+
+
+def compression_of(nome):
+    """Codec indicado pela extensão do nome (ex: 'X.RET.gz' -> 'gzip'), ou None"""
+    return EXTENSOES_CODEC.get(os.path.splitext(nome)[1].lower())
+
+
+def is_cnab_name(nome):
+    """
+    Indica se o nome é de um arquivo .RET, puro ou compactado
+
+    Aceita X.RET, X.RET.gz, X.RET.zst (com o pacote zstandard) e X.zip.
+    """
+    codec = compression_of(nome)
+    if codec is None:
+        return nome.lower().endswith('.ret')
+    if not codec_available(codec):
+        return False
+    return codec == CODEC_ZIP or os.path.splitext(nome)[0].lower().endswith('.ret')
+
+
+def _zip_member(arquivo_zip):
+    """Primeiro membro .ret do zip (ou o primeiro arquivo, se nenhum tiver a extensão)"""
+    membros = [info for info in arquivo_zip.infolist() if not info.is_dir()]
+    if not membros:
+        raise ValueError("arquivo .zip vazio")
+    return next((info for info in membros if info.filename.lower().endswith('.ret')), membros[0])
+
+
+def cnab_name(caminho):
+    """
+    Nome lógico do .RET de um arquivo, sem a extensão de compressão
+
+    'X.RET.gz' -> 'X.RET'; 'X.zip' -> nome do membro .ret (sem diretórios) ou 'X.RET'.
+    Usado nos nomes das saídas, do relatório e do arquivo de rejeitados.
+    """
+    nome = os.path.basename(caminho)
+    codec = compression_of(nome)
+    if codec is None:
+        return nome
+    base = os.path.splitext(nome)[0]
+    if codec != CODEC_ZIP:
+        return base
+    try:
+        with zipfile.ZipFile(caminho) as arquivo_zip:
+            extensao = os.path.splitext(_zip_member(arquivo_zip).filename)[1]
+    except (OSError, ValueError, zipfile.BadZipFile):
+        extensao = ''
+    return base + (extensao or EXTENSAO_CNAB_PADRAO)
+
+
+class _ZipInput:
+    """Stream do membro .ret de um zip; fecha o membro e o zip juntos"""
+
+    def __init__(self, caminho):
+        self._zip = zipfile.ZipFile(caminho)
+        try:
+            self._membro = self._zip.open(_zip_member(self._zip))
+        except Exception:
+            self._zip.close()
+            raise
+
+    def read(self, tamanho=-1):
+        return self._membro.read(tamanho)
+
+    def close(self):
+        self._membro.close()
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_cnab_input(caminho):
+    """
+    Abre um .RET para leitura binária, descompactando em streaming conforme a extensão
+
+    Nada é extraído para disco: quem lê recebe os bytes já descompactados
+    (read() ou read(n)), como de um arquivo comum.
+
+    Returns:
+        objeto com read()/close(), utilizável em ``with``
+    """
+    codec = compression_of(caminho)
+    if codec == CODEC_GZIP:
+        return gzip.open(caminho, 'rb')
+    if codec == CODEC_ZIP:
+        return _ZipInput(caminho)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("arquivo .zst requer o pacote zstandard (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(caminho, 'rb'), closefd=True)
+    return open(caminho, 'rb')
+
+
+def iter_decompressed_blocks(blocos, codec):
+    """
+    Descompacta em streaming uma sequência de blocos de bytes (gzip, inclusive
+    com vários membros, ou zstd)
+
+    Yields:
+        bytes: Blocos descompactados
+    """
+    if codec == CODEC_GZIP:
+        descompactador = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        membro_aberto = False
+        for bloco in blocos:
+            while bloco:
+                membro_aberto = True
+                dados = descompactador.decompress(bloco)
+                if dados:
+                    yield dados
+                if not descompactador.eof:
+                    break
+                # Fim de um membro: o restante do bloco começa o próximo
+                bloco = descompactador.unused_data
+                descompactador = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                membro_aberto = False
+        if membro_aberto:
+            raise ValueError("conteúdo gzip truncado")
+    elif codec == CODEC_ZSTD and zstandard is not None:
+        descompactador = zstandard.ZstdDecompressor().decompressobj()
+        for bloco in blocos:
+            dados = descompactador.decompress(bloco)
+            if dados:
+                yield dados
+    else:
+        raise ValueError(f"Compressão não suportada: {codec!r}")
+
+
+def uncompressed_size(caminho):
+    """
+    Tamanho do conteúdo descompactado, sem descompactar
+
+    gzip: campo ISIZE do final do arquivo (módulo 4 GB); zip: tamanho do
+    membro; zstd: tamanho do frame, quando informado. Se não for possível
+    saber, retorna o tamanho do arquivo em disco.
+    """
+    tamanho = os.path.getsize(caminho)
+    codec = compression_of(caminho)
+    try:
+        if codec == CODEC_GZIP and tamanho >= 4:
+            with open(caminho, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                return int.from_bytes(f.read(4), 'little')
+        if codec == CODEC_ZIP:
+            with zipfile.ZipFile(caminho) as arquivo_zip:
+                return _zip_member(arquivo_zip).file_size
+        if codec == CODEC_ZSTD and zstandard is not None:
+            with open(caminho, 'rb') as f:
+                informado = zstandard.frame_content_size(f.read(18))
+            if informado > 0:
+                return informado
+    except (OSError, ValueError, zipfile.BadZipFile, getattr(zstandard, 'ZstdError', ValueError)):
+        pass
+    return tamanho
+
+
+def compress_file(origem, destino, codec):
+    """
+    Grava ``origem`` compactada em ``destino``, em streaming e de forma atômica
+
+    Para 'zip', o arquivo ganha um único membro com o nome de ``origem``.
+
+    Returns:
+        str: Caminho de destino
+    """
+    temporario = f"{destino}.tmp"
+    with open(origem, 'rb') as entrada:
+        if codec == CODEC_GZIP:
+            with gzip.open(temporario, 'wb', compresslevel=6) as saida:
+                shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        elif codec == CODEC_ZIP:
+            with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+                with arquivo_zip.open(os.path.basename(origem), 'w', force_zip64=True) as saida:
+                    shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        elif codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("compressão zstd requer o pacote zstandard (pip install zstandard)")
+            with open(temporario, 'wb') as saida:
+                zstandard.ZstdCompressor().copy_stream(entrada, saida, read_size=TAMANHO_BLOCO)
+        else:
+            raise ValueError(f"Compressão desconhecida: {codec!r} (use gzip, zip ou zstd)")
+    os.replace(temporario, destino)
+    return destino
+
+
+def output_codec(variavel):
+    """
+    Codec configurado em uma variável de ambiente (COMPACTAR_BACKUP, COMPACTAR_COPIAS)
+
+    Vazio ou 'false' desativa; codecs indisponíveis também (com aviso).
+    """
+    codec = os.getenv(variavel, '').strip().lower()
+    if codec in ('', 'false', 'none'):
+        return None
+    if codec not in EXTENSAO_POR_CODEC:
+        get_logger('compressao').warning(
+            f"⚠️ {variavel}={codec} desconhecido (use gzip, zip ou zstd); gravando sem compressão")
+        return None
+    if not codec_available(codec):
+        get_logger('compressao').warning(
+            f"⚠️ {variavel}={codec} requer o pacote zstandard; gravando sem compressão")
+        return None
+    return codec
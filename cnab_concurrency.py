@@ -0,0 +1,270 @@
+import os
+import time
+import threading
+
+from cnab_logging import get_logger
+from cnab_profiling import record_metrics
+
+# Etapas observadas: classificação/gravação das saídas (CPU) e cópias para o compartilhamento (I/O)
+ETAPA_CPU = 'cpu'
+ETAPA_IO = 'io'
+
+# Variação de vazão (fração) abaixo da qual o nível de CPU é mantido
+LIMIAR_VAZAO = 0.05
+
+# Latência de cópia até TOLERANCIA_LATENCIA x a latência base é considerada normal, assim
+# como qualquer latência abaixo de LATENCIA_MINIMA_IO (segundos; ruído de cópias rápidas)
+TOLERANCIA_LATENCIA = 1.5
+LATENCIA_MINIMA_IO = 0.05
+
+# Arquivos concluídos no período para que a vazão de CPU seja considerada
+AMOSTRAS_MINIMAS_CPU = 2
+
+# Maior redução do nível de I/O em um ajuste (metade) e quanto a base acompanha a latência atual
+REDUCAO_MAXIMA_IO = 0.5
+ESQUECIMENTO_BASE = 0.05
+
+_controller = None
+
+# Linhas de paralelismo recebidas do processo principal (processos de processamento do daemon)
+_report_snapshot = None
+
+
+class StageStats:
+    """Amostras de uma etapa acumuladas desde o último ajuste (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.latencia_media = None  # média móvel exponencial da latência (segundos por operação)
+
+    def _reset(self):
+        self.amostras = 0
+        self.segundos = 0.0
+        self.bytes = 0
+        self.falhas = 0
+        self.inicio = time.monotonic()
+
+    def record(self, segundos, bytes_processados=0, falha=False):
+        with self._lock:
+            if falha:
+                self.falhas += 1
+                return
+            self.amostras += 1
+            self.segundos += segundos
+            self.bytes += bytes_processados
+            self.latencia_media = (segundos if self.latencia_media is None
+                                   else self.latencia_media * 0.8 + segundos * 0.2)
+
+    def take(self):
+        """
+        Encerra o período atual
+
+        Returns:
+            dict: amostras, falhas, latencia (média do período), vazao (bytes/s no período)
+        """
+        with self._lock:
+            periodo = max(time.monotonic() - self.inicio, 1e-6)
+            dados = {
+                'amostras': self.amostras,
+                'falhas': self.falhas,
+                'latencia': self.segundos / self.amostras if self.amostras else None,
+                'vazao': self.bytes / periodo,
+            }
+            self._reset()
+        return dados
+
+
+class AdaptiveLevel:
+    """Nível de paralelismo de um recurso, sempre entre ``minimo`` e ``maximo``"""
+
+    def __init__(self, minimo, maximo, inicial=None):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.nivel = self.clamp(inicial if inicial is not None else self.minimo)
+
+    def clamp(self, nivel):
+        return max(self.minimo, min(self.maximo, int(nivel)))
+
+    def set(self, nivel):
+        anterior, self.nivel = self.nivel, self.clamp(nivel)
+        return self.nivel != anterior
+
+
+class ConcurrencyController:
+    """
+    Ajuste do paralelismo a partir da latência e da vazão observadas
+
+    CPU (arquivos processados ao mesmo tempo): subida de encosta pela vazão
+    em bytes/s do período. Enquanto a vazão melhora, o nível continua na
+    mesma direção; se piora, o nível volta um passo e fica ali. Parado, uma
+    variação maior que LIMIAR_VAZAO indica condições diferentes (carga da
+    máquina, arquivos maiores) e a busca recomeça: para baixo se a vazão
+    caiu, para cima se subiu. Sem fila acumulada a vazão é limitada pela
+    demanda e o nível não muda.
+
+    I/O (cópias simultâneas para o compartilhamento): gradiente de latência.
+    Com a latência média das cópias até TOLERANCIA_LATENCIA x a base (a
+    menor latência observada, que acompanha lentamente a atual), o nível
+    sobe um; acima disso, é multiplicado por base/latência (no máximo pela
+    metade). Falhas do compartilhamento levam o nível ao mínimo.
+    """
+
+    def __init__(self, cpu, io):
+        self.niveis = {ETAPA_CPU: cpu, ETAPA_IO: io}
+        self.etapas = {ETAPA_CPU: StageStats(), ETAPA_IO: StageStats()}
+        self._direcao_cpu = 1
+        self._vazao_cpu = None
+        self._voltou_cpu = False
+        self._moveu_cpu = False
+        self._latencia_base = None
+
+    def level(self, etapa):
+        return self.niveis[etapa].nivel
+
+    def record(self, etapa, segundos, bytes_processados=0, falha=False):
+        self.etapas[etapa].record(segundos, bytes_processados, falha)
+
+    def _adjust_cpu(self, dados, fila):
+        nivel = self.niveis[ETAPA_CPU]
+        if dados['amostras'] < AMOSTRAS_MINIMAS_CPU or fila == 0:
+            return False
+        vazao = dados['vazao']
+        if self._voltou_cpu:
+            # Primeiro período de volta ao melhor nível: só mede a nova referência
+            self._voltou_cpu = False
+            self._moveu_cpu = False
+            self._vazao_cpu = vazao
+            return False
+        if self._vazao_cpu:
+            ganho = vazao / self._vazao_cpu - 1
+            if abs(ganho) < LIMIAR_VAZAO:
+                self._vazao_cpu = vazao
+                self._moveu_cpu = False
+                return False
+            if not self._moveu_cpu:
+                # Nível parado e vazão diferente: as condições mudaram, recomeça a busca
+                self._direcao_cpu = 1 if ganho > 0 else -1
+            elif ganho < 0:
+                self._direcao_cpu = -self._direcao_cpu
+                self._voltou_cpu = True
+        self._vazao_cpu = vazao
+        if nivel.nivel + self._direcao_cpu not in range(nivel.minimo, nivel.maximo + 1):
+            self._direcao_cpu = -self._direcao_cpu
+        self._moveu_cpu = nivel.set(nivel.nivel + self._direcao_cpu)
+        return self._moveu_cpu
+
+    def _adjust_io(self, dados, fila):
+        nivel = self.niveis[ETAPA_IO]
+        if dados['falhas']:
+            return nivel.set(nivel.minimo)
+        latencia = dados['latencia']
+        if latencia is None:
+            return False
+        if self._latencia_base is None or latencia < self._latencia_base:
+            self._latencia_base = latencia
+        else:
+            self._latencia_base += (latencia - self._latencia_base) * ESQUECIMENTO_BASE
+        limite = max(self._latencia_base * TOLERANCIA_LATENCIA, LATENCIA_MINIMA_IO)
+        if latencia <= limite:
+            return nivel.set(nivel.nivel + 1) if fila else False
+        gradiente = max(REDUCAO_MAXIMA_IO, limite / latencia)
+        return nivel.set(nivel.nivel * gradiente)
+
+    def adjust(self, fila_cpu=0, fila_io=0):
+        """
+        Fecha o período de amostras e ajusta os dois níveis
+
+        Args:
+            fila_cpu (int): Arquivos aguardando processamento
+            fila_io (int): Cópias aguardando o compartilhamento
+
+        Returns:
+            dict: Níveis, amostras, vazão e latências do período (também gravado nas métricas)
+        """
+        cpu = self.etapas[ETAPA_CPU].take()
+        io = self.etapas[ETAPA_IO].take()
+        mudou_cpu = self._adjust_cpu(cpu, fila_cpu)
+        mudou_io = self._adjust_io(io, fila_io)
+        dados = {
+            'nivel_cpu': self.level(ETAPA_CPU),
+            'nivel_io': self.level(ETAPA_IO),
+            'arquivos': cpu['amostras'],
+            'vazao_cpu_mb_s': round(cpu['vazao'] / (1024 * 1024), 3),
+            'latencia_cpu_s': round(cpu['latencia'], 3) if cpu['latencia'] is not None else None,
+            'copias': io['amostras'],
+            'falhas_io': io['falhas'],
+            'latencia_io_s': round(io['latencia'], 3) if io['latencia'] is not None else None,
+            'latencia_base_io_s': round(self._latencia_base, 3) if self._latencia_base is not None else None,
+            'fila_cpu': fila_cpu,
+            'fila_io': fila_io,
+        }
+        if cpu['amostras'] or io['amostras'] or io['falhas']:
+            record_metrics('concorrencia', dados)
+        if mudou_cpu or mudou_io:
+            get_logger('concorrencia').info(
+                f"⚙️ Paralelismo ajustado: CPU {dados['nivel_cpu']}, cópias {dados['nivel_io']} "
+                f"(vazão {dados['vazao_cpu_mb_s']:.2f} MB/s, {dados['copias']} cópia(s), "
+                f"{dados['falhas_io']} falha(s), latência das cópias {dados['latencia_io_s'] or 0:.2f}s)")
+        return dados
+
+    def report_lines(self):
+        """Linhas da seção de paralelismo do relatório"""
+        cpu, io = self.niveis[ETAPA_CPU], self.niveis[ETAPA_IO]
+        latencia_cpu = self.etapas[ETAPA_CPU].latencia_media
+        latencia_io = self.etapas[ETAPA_IO].latencia_media
+        return [f"  • Arquivos simultâneos (CPU): {cpu.nivel} (limites {cpu.minimo}-{cpu.maximo})"
+                  + (f"; latência média {latencia_cpu:.2f}s" if latencia_cpu is not None else ""),
+                  f"  • Cópias simultâneas (compartilhamento): {io.nivel} (limites {io.minimo}-{io.maximo})"
+                  + (f"; latência média {latencia_io:.2f}s" if latencia_io is not None else "")]
+
+
+def _int_env(nome, padrao):
+    return int(os.getenv(nome, '') or padrao)
+
+
+def start_concurrency_controller(process_workers, copy_workers):
+    """
+    Cria o controlador se CONCORRENCIA_ADAPTATIVA=true
+
+    Limites: CONCORRENCIA_CPU_MIN/MAX (padrão 1 e o número de CPUs, nunca
+    menos que ``process_workers``) e CONCORRENCIA_IO_MIN/MAX (padrão 1 e
+    ``copy_workers``). Os níveis iniciais são os números de workers
+    configurados.
+
+    Returns:
+        ConcurrencyController: None se desativado
+    """
+    global _controller
+    if os.getenv('CONCORRENCIA_ADAPTATIVA', 'false').lower() != 'true':
+        _controller = None
+        return None
+    cpu_max = _int_env('CONCORRENCIA_CPU_MAX', max(os.cpu_count() or 1, process_workers))
+    cpu = AdaptiveLevel(_int_env('CONCORRENCIA_CPU_MIN', 1), cpu_max, process_workers)
+    io = AdaptiveLevel(_int_env('CONCORRENCIA_IO_MIN', 1), _int_env('CONCORRENCIA_IO_MAX', copy_workers), copy_workers)
+    _controller = ConcurrencyController(cpu, io)
+    return _controller
+
+
+def current_controller():
+    """Controlador ativo neste processo, ou None"""
+    return _controller
+
+
+def set_report_snapshot(linhas):
+    """Em um processo de processamento: níveis do controlador do processo principal para o relatório"""
+    global _report_snapshot
+    _report_snapshot = linhas
+
+
+def report_lines():
+    """Linhas da seção de paralelismo do relatório (None sem controlador)"""
+    if _controller is not None:
+        return _controller.report_lines()
+    return _report_snapshot
+
+
+def record_stage(etapa, segundos, bytes_processados=0, falha=False):
+    """Registra uma amostra de etapa no controlador ativo (sem controlador, não faz nada)"""
+    if _controller is not None:
+        _controller.record(etapa, segundos, bytes_processados, falha)
@@ -0,0 +1,271 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from datetime import datetime
+from dotenv import load_dotenv, dotenv_values, find_dotenv
+
+from cnab_core import BankConfig, OutputProfile
+from cnab_banks import ASSINATURAS_BANCOS
+from cnab_rules import compile_rule, RuleSyntaxError
+from cnab_logging import get_logger
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+# Bancos com configuração própria no .env (<BANCO>_OPERACAO, <BANCO>_ENABLE, <BANCO>_SEPARAR_ANTECIPACAO, <BANCO>_REGRA,
+# <BANCO>_TRAILER_TOTAIS)
+BANCOS_SUPORTADOS = tuple(assinatura.banco for assinatura in ASSINATURAS_BANCOS)
+
+# Perfis de saída adicionais (PERFIS=ERP,TESOURARIA; PERFIL_<NOME>_OPERACAO, _SEPARAR_ANTECIPACAO,
+# _FORMATO, _REGRA e _BANCOS)
+FORMATOS_PERFIL = ('csv', 'xls')
+
+# Código de operação CNAB400: dois dígitos
+_CODIGO_OPERACAO = re.compile(r'^\d{2}$')
+
+# Nome de perfil: usado em variáveis de ambiente e nos nomes dos arquivos gerados
+_NOME_PERFIL = re.compile(r'^[A-Z0-9_]+$')
+
+
+class ConfigError(ValueError):
+    """Configuração do .env inválida (a versão anterior continua em uso)"""
+
+
+def parse_bool(valor, padrao=False):
+    if valor is None:
+        return padrao
+    return str(valor).strip().lower() == 'true'
+
+
+def parse_operations(valor, banco=None):
+    """
+    Converte '06, 09' em frozenset({'06', '09'})
+
+    Espaços são removidos. Valor vazio resulta em conjunto vazio (manter
+    todas as linhas); por isso um código que não tem dois dígitos invalida a
+    configuração inteira em vez de ser descartado: 'BB_OPERACAO=6' viraria
+    um conjunto vazio e publicaria o arquivo sem filtro.
+
+    Raises:
+        ConfigError: Se algum código for inválido
+    """
+    operacoes = set()
+    invalidos = []
+    for parte in (valor or '').split(','):
+        codigo = parte.strip()
+        if not codigo:
+            continue
+        if not _CODIGO_OPERACAO.match(codigo):
+            invalidos.append(codigo)
+            continue
+        operacoes.add(codigo)
+    if invalidos:
+        raise ConfigError(f"Código(s) de operação inválido(s){f' para {banco}' if banco else ''}: "
+                          f"{', '.join(repr(codigo) for codigo in invalidos)} (use dois dígitos, ex: 06,09)")
+    return frozenset(operacoes)
+
+
+def _compile_rule_setting(valores, chave):
+    regra = (valores.get(chave) or '').strip() or None
+    try:
+        return compile_rule(regra), regra
+    except RuleSyntaxError as e:
+        raise RuleSyntaxError(f"{chave} inválida: {str(e)}")
+
+
+def parse_profiles(valores):
+    """
+    Monta os perfis de saída declarados em PERFIS
+
+    Returns:
+        list: [(OutputProfile, frozenset de bancos ou None para todos)]
+    """
+    perfis = []
+    for parte in (valores.get('PERFIS') or '').split(','):
+        nome = parte.strip().upper()
+        if not nome:
+            continue
+        if not _NOME_PERFIL.match(nome):
+            get_logger('config').warning(f"⚠️ Nome de perfil inválido: '{nome}' (use letras, números e _)")
+            continue
+        prefixo = f'PERFIL_{nome}_'
+        formato = (valores.get(prefixo + 'FORMATO') or '').strip().lower() or None
+        if formato and formato not in FORMATOS_PERFIL:
+            get_logger('config').warning(
+                f"⚠️ Formato inválido para o perfil {nome}: '{formato}' (usando OUTPUT_FORMAT)")
+            formato = None
+        regra, fonte = _compile_rule_setting(valores, prefixo + 'REGRA')
+        bancos = frozenset(b.strip().upper() for b in (valores.get(prefixo + 'BANCOS') or '').split(',') if b.strip())
+        config = BankConfig(
+            banco=None,
+            operations=parse_operations(valores.get(prefixo + 'OPERACAO'), nome),
+            separar_antecipacao=parse_bool(valores.get(prefixo + 'SEPARAR_ANTECIPACAO')),
+            rule=regra,
+            rule_source=fonte,
+        )
+        perfis.append((OutputProfile(nome.lower(), config, formato), bancos or None))
+    return perfis
+
+
+class CompiledConfig:
+    """
+    Configuração validada e imutável, identificada por uma versão.
+
+    A versão é um hash curto dos valores que afetam o processamento; ela é
+    registrada no relatório de cada arquivo.
+    """
+
+    def __init__(self, valores, origem=None):
+        self.origem = origem
+        self.carregada_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.banks = {}
+
+        for banco in BANCOS_SUPORTADOS:
+            predicado, regra = _compile_rule_setting(valores, f'{banco}_REGRA')
+            self.banks[banco] = BankConfig(
+                banco=banco,
+                operations=parse_operations(valores.get(f'{banco}_OPERACAO'), banco),
+                enabled=parse_bool(valores.get(f'{banco}_ENABLE')),
+                separar_antecipacao=parse_bool(valores.get(f'{banco}_SEPARAR_ANTECIPACAO')),
+                rule=predicado,
+                rule_source=regra,
+                trailer_totais=parse_bool(valores.get(f'{banco}_TRAILER_TOTAIS')),
+            )
+
+        assinatura = '|'.join(
+            f"{banco}:{','.join(sorted(cfg.operations))}:{cfg.enabled}:{cfg.separar_antecipacao}:{cfg.rule_source or ''}"
+            f"{':totais' if cfg.trailer_totais else ''}"
+            for banco, cfg in sorted(self.banks.items())
+        )
+        self.profiles = parse_profiles(valores)
+        if self.profiles:
+            assinatura += '|' + '|'.join(
+                f"{perfil.nome}:{','.join(sorted(perfil.config.operations))}:{perfil.config.separar_antecipacao}:"
+                f"{perfil.formato}:{perfil.config.rule_source or ''}:{','.join(sorted(bancos or ()))}"
+                for perfil, bancos in self.profiles
+            )
+        self.version = hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:8]
+
+    def bank(self, banco):
+        """Retorna o BankConfig do banco ou None se não houver configuração"""
+        return self.banks.get(banco)
+
+    def enabled_bank(self, banco):
+        """Retorna o BankConfig do banco se ele estiver habilitado, senão None"""
+        cfg = self.banks.get(banco)
+        return cfg if cfg is not None and cfg.enabled else None
+
+    def profiles_for(self, banco):
+        """Perfis de saída adicionais que se aplicam ao banco"""
+        return [perfil for perfil, bancos in self.profiles if bancos is None or banco in bancos]
+
+    def as_dict(self):
+        """Formato retornado historicamente por load_bank_operations"""
+        return {
+            banco: {
+                'operations': sorted(cfg.operations),
+                'enabled': cfg.enabled,
+                'separar_antecipacao': cfg.separar_antecipacao,
+                'regra': cfg.rule_source,
+                'trailer_totais': cfg.trailer_totais,
+            }
+            for banco, cfg in self.banks.items()
+        }
+
+
+class ConfigWatcher:
+    """
+    Mantém a configuração atual e a recarrega quando o .env muda.
+
+    O arquivo é verificado no máximo a cada ``check_seconds`` segundos. A troca
+    é atômica (uma única atribuição): quem já obteve a configuração para um
+    arquivo continua usando a mesma versão até o fim daquele arquivo.
+    Variáveis definidas no ambiente real (fora do .env) continuam tendo
+    precedência sobre o arquivo; as que vieram do .env e foram removidas dele
+    deixam de valer. Um .env inválido não é aplicado: a versão anterior
+    continua em uso até a próxima alteração do arquivo.
+
+    A recarga não altera os.environ (que outras threads leem a qualquer
+    momento): a nova versão é compilada a partir de um dicionário e só a
+    referência à CompiledConfig é trocada. As demais variáveis, lidas com
+    os.getenv, valem a partir do próximo início.
+    """
+
+    def __init__(self, env_path='.env', check_seconds=2.0):
+        self.env_path = env_path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._ultima_verificacao = 0.0
+        self._assinatura_arquivo = self._file_signature()
+        # Valores que o load_dotenv da importação colocou em os.environ
+        self._valores_iniciais = self._read_file()
+        self._atual = CompiledConfig(os.environ, origem=env_path)
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.env_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read_file(self):
+        try:
+            return dict(dotenv_values(self.env_path))
+        except Exception:
+            return {}
+
+    def _effective_values(self, valores_arquivo):
+        """Ambiente real com os valores atuais do .env no lugar dos carregados na importação"""
+        ambiente = dict(os.environ)
+        for chave, valor in self._valores_iniciais.items():
+            # Veio do .env: vale o arquivo atual (ou nada, se a chave foi removida dele)
+            if valor is not None and ambiente.get(chave) == valor:
+                del ambiente[chave]
+        for chave, valor in valores_arquivo.items():
+            # Variáveis definidas no ambiente real têm precedência
+            if valor is not None and chave not in ambiente:
+                ambiente[chave] = valor
+        return ambiente
+
+    def _reload(self):
+        # Com erro na compilação, a versão anterior é mantida
+        nova = CompiledConfig(self._effective_values(self._read_file()), origem=self.env_path)
+
+        anterior = self._atual
+        self._atual = nova
+        if self._atual.version != anterior.version:
+            get_logger('config').info(
+                f"🔄 Configuração recarregada: versão {anterior.version} → {self._atual.version}")
+
+    def current(self):
+        """Retorna a configuração atual, recarregando o .env se ele mudou"""
+        agora = time.monotonic()
+        if agora - self._ultima_verificacao >= self.check_seconds:
+            with self._lock:
+                if agora - self._ultima_verificacao >= self.check_seconds:
+                    self._ultima_verificacao = agora
+                    assinatura = self._file_signature()
+                    if assinatura != self._assinatura_arquivo:
+                        self._assinatura_arquivo = assinatura
+                        try:
+                            self._reload()
+                        except Exception as e:
+                            get_logger('config').warning(
+                                f"⚠️ Erro ao recarregar configuração, mantendo versão {self._atual.version}: {str(e)}")
+        return self._atual
+
+
+_watcher = None
+
+
+def get_config():
+    """Retorna a configuração compilada atual (recarregada automaticamente quando o .env muda)"""
+    global _watcher
+    if _watcher is None:
+        _watcher = ConfigWatcher(
+            env_path=os.getenv('ENV_FILE') or find_dotenv() or '.env',
+            check_seconds=float(os.getenv('CONFIG_RELOAD_SECONDS', '2')),
+        )
+    return _watcher.current()
@@ -0,0 +1,656 @@
+import io
+import time
+import hashlib
+from itertools import chain
+
+from cnab_rules import compile_rule
+from generate_csv_utils import extract_title_amount
+
+# Tamanho mínimo de uma linha válida (CNAB400 tem pelo menos 240 caracteres úteis)
+TAMANHO_MINIMO_LINHA = 240
+
+# Destinos de uma linha mantida (máscara de bits)
+DESTINO_ALTERADO = 1
+DESTINO_NORMAL = 2
+DESTINO_ANTECIPADO = 4
+DESTINO_TODOS = DESTINO_ALTERADO | DESTINO_NORMAL | DESTINO_ANTECIPADO
+
+# Layout CNAB400: tipo de registro (posição 1), sequencial (395-400) e campos do trailer
+REGISTRO_HEADER = '0'
+REGISTRO_TRAILER = '9'
+CAMPO_SEQUENCIAL = (394, 400)
+CAMPO_VALOR_TITULO = (152, 165)
+CAMPO_TRAILER_QUANTIDADE = (17, 25)
+CAMPO_TRAILER_VALOR_TOTAL = (25, 39)
+
+# Layouts de arquivo suportados (detectados pela primeira linha)
+LAYOUT_CNAB400 = 'CNAB400'
+LAYOUT_CNAB240 = 'CNAB240'
+
+# Códigos de motivo para linhas rejeitadas
+MOTIVO_TAMANHO_INSUFICIENTE = 'TAMANHO_INSUFICIENTE'
+MOTIVO_ERRO = 'ERRO_PROCESSAMENTO'
+
+
+class BankConfig:
+    """
+    Configuração compilada de um banco, pronta para uso no laço de filtragem.
+
+    As operações desejadas ficam em um frozenset para que a verificação de cada
+    registro seja O(1). Um conjunto vazio significa "manter todas as linhas".
+    ``accepts(codigo)`` é o predicado compilado equivalente.
+
+    ``rule`` é o predicado opcional gerado a partir de uma regra multi-campo
+    (ver cnab_rules.compile_rule); ele recebe a linha inteira e é avaliado
+    depois da verificação do código da operação.
+
+    ``trailer_totais`` indica que as posições 18-25 e 26-39 do trailer CNAB400
+    deste banco trazem a quantidade de registros e o valor total do próprio
+    arquivo (em retornos do BB e do Bradesco, por exemplo, elas trazem os
+    totais da carteira). Só então esses campos são conferidos e recalculados.
+    """
+
+    __slots__ = ('banco', 'operations', 'enabled', 'separar_antecipacao', 'accepts', 'rule', 'rule_source',
+                 'trailer_totais')
+
+    def __init__(self, banco=None, operations=None, enabled=True, separar_antecipacao=False,
+                 rule=None, rule_source=None, trailer_totais=False):
+        self.banco = banco
+        self.operations = frozenset(operations) if operations else frozenset()
+        self.enabled = enabled
+        self.separar_antecipacao = separar_antecipacao
+        self.accepts = self.operations.__contains__ if self.operations else (lambda codigo: True)
+        self.rule = rule
+        self.rule_source = rule_source
+        self.trailer_totais = trailer_totais
+
+    def copy(self, **alteracoes):
+        """Retorna uma cópia com os atributos informados alterados"""
+        valores = {
+            'banco': self.banco,
+            'operations': self.operations,
+            'enabled': self.enabled,
+            'separar_antecipacao': self.separar_antecipacao,
+            'rule': self.rule,
+            'rule_source': self.rule_source,
+            'trailer_totais': self.trailer_totais,
+        }
+        valores.update(alteracoes)
+        return BankConfig(**valores)
+
+    def __repr__(self):
+        return (f"BankConfig(banco={self.banco!r}, operations={sorted(self.operations)!r}, "
+                f"enabled={self.enabled!r}, separar_antecipacao={self.separar_antecipacao!r}, "
+                f"rule_source={self.rule_source!r}, trailer_totais={self.trailer_totais!r})")
+
+
+class OutputProfile:
+    """
+    Perfil de saída nomeado (ex: ERP, TESOURARIA), avaliado na mesma passada do
+    filtro principal.
+
+    Cada perfil tem seu próprio conjunto de operações, regra, separação por
+    antecipação e formato (csv/xls) da planilha de antecipadas.
+    """
+
+    __slots__ = ('nome', 'config', 'formato')
+
+    def __init__(self, nome, config, formato=None):
+        self.nome = nome
+        self.config = config
+        self.formato = formato
+
+    def __repr__(self):
+        return f"OutputProfile(nome={self.nome!r}, config={self.config!r}, formato={self.formato!r})"
+
+
+def compile_bank_config(banco, bank_config):
+    """
+    Converte o dicionário retornado por load_bank_operations em um BankConfig
+
+    Args:
+        banco (str): Nome do banco (ex: 'BB', 'BRADESCO')
+        bank_config (dict): Configurações do banco ('operations', 'enabled', 'separar_antecipacao', 'regra',
+            'trailer_totais')
+
+    Returns:
+        BankConfig: Configuração compilada
+    """
+    regra = bank_config.get('regra') or None
+    return BankConfig(
+        banco=banco,
+        operations=bank_config.get('operations'),
+        enabled=bank_config.get('enabled', True),
+        separar_antecipacao=bank_config.get('separar_antecipacao', False),
+        rule=compile_rule(regra),
+        rule_source=regra,
+        trailer_totais=bank_config.get('trailer_totais', False)
+    )
+
+
+class CnabIntegrity:
+    """
+    Verificação de integridade de um arquivo CNAB400, acumulada na mesma passada da classificação.
+
+    Confere se a primeira e a última linha são header (tipo 0) e trailer
+    (tipo 9) e se o sequencial (posições 395-400) acompanha a posição de cada
+    linha. Linhas em branco ou com o marcador de fim de arquivo (0x1A) depois
+    do trailer são ignoradas. A quantidade de registros e o valor total do
+    trailer só são conferidos quando o banco declara que esses campos se
+    referem ao próprio arquivo (``errors(conferir_totais=True)``); zerados,
+    são tratados como não informados. No CNAB240 (cnab240.py) o tipo vem da
+    posição 8, o sequencial é o do lote e a quantidade do trailer de arquivo,
+    padronizada pela FEBRABAN, é sempre conferida.
+    """
+
+    __slots__ = ('registros', 'valor_total', 'tipo_header', 'tipo_trailer', 'trailer_quantidade',
+                 'trailer_valor', 'sequencias_divergentes', 'primeira_sequencia_divergente',
+                 'lotes_divergentes', 'totais_padronizados')
+
+    def __init__(self):
+        self.registros = 0
+        self.valor_total = 0
+        self.tipo_header = None
+        self.tipo_trailer = None
+        self.trailer_quantidade = None
+        self.trailer_valor = None
+        self.sequencias_divergentes = 0
+        self.primeira_sequencia_divergente = None
+        self.lotes_divergentes = 0  # CNAB240: trailers de lote com quantidade divergente
+        self.totais_padronizados = False  # CNAB240: totais do trailer definidos pelo layout
+
+    def errors(self, conferir_totais=False):
+        """
+        Lista de divergências encontradas (vazia se o arquivo estiver íntegro)
+
+        Args:
+            conferir_totais (bool): Confere também a quantidade e o valor total do
+                trailer CNAB400 (BankConfig.trailer_totais do banco)
+        """
+        erros = []
+        if self.tipo_header is None:
+            erros.append("Primeira linha incompleta ou ausente (sem header)")
+        elif self.tipo_header != REGISTRO_HEADER:
+            erros.append(f"Primeira linha não é um header (tipo {self.tipo_header!r})")
+        if self.tipo_trailer is None:
+            erros.append("Última linha incompleta ou ausente (sem trailer); arquivo possivelmente truncado")
+        elif self.tipo_trailer != REGISTRO_TRAILER:
+            erros.append(f"Última linha não é um trailer (tipo {self.tipo_trailer!r}); arquivo possivelmente truncado")
+        elif conferir_totais or self.totais_padronizados:
+            if self.trailer_quantidade and self.trailer_quantidade != self.registros:
+                erros.append(f"Trailer informa {self.trailer_quantidade} registros, arquivo contém {self.registros}")
+            if self.trailer_valor and self.trailer_valor != self.valor_total:
+                erros.append(f"Trailer informa valor total {self.trailer_valor / 100:.2f}, "
+                             f"soma dos registros é {self.valor_total / 100:.2f}")
+        if self.sequencias_divergentes:
+            erros.append(f"{self.sequencias_divergentes} linha(s) com sequencial fora de ordem "
+                         f"(primeira: linha {self.primeira_sequencia_divergente})")
+        if self.lotes_divergentes:
+            erros.append(f"{self.lotes_divergentes} lote(s) com quantidade de registros divergente do trailer do lote")
+        return erros
+
+
+class CnabResult:
+    """
+    Resultado do processamento de um arquivo CNAB em memória.
+
+    Contém as linhas de cada saída (alterado, normal, antecipado), os contadores
+    usados no relatório e os tempos de cada etapa. Nenhum arquivo é gravado.
+    """
+
+    def __init__(self, banco=None, perfil=None):
+        self.banco = banco
+        self.perfil = perfil
+        self.encoding = None
+        self.primeira_linha = ''
+        self.layout = LAYOUT_CNAB400
+
+        # Linhas de cada saída
+        self.linhas_alteradas = []
+        self.linhas_normais = []
+        self.linhas_antecipadas = []
+
+        # Linhas rejeitadas: (numero_linha, codigo_motivo, detalhe, conteudo)
+        self.linhas_rejeitadas = []
+
+        # Contadores
+        self.total_linhas = 0
+        self.linhas_validas = 0
+        self.linhas_invalidas = 0
+        self.linhas_mantidas = 0
+        self.contagem_operacoes = {}
+        self.operacoes_normais = 0
+        self.operacoes_antecipadas = 0
+        self.operacoes_sem_tipo = 0
+
+        # Tempos (segundos)
+        self.tempo_decodificacao = 0.0
+        self.tempo_classificacao = 0.0
+
+        # Resultados dos perfis de saída adicionais, por nome
+        self.perfis = {}
+
+        # Verificação de trailer, sequencial e tipos de registro
+        self.integridade = CnabIntegrity()
+
+        # Uso do cache de classificação (cnab_parse_cache): None, 'acerto' ou 'falta'
+        self.cache_classificacao = None
+
+        # Agregados (filter_cnab com totais=True): SHA-256 do conteúdo e, por
+        # (operação, tipo, vencimento), [centavos, quantidade] dos títulos válidos
+        self.hash_conteudo = None
+        self.totais_titulos = None
+
+    def share_counters(self, origem):
+        """Copia os contadores comuns a todos os perfis (tudo menos as linhas mantidas)"""
+        for atributo in ('encoding', 'layout', 'primeira_linha', 'linhas_rejeitadas', 'integridade', 'total_linhas', 'linhas_validas',
+                         'linhas_invalidas', 'contagem_operacoes', 'operacoes_normais',
+                         'operacoes_antecipadas', 'operacoes_sem_tipo', 'tempo_decodificacao',
+                         'tempo_classificacao', 'cache_classificacao'):
+            setattr(self, atributo, getattr(origem, atributo))
+
+    def add_line(self, linha, destinos):
+        """Adiciona uma linha mantida às saídas indicadas pela máscara DESTINO_*"""
+        self.linhas_mantidas += 1
+        if destinos & DESTINO_ALTERADO:
+            self.linhas_alteradas.append(linha)
+        if destinos & DESTINO_NORMAL:
+            self.linhas_normais.append(linha)
+        if destinos & DESTINO_ANTECIPADO:
+            self.linhas_antecipadas.append(linha)
+
+    @property
+    def tempo_total(self):
+        return self.tempo_decodificacao + self.tempo_classificacao
+
+    @property
+    def registros_mantidos(self):
+        """Registros de dados mantidos (sem header/trailer)"""
+        return max(0, self.linhas_mantidas - 2) if self.total_linhas > 2 else self.linhas_mantidas
+
+    def __repr__(self):
+        return (f"CnabResult(banco={self.banco!r}, total_linhas={self.total_linhas}, "
+                f"linhas_mantidas={self.linhas_mantidas}, linhas_invalidas={self.linhas_invalidas})")
+
+
+def decode_cnab_text(data):
+    """
+    Decodifica o conteúdo de um arquivo CNAB em texto
+
+    Tenta UTF-8 e, em caso de falha, Latin-1 (mesma estratégia usada na leitura
+    dos arquivos).
+
+    Args:
+        data (bytes | str | objeto com read()): Conteúdo do arquivo
+
+    Returns:
+        tuple: (str, str) - (texto, encoding utilizado; None se ``data`` já for texto)
+    """
+    if hasattr(data, 'read'):
+        data = data.read()
+
+    if isinstance(data, str):
+        return data, None
+    try:
+        return bytes(data).decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return bytes(data).decode('latin-1'), 'latin-1'
+
+
+def decode_cnab(data):
+    """
+    Decodifica o conteúdo de um arquivo CNAB em uma lista de linhas
+
+    Usa decode_cnab_text; quebras de linha são normalizadas para '\\n'.
+
+    Args:
+        data (bytes | str | objeto com read()): Conteúdo do arquivo
+
+    Returns:
+        tuple: (list, str) - (linhas, encoding utilizado)
+    """
+    texto, encoding = decode_cnab_text(data)
+    return io.StringIO(texto, newline=None).readlines(), encoding
+
+
+def detect_layout(primeira_linha):
+    """
+    Identifica o layout do arquivo pela primeira linha
+
+    Um header de arquivo CNAB240 (FEBRABAN) tem até 240 posições, código do
+    banco numérico, lote '0000' e tipo de registro '0' na posição 8; qualquer
+    outra linha é tratada como CNAB400.
+
+    Returns:
+        str: LAYOUT_CNAB240 ou LAYOUT_CNAB400
+    """
+    linha = (primeira_linha or '').rstrip('\r\n')
+    if (len(linha.rstrip()) <= 240 and linha[:3].isdigit() and linha[3:7] == '0000'
+            and linha[7:8] == REGISTRO_HEADER):
+        return LAYOUT_CNAB240
+    return LAYOUT_CNAB400
+
+
+def is_padding_line(linha):
+    """Linha em branco ou só com o marcador de fim de arquivo (0x1A), comum depois do trailer"""
+    return not linha.replace('\x1a', '').strip()
+
+
+def _mark_last_record(linhas):
+    """
+    Gera (linha, ultima, preenchimento) para cada linha, em streaming
+
+    ``ultima`` marca a última linha significativa (o trailer); linhas em
+    branco/0x1A depois dela têm ``preenchimento`` verdadeiro. Só as linhas
+    em branco consecutivas ficam em memória enquanto se procura a próxima
+    linha significativa.
+    """
+    anterior = None
+    brancas = []
+    for linha in linhas:
+        if len(linha) < TAMANHO_MINIMO_LINHA and is_padding_line(linha):
+            brancas.append(linha)
+            continue
+        if anterior is not None:
+            yield anterior, False, False
+        if brancas:
+            # Linhas em branco no meio do arquivo são linhas comuns (rejeitadas pelo tamanho)
+            for branca in brancas:
+                yield branca, False, False
+            brancas = []
+        anterior = linha
+    if anterior is not None:
+        yield anterior, True, False
+    for branca in brancas:
+        yield branca, False, True
+
+
+def _destinations(config):
+    """Máscaras (antecipado, normal) de um registro mantido, conforme a separação por antecipação"""
+    if config.separar_antecipacao:
+        return DESTINO_ALTERADO | DESTINO_ANTECIPADO, DESTINO_ALTERADO | DESTINO_NORMAL
+    return DESTINO_TODOS, DESTINO_TODOS
+
+
+def iter_classified_lines(linhas, config, resultado, perfis=None):
+    """
+    Classifica as linhas de um arquivo CNAB, gerando apenas as linhas mantidas
+
+    Header (primeira linha) e trailer (última linha significativa) são sempre
+    mantidos; linhas em branco/0x1A depois do trailer são descartadas. Os
+    contadores de ``resultado`` (inclusive ``resultado.integridade``) são
+    atualizados durante a iteração. Aceita qualquer iterável de linhas,
+    inclusive geradores (o trailer é detectado lendo adiante só as linhas em
+    branco seguintes).
+
+    Perfis adicionais são avaliados na mesma passada: cada registro é
+    decodificado uma única vez e adicionado diretamente aos resultados dos
+    perfis que o aceitam (em ``resultado.perfis``). Se
+    ``resultado.totais_titulos`` não for None, os títulos válidos de todos os
+    registros (mantidos ou não) são somados nele na mesma passada.
+
+    Arquivos CNAB240 (ver detect_layout) são encaminhados para
+    cnab240.iter_classified_lines_240, que tem a mesma interface.
+
+    Args:
+        linhas (iterable): Linhas do arquivo (com ou sem '\\n' no final)
+        config (BankConfig): Configuração compilada do banco
+        resultado (CnabResult): Objeto que acumula os contadores
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile)
+
+    Yields:
+        tuple: (str, int) - (linha, máscara de destinos DESTINO_*)
+    """
+    operacoes_desejadas = config.operations
+    regra = config.rule
+    contagem_operacoes = resultado.contagem_operacoes
+    totais_titulos = resultado.totais_titulos
+    destino_antecipado, destino_normal = _destinations(config)
+
+    # Rotas dos perfis adicionais: (operações, regra, destino antecipado, destino normal, resultado do perfil)
+    rotas = []
+    for perfil in perfis or ():
+        resultado_perfil = CnabResult(resultado.banco, perfil.nome)
+        resultado.perfis[perfil.nome] = resultado_perfil
+        rotas.append((perfil.config.operations, perfil.config.rule) + _destinations(perfil.config)
+                     + (resultado_perfil,))
+
+    # Integridade: acumulada em variáveis locais e gravada no final da passada
+    integridade = resultado.integridade
+    registros = 0
+    valor_total = 0
+    sequencias_divergentes = 0
+    primeira_sequencia_divergente = None
+    inicio_valor, fim_valor = CAMPO_VALOR_TITULO
+    inicio_seq, fim_seq = CAMPO_SEQUENCIAL
+
+    iterador = iter(linhas)
+    primeira = next(iterador, None)
+    if primeira is None:
+        return
+
+    if detect_layout(primeira) == LAYOUT_CNAB240:
+        # Import local: cnab240 depende deste módulo
+        from cnab240 import iter_classified_lines_240
+        yield from iter_classified_lines_240(chain([primeira], iterador), config, resultado, perfis)
+        return
+
+    for i, (linha, ultima, preenchimento) in enumerate(_mark_last_record(chain([primeira], iterador))):
+        resultado.total_linhas = i + 1
+        if preenchimento:
+            continue
+        try:
+            linha = linha.rstrip('\n')
+            if i == 0:
+                resultado.primeira_linha = linha
+
+            # Verificar se a linha tem o tamanho mínimo esperado
+            tamanho_util = len(linha.strip())
+            if tamanho_util < TAMANHO_MINIMO_LINHA:
+                resultado.linhas_invalidas += 1
+                resultado.linhas_rejeitadas.append(
+                    (i + 1, MOTIVO_TAMANHO_INSUFICIENTE, f"tamanho insuficiente ({tamanho_util} caracteres)", linha))
+                if i > 0 and not ultima:
+                    registros += 1
+                continue
+
+            sequencial = linha[inicio_seq:fim_seq]
+            if sequencial.isdigit() and int(sequencial) != i + 1:
+                sequencias_divergentes += 1
+                if primeira_sequencia_divergente is None:
+                    primeira_sequencia_divergente = i + 1
+
+            # Se for header (primeira linha) ou trailer (última linha), manter sempre
+            if i == 0 or ultima:
+                if i == 0:
+                    integridade.tipo_header = linha[:1]
+                if ultima:
+                    integridade.tipo_trailer = linha[:1]
+                    quantidade = linha[CAMPO_TRAILER_QUANTIDADE[0]:CAMPO_TRAILER_QUANTIDADE[1]]
+                    valor = linha[CAMPO_TRAILER_VALOR_TOTAL[0]:CAMPO_TRAILER_VALOR_TOTAL[1]]
+                    integridade.trailer_quantidade = int(quantidade) if quantidade.isdigit() else None
+                    integridade.trailer_valor = int(valor) if valor.isdigit() else None
+                resultado.linhas_mantidas += 1
+                for rota in rotas:
+                    rota[4].add_line(linha, DESTINO_TODOS)
+                yield linha, DESTINO_TODOS
+                continue
+
+            # Contar apenas registros de dados (não header/trailer) como linhas válidas
+            resultado.linhas_validas += 1
+            registros += 1
+            valor_titulo = linha[inicio_valor:fim_valor]
+            if valor_titulo.isdigit():
+                valor_total += int(valor_titulo)
+
+            # Código da operação (layout CNAB400) e tipo (coluna 319 - 1: Antecipada, 2: Normal)
+            codigo_operacao = linha[108:110].strip()
+            tipo_operacao = linha[318:319].strip() if len(linha) >= 320 else None
+
+            if codigo_operacao:
+                contagem_operacoes[codigo_operacao] = contagem_operacoes.get(codigo_operacao, 0) + 1
+
+            if tipo_operacao == '1':
+                resultado.operacoes_antecipadas += 1
+            elif tipo_operacao == '2':
+                resultado.operacoes_normais += 1
+            else:
+                resultado.operacoes_sem_tipo += 1
+
+            if totais_titulos is not None:
+                titulo = extract_title_amount(linha)
+                if titulo is not None:
+                    chave = (linha[108:110], tipo_operacao or '', titulo[1])
+                    total = totais_titulos.get(chave)
+                    if total is None:
+                        totais_titulos[chave] = [titulo[0], 1]
+                    else:
+                        total[0] += titulo[0]
+                        total[1] += 1
+
+            for operacoes, regra_perfil, antecipado, normal, resultado_perfil in rotas:
+                if ((not operacoes or not codigo_operacao or codigo_operacao in operacoes)
+                        and (regra_perfil is None or regra_perfil(linha))):
+                    resultado_perfil.add_line(linha, antecipado if tipo_operacao == '1' else normal)
+
+            # Verificar se a operação está entre as desejadas e se a linha atende à regra
+            if ((not operacoes_desejadas or not codigo_operacao or codigo_operacao in operacoes_desejadas)
+                    and (regra is None or regra(linha))):
+                resultado.linhas_mantidas += 1
+                # Sem tipo ou tipo 2 vão para o arquivo normal
+                yield linha, destino_antecipado if tipo_operacao == '1' else destino_normal
+
+        except Exception as e:
+            resultado.linhas_invalidas += 1
+            resultado.linhas_rejeitadas.append((i + 1, MOTIVO_ERRO, str(e), linha))
+
+    integridade.registros = registros
+    integridade.valor_total = valor_total
+    integridade.sequencias_divergentes = sequencias_divergentes
+    integridade.primeira_sequencia_divergente = primeira_sequencia_divergente
+
+
+def filter_cnab_lines(linhas, config, resultado=None, perfis=None):
+    """
+    Filtra as linhas de um arquivo CNAB já decodificado
+
+    Args:
+        linhas (iterable): Linhas do arquivo
+        config (BankConfig): Configuração compilada do banco
+        resultado (CnabResult, optional): Resultado a ser preenchido
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile), avaliados na mesma passada
+
+    Returns:
+        CnabResult: Resultado com as linhas de cada saída e os contadores
+    """
+    if resultado is None:
+        resultado = CnabResult(config.banco)
+
+    inicio = time.perf_counter()
+    alteradas = resultado.linhas_alteradas
+    normais = resultado.linhas_normais
+    antecipadas = resultado.linhas_antecipadas
+
+    for linha, destinos in iter_classified_lines(linhas, config, resultado, perfis):
+        if destinos & DESTINO_ALTERADO:
+            alteradas.append(linha)
+        if destinos & DESTINO_NORMAL:
+            normais.append(linha)
+        if destinos & DESTINO_ANTECIPADO:
+            antecipadas.append(linha)
+
+    resultado.tempo_classificacao = time.perf_counter() - inicio
+    for resultado_perfil in resultado.perfis.values():
+        resultado_perfil.share_counters(resultado)
+    return resultado
+
+
+def content_hash(data):
+    """SHA-256 (hex) do conteúdo de um arquivo CNAB (texto é codificado em UTF-8)"""
+    return hashlib.sha256(data.encode('utf-8') if isinstance(data, str) else data).hexdigest()
+
+
+def filter_cnab(data, config, perfis=None, totais=False):
+    """
+    Processa um arquivo CNAB em memória, sem gravar arquivos nem imprimir mensagens
+
+    Args:
+        data (bytes | str | objeto com read()): Conteúdo do arquivo
+        config (BankConfig): Configuração compilada do banco
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile); os resultados
+            de cada perfil ficam em ``resultado.perfis``
+        totais (bool, optional): Preenche ``hash_conteudo`` e ``totais_titulos`` (agregados)
+
+    Returns:
+        CnabResult: Resultado com as linhas de cada saída, contadores e tempos
+    """
+    resultado = CnabResult(config.banco)
+    if totais:
+        if hasattr(data, 'read'):
+            data = data.read()
+        resultado.hash_conteudo = content_hash(data)
+        resultado.totais_titulos = {}
+
+    inicio = time.perf_counter()
+    linhas, resultado.encoding = decode_cnab(data)
+    resultado.tempo_decodificacao = time.perf_counter() - inicio
+
+    return filter_cnab_lines(linhas, config, resultado, perfis)
+
+
+def _replace_numeric_field(linha, campo, valor):
+    """Substitui um campo numérico da linha; mantém a linha se o campo não existir ou não for numérico"""
+    inicio, fim = campo
+    if len(linha) < fim or not linha[inicio:fim].isdigit():
+        return linha
+    texto = str(valor).zfill(fim - inicio)
+    if len(texto) > fim - inicio:
+        return linha
+    return linha[:inicio] + texto + linha[fim:]
+
+
+def renumber_cnab_lines(linhas, recalcular_totais=True):
+    """
+    Renumera o sequencial dos registros e recalcula o trailer de uma saída filtrada
+
+    O sequencial (posições 395-400) passa a ser 1..N na ordem das linhas e,
+    com ``recalcular_totais``, o trailer recebe a quantidade de registros de
+    dados e a soma dos valores dos títulos efetivamente presentes (posições
+    18-25 e 26-39). Campos ausentes ou não numéricos são mantidos como estão.
+    Funciona em streaming.
+
+    Args:
+        linhas (iterable): Linhas da saída (header, registros e trailer)
+        recalcular_totais (bool): Recalcula quantidade e valor total do trailer
+            (só para bancos com BankConfig.trailer_totais)
+
+    Yields:
+        str: Linhas corrigidas
+    """
+    quantidade = 0
+    valor_total = 0
+    inicio_valor, fim_valor = CAMPO_VALOR_TITULO
+
+    for sequencial, linha in enumerate(linhas, 1):
+        tipo_registro = linha[:1]
+        if tipo_registro == REGISTRO_TRAILER and recalcular_totais:
+            linha = _replace_numeric_field(linha, CAMPO_TRAILER_QUANTIDADE, quantidade)
+            linha = _replace_numeric_field(linha, CAMPO_TRAILER_VALOR_TOTAL, valor_total)
+        elif tipo_registro != REGISTRO_HEADER:
+            quantidade += 1
+            valor = linha[inicio_valor:fim_valor]
+            if valor.isdigit():
+                valor_total += int(valor)
+        yield _replace_numeric_field(linha, CAMPO_SEQUENCIAL, sequencial)
+
+
+def split_header_trailer(linhas):
+    """
+    Separa header e trailer dos registros de dados de uma saída
+
+    Returns:
+        tuple: (list, list, list) - (header, registros, trailer); header/trailer vazios se ausentes
+    """
+    header = linhas[:1] if linhas and linhas[0][:1] == REGISTRO_HEADER else []
+    trailer = linhas[-1:] if len(linhas) > len(header) and linhas[-1][:1] == REGISTRO_TRAILER else []
+    return header, linhas[len(header):len(linhas) - len(trailer)], trailer
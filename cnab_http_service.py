@@ -0,0 +1,317 @@
+import os
+import csv
+import io
+import time
+import threading
+import traceback
+from itertools import chain
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+
+from cnab_core import (
+    BankConfig, CnabResult, iter_classified_lines, renumber_cnab_lines, detect_layout,
+    DESTINO_ALTERADO, DESTINO_ANTECIPADO, LAYOUT_CNAB240
+)
+from process_cnab import identify_bank
+from cnab_config import get_config
+from cnab_logging import get_logger
+from generate_csv_utils import extract_document_data
+from cnab_compression import codec_available, iter_decompressed_blocks, CODEC_POR_CONTENT_ENCODING
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+logger = get_logger('http')
+
+# Tamanho dos blocos lidos do corpo da requisição e enviados na resposta
+TAMANHO_BLOCO = 64 * 1024
+
+
+def _iter_body_blocks(rfile, headers):
+    """
+    Gera os blocos do corpo da requisição, com Content-Length ou Transfer-Encoding chunked
+
+    Args:
+        rfile: Stream de leitura da conexão
+        headers: Cabeçalhos da requisição
+
+    Yields:
+        bytes: Blocos do corpo
+    """
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while True:
+            linha_tamanho = rfile.readline(1024)
+            if not linha_tamanho:
+                return
+            tamanho = int(linha_tamanho.split(b';', 1)[0].strip() or b'0', 16)
+            if tamanho == 0:
+                # Descarta trailers da requisição até a linha em branco
+                while rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            restante = tamanho
+            while restante > 0:
+                bloco = rfile.read(min(restante, TAMANHO_BLOCO))
+                if not bloco:
+                    return
+                restante -= len(bloco)
+                yield bloco
+            rfile.readline(1024)  # CRLF ao final do chunk
+    else:
+        restante = int(headers.get('Content-Length', '0') or 0)
+        while restante > 0:
+            bloco = rfile.read(min(restante, TAMANHO_BLOCO))
+            if not bloco:
+                return
+            restante -= len(bloco)
+            yield bloco
+
+
+class FileLineDecoder:
+    """
+    Decodifica as linhas de um arquivo em streaming com um único encoding por arquivo
+
+    Começa em UTF-8; na primeira linha que não é UTF-8 válido, passa a usar
+    Latin-1 até o fim do arquivo (como decode_cnab_text, que decide pelo
+    arquivo inteiro). As linhas anteriores já saíram em UTF-8: elas só
+    divergiriam de Latin-1 se tivessem sequências multibyte UTF-8 válidas,
+    o que não acontece em arquivos Latin-1 reais.
+    """
+
+    def __init__(self):
+        self.encoding = 'utf-8'
+
+    def decode(self, linha_bytes):
+        if linha_bytes.endswith(b'\r'):
+            linha_bytes = linha_bytes[:-1]
+        if self.encoding == 'utf-8':
+            try:
+                return linha_bytes.decode('utf-8')
+            except UnicodeDecodeError:
+                self.encoding = 'latin-1'
+        return linha_bytes.decode('latin-1')
+
+
+def iter_decoded_lines(blocos):
+    """
+    Converte blocos de bytes em linhas de texto, sem carregar o corpo inteiro
+
+    Um único encoding por arquivo (ver FileLineDecoder). Quebras '\\r\\n' são normalizadas para '\\n'.
+
+    Args:
+        blocos (iterable): Blocos de bytes
+
+    Yields:
+        str: Linhas decodificadas (sem quebra de linha)
+    """
+    decodificador = FileLineDecoder()
+    resto = b''
+    for bloco in blocos:
+        partes = (resto + bloco).split(b'\n')
+        resto = partes.pop()
+        for parte in partes:
+            yield decodificador.decode(parte)
+    if resto:
+        yield decodificador.decode(resto)
+
+
+class CnabRequestHandler(BaseHTTPRequestHandler):
+    """
+    Recebe um arquivo .RET via POST e devolve o conteúdo filtrado em streaming.
+
+    Nada é acumulado nem gravado em disco: cada bloco filtrado sai em um
+    chunk da resposta. A integridade só é conhecida depois da última linha e
+    vai no trailer HTTP ``X-Integridade`` ('ok' ou as divergências), junto
+    com ``Server-Timing``. Bancos não habilitados têm todas as linhas mantidas.
+
+    Rotas:
+        POST /processar                      -> arquivo _alterado
+        POST /processar?saida=antecipado_csv -> CSV das operações antecipadas
+        Parâmetro opcional: banco=BB|BRADESCO|ITAU|... (força a identificação do banco)
+        Corpo compactado: Content-Encoding gzip (ou zstd, com o pacote zstandard)
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LinxProcessorCNAB/1.0'
+
+    def log_message(self, format, *args):
+        logger.info(f"🌐 {self.address_string()} - {format % args}")
+
+    def _send_error_text(self, status, mensagem, headers=None):
+        corpo = (mensagem + '\n').encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _write_chunk(self, dados):
+        if dados:
+            self.wfile.write(f"{len(dados):X}\r\n".encode('ascii') + dados + b"\r\n")
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/saude':
+            self._send_error_text(200, 'ok')
+        else:
+            self._send_error_text(404, 'Rota não encontrada')
+
+    def do_POST(self):
+        inicio = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != '/processar':
+            self._send_error_text(404, 'Rota não encontrada')
+            return
+
+        parametros = parse_qs(url.query)
+        saida = parametros.get('saida', ['alterado'])[0].lower()
+        if saida not in ('alterado', 'antecipado_csv'):
+            self._send_error_text(400, f"Saída inválida: {saida} (use alterado ou antecipado_csv)")
+            return
+
+        # Corpo compactado (Content-Encoding: gzip/zstd) é descompactado em streaming
+        codificacao = (self.headers.get('Content-Encoding') or 'identity').strip().lower()
+        if codificacao != 'identity' and not codec_available(CODEC_POR_CONTENT_ENCODING.get(codificacao)):
+            self._send_error_text(415, f"Content-Encoding não suportado: {codificacao}")
+            return
+
+        # Limite de concorrência: aguarda uma vaga por até HTTP_FILA_TIMEOUT segundos
+        if not self.server.semaforo.acquire(timeout=self.server.fila_timeout):
+            self.close_connection = True
+            self._send_error_text(503, 'Servidor ocupado, tente novamente', {'Retry-After': '1'})
+            return
+        tempo_fila = time.perf_counter() - inicio
+
+        try:
+            self._process_request(saida, parametros.get('banco', [None])[0], tempo_fila)
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar requisição: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.close_connection = True
+        finally:
+            self.server.semaforo.release()
+
+    def _process_request(self, saida, banco_forcado, tempo_fila):
+        inicio_processamento = time.perf_counter()
+        blocos = _iter_body_blocks(self.rfile, self.headers)
+        codec = CODEC_POR_CONTENT_ENCODING.get((self.headers.get('Content-Encoding') or '').strip().lower())
+        if codec:
+            blocos = iter_decompressed_blocks(blocos, codec)
+        linhas = iter_decoded_lines(blocos)
+
+        # A primeira linha define o banco (e portanto a configuração) antes do streaming
+        primeira_linha = next(linhas, None)
+        if primeira_linha is None:
+            self._send_error_text(400, 'Corpo da requisição vazio')
+            return
+
+        banco = (banco_forcado.upper() if banco_forcado else identify_bank(primeira_linha)) or 'DESCONHECIDO'
+        config = get_config().enabled_bank(banco)
+        if config is None:
+            # Como no processamento por diretório: sem configuração habilitada, todas as linhas são mantidas
+            logger.warning(f"⚠️ Banco não identificado ou não habilitado: {banco} (mantendo todas as linhas)")
+            config = BankConfig(banco)
+
+        layout = detect_layout(primeira_linha)
+        if saida == 'antecipado_csv' and layout == LAYOUT_CNAB240:
+            self.close_connection = True
+            self._send_error_text(422, 'Saída antecipado_csv não disponível para arquivos CNAB240')
+            return
+
+        if saida == 'antecipado_csv':
+            # O CSV depende da separação por tipo, independente da configuração do banco
+            config = config.copy(separar_antecipacao=True)
+            destino_desejado = DESTINO_ANTECIPADO
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            destino_desejado = DESTINO_ALTERADO
+            content_type = 'text/plain; charset=utf-8'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Trailer', 'Server-Timing, X-Integridade')
+        self.send_header('X-Banco', banco)
+        self.send_header('X-Layout', layout)
+        self.send_header('X-Tempo-Fila-Ms', f"{tempo_fila * 1000:.1f}")
+        self.end_headers()
+
+        resultado = CnabResult(banco)
+        classificadas = iter_classified_lines(chain([primeira_linha], linhas), config, resultado)
+        buffer = io.StringIO()
+
+        if saida == 'antecipado_csv':
+            writer = csv.DictWriter(buffer, fieldnames=['n_documento', 'valor', 'data_pagamento'])
+            writer.writeheader()
+            for linha, destinos in classificadas:
+                if destinos & destino_desejado:
+                    dados = extract_document_data(linha)
+                    if dados and dados['n_documento']:
+                        writer.writerow(dados)
+                if buffer.tell() >= TAMANHO_BLOCO:
+                    self._write_chunk(buffer.getvalue().encode('utf-8'))
+                    buffer.seek(0)
+                    buffer.truncate()
+        else:
+            selecionadas = (linha for linha, destinos in classificadas if destinos & destino_desejado)
+            # CNAB240 já sai com os trailers de lote/arquivo reconstruídos
+            if layout != LAYOUT_CNAB240 and os.getenv('RECALCULAR_TRAILER', 'false').lower() == 'true':
+                selecionadas = renumber_cnab_lines(selecionadas, config.trailer_totais)
+            separador = ''
+            for linha in selecionadas:
+                buffer.write(separador)
+                buffer.write(linha)
+                separador = '\n'
+                if buffer.tell() >= TAMANHO_BLOCO:
+                    self._write_chunk(buffer.getvalue().encode('utf-8'))
+                    buffer.seek(0)
+                    buffer.truncate()
+
+        self._write_chunk(buffer.getvalue().encode('utf-8'))
+
+        tempo_processamento = time.perf_counter() - inicio_processamento
+        server_timing = f"fila;dur={tempo_fila * 1000:.1f}, processamento;dur={tempo_processamento * 1000:.1f}"
+        # A integridade só é conhecida no fim do stream: vai no trailer HTTP
+        erros_integridade = resultado.integridade.errors(config.trailer_totais)
+        integridade = '; '.join(erros_integridade) if erros_integridade else 'ok'
+        self.wfile.write(f"0\r\nServer-Timing: {server_timing}\r\nX-Integridade: {integridade}\r\n\r\n"
+                         .encode('latin-1', 'replace'))
+        if erros_integridade:
+            logger.warning(f"🛡️ {banco}: divergências de integridade ({integridade})")
+
+        logger.info(f"✅ {banco}: {resultado.total_linhas} linhas recebidas, {resultado.linhas_mantidas} mantidas "
+                    f"({tempo_processamento:.3f}s, fila {tempo_fila:.3f}s)")
+
+
+class CnabHTTPServer(ThreadingHTTPServer):
+    """Servidor HTTP com limite de requisições processadas simultaneamente"""
+
+    daemon_threads = True
+
+    def __init__(self, endereco, max_concorrencia=4, fila_timeout=30.0):
+        super().__init__(endereco, CnabRequestHandler)
+        self.semaforo = threading.BoundedSemaphore(max_concorrencia)
+        self.fila_timeout = fila_timeout
+
+
+def main():
+    host = os.getenv('HTTP_HOST', '127.0.0.1')
+    port = int(os.getenv('HTTP_PORT', '8080'))
+    max_concorrencia = int(os.getenv('HTTP_MAX_CONCORRENCIA', '4'))
+    fila_timeout = float(os.getenv('HTTP_FILA_TIMEOUT', '30'))
+
+    server = CnabHTTPServer((host, port), max_concorrencia, fila_timeout)
+    print(f"Serviço HTTP de processamento CNAB em http://{host}:{port}/processar")
+    print(f"Requisições simultâneas: {max_concorrencia} (espera máxima na fila: {fila_timeout:.0f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServiço interrompido pelo usuário.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
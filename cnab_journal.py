@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+
+from cnab_logging import get_logger
+from cnab_lease import multi_node_enabled, shared_journal_path
+
+# Etapas registradas no journal de um arquivo
+ETAPA_INICIO = 'inicio'    # timestamp das saídas e backup do original
+ETAPA_SAIDAS = 'saidas'    # saídas gravadas (caminhos, hashes e dados do relatório)
+ETAPA_COPIA = 'copia'      # uma saída copiada (ou enfileirada) para um diretório adicional
+ETAPA_CONCLUIDO = 'concluido'  # arquivo registrado (journal compartilhado, aguardando o .done do lease)
+
+
+def hash_file(caminho):
+    """SHA-256 do conteúdo de um arquivo, lido em blocos"""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+class ProcessingJournal:
+    """
+    Journal write-ahead do processamento de um arquivo
+
+    Cada etapa concluída é acrescentada como uma linha JSON e gravada em disco
+    (fsync) antes de a próxima começar. Se o processo cair, o próximo ciclo
+    retoma a partir da última etapa: com as saídas já gravadas e íntegras
+    (conferidas pelo hash), só faltam as cópias ainda não registradas, o
+    relatório e o registro em processed_files.md. O journal é removido quando
+    o arquivo é registrado como processado.
+
+    O hash do arquivo de entrada fica em todos os registros: uma nova entrega
+    com o mesmo nome e outro conteúdo descarta o journal anterior.
+
+    Um journal ``compartilhado`` (modo multi-nó) não é removido por finish():
+    ele recebe a etapa ETAPA_CONCLUIDO e é removido pelo LeaseManager depois
+    de gravar o ``.done``, para que uma queda entre as duas coisas não leve
+    outro nó a reprocessar o arquivo.
+    """
+
+    def __init__(self, caminho, hash_entrada, compartilhado=False):
+        self.caminho = caminho
+        self.hash_entrada = hash_entrada
+        self.compartilhado = compartilhado
+        self.registros = self._load()
+        if self.registros and self.registros[0].get('hash') != hash_entrada:
+            self.reset()
+
+    def _load(self):
+        registros = []
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                linhas = f.readlines()
+        except FileNotFoundError:
+            return registros
+        for linha in linhas:
+            try:
+                registros.append(json.loads(linha))
+            except ValueError:
+                # Última linha incompleta (queda durante a gravação): regrava só os registros válidos
+                get_logger('journal').warning(f"⚠️ Journal {os.path.basename(self.caminho)} com registro "
+                                              f"incompleto; mantidas {len(registros)} etapa(s)")
+                self._rewrite(registros)
+                break
+        return registros
+
+    def _rewrite(self, registros):
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho)
+
+    def append(self, etapa, **dados):
+        """Registra uma etapa concluída e só retorna depois de gravá-la em disco"""
+        registro = {'etapa': etapa, 'hash': self.hash_entrada}
+        registro.update(dados)
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.registros.append(registro)
+        return registro
+
+    def stage(self, etapa):
+        """Último registro da etapa, ou None se ela ainda não foi concluída"""
+        for registro in reversed(self.registros):
+            if registro['etapa'] == etapa:
+                return registro
+        return None
+
+    def outputs_intact(self, registro=None):
+        """Confere se as saídas registradas ainda existem com o mesmo conteúdo"""
+        registro = registro or self.stage(ETAPA_SAIDAS)
+        if registro is None:
+            return False
+        try:
+            return all(hash_file(caminho) == esperado for caminho, esperado in registro['hashes'].items())
+        except OSError:
+            return False
+
+    def _output_hash(self, origem):
+        registro = self.stage(ETAPA_SAIDAS)
+        return registro['hashes'].get(origem) if registro else None
+
+    def copied(self, origem, diretorio):
+        """Indica se esta versão da saída já foi copiada (ou enfileirada) para o diretório"""
+        conteudo = self._output_hash(origem)
+        return any(registro['etapa'] == ETAPA_COPIA and registro['origem'] == origem
+                   and registro['diretorio'] == diretorio and registro['conteudo'] == conteudo
+                   for registro in self.registros)
+
+    def record_copy(self, origem, diretorio):
+        self.append(ETAPA_COPIA, origem=origem, diretorio=diretorio, conteudo=self._output_hash(origem))
+
+    def reset(self):
+        """Descarta o journal (nova entrega ou reprocessamento completo)"""
+        self.registros = []
+        self._remove()
+
+    def finish(self):
+        """Processamento concluído e registrado: o journal não é mais necessário"""
+        if not self.compartilhado:
+            self._remove()
+        elif self.stage(ETAPA_CONCLUIDO) is None:
+            self.append(ETAPA_CONCLUIDO)
+
+    def _remove(self):
+        try:
+            os.remove(self.caminho)
+        except FileNotFoundError:
+            pass
+
+
+def journal_enabled():
+    """JOURNAL=false desativa o journal (padrão: ativo; no modo multi-nó, sempre ativo)"""
+    return multi_node_enabled() or os.getenv('JOURNAL', 'true').lower() == 'true'
+
+
+def open_journal(arquivo, origem=None):
+    """
+    Abre o journal de um arquivo em JOURNAL_DIR (padrão: journal, relativo a este módulo)
+
+    No modo multi-nó o journal fica no diretório de leases do diretório
+    monitorado (cnab_lease.shared_journal_path), visível para todos os nós;
+    se ``arquivo`` é a cópia local de um arquivo do compartilhamento, ``origem``
+    é o caminho original.
+
+    Returns:
+        ProcessingJournal: None se JOURNAL=false ou se o arquivo não puder ser lido
+    """
+    if not journal_enabled():
+        return None
+    try:
+        hash_entrada = hash_file(arquivo)
+    except OSError:
+        return None
+    if multi_node_enabled():
+        return ProcessingJournal(shared_journal_path(origem or arquivo), hash_entrada, compartilhado=True)
+    diretorio = os.getenv('JOURNAL_DIR', 'journal')
+    if not os.path.isabs(diretorio):
+        diretorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), diretorio)
+    return ProcessingJournal(os.path.join(diretorio, f"{os.path.basename(arquivo)}.journal"), hash_entrada)
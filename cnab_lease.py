@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+from cnab_logging import get_logger
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+# Diretório (dentro do diretório monitorado) com leases e marcadores de conclusão
+LEASE_SUBDIR = '.cnab_leases'
+
+
+def multi_node_enabled():
+    """Indica se o modo multi-nó (MULTI_NODE=true) está habilitado"""
+    return os.getenv('MULTI_NODE', 'false').lower() == 'true'
+
+
+def shared_journal_path(arquivo):
+    """
+    Journal de um arquivo no modo multi-nó: no diretório de leases, ao lado do lease
+
+    Um nó que assume o lease de outro que caiu retoma pelo mesmo journal
+    (mesmo timestamp das saídas, cópias já feitas) em vez de reprocessar o
+    arquivo e gerar saídas duplicadas.
+    """
+    return os.path.join(os.path.dirname(arquivo), LEASE_SUBDIR, f"{os.path.basename(arquivo)}.journal")
+
+
+def default_node_id():
+    return os.getenv('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseManager:
+    """
+    Reivindicação de arquivos em um diretório compartilhado por vários nós.
+
+    Cada arquivo é reivindicado criando ``<nome>.lease`` com O_CREAT|O_EXCL no
+    subdiretório .cnab_leases: apenas um nó consegue criar o arquivo. O dono
+    renova o mtime do lease a cada ``heartbeat`` segundos; um lease sem
+    renovação por mais de ``ttl`` segundos é considerado abandonado (nó caiu)
+    e pode ser assumido por outro nó. A conclusão é registrada em
+    ``<nome>.done``, que funciona como registro compartilhado entre os nós;
+    o journal do arquivo (``<nome>.journal``) fica no mesmo diretório e só é
+    removido depois do ``.done``.
+    """
+
+    def __init__(self, directory, node_id=None, ttl=120.0, heartbeat=30.0):
+        self.directory = directory
+        self.lease_dir = os.path.join(directory, LEASE_SUBDIR)
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._ativos = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+
+    def _lease_path(self, filename):
+        return os.path.join(self.lease_dir, f"{filename}.lease")
+
+    def _done_path(self, filename):
+        return os.path.join(self.lease_dir, f"{filename}.done")
+
+    def _create_exclusive(self, path, dados):
+        """Cria um arquivo com O_EXCL; retorna False se já existir"""
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dados, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def _read_token(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('token')
+        except (OSError, ValueError):
+            return None
+
+    def is_done(self, filename):
+        """Verifica no registro compartilhado se o arquivo já foi processado por algum nó"""
+        return os.path.exists(self._done_path(filename))
+
+    def claim(self, filename):
+        """
+        Tenta reivindicar um arquivo para este nó
+
+        Args:
+            filename (str): Nome do arquivo no diretório monitorado
+
+        Returns:
+            bool: True se este nó passou a ser o dono do arquivo
+        """
+        os.makedirs(self.lease_dir, exist_ok=True)
+        if self.is_done(filename):
+            return False
+
+        lease_path = self._lease_path(filename)
+        token = uuid.uuid4().hex
+        dados = {
+            'node': self.node_id,
+            'token': token,
+            'reivindicado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+        if not self._create_exclusive(lease_path, dados):
+            if not self._take_over_stale(filename):
+                return False
+            if not self._create_exclusive(lease_path, dados):
+                return False
+
+        # Outro nó pode ter concluído o arquivo entre a verificação e a criação do lease
+        if self.is_done(filename):
+            self._remove_quietly(lease_path)
+            return False
+
+        with self._lock:
+            self._ativos[filename] = token
+        self._ensure_heartbeat()
+        return True
+
+    def _take_over_stale(self, filename):
+        """
+        Remove um lease abandonado, garantindo que apenas um nó faça a remoção
+
+        O nó que conseguir criar o marcador ``<nome>.lease.<token>.takeover``
+        (O_EXCL) para aquele lease específico é o único autorizado a removê-lo.
+        Um marcador com mais de ``ttl`` segundos é de um nó que caiu no meio da
+        tomada: ele é removido e a criação é tentada de novo.
+        """
+        lease_path = self._lease_path(filename)
+        try:
+            idade = time.time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if idade <= self.ttl:
+            return False
+
+        token_antigo = self._read_token(lease_path)
+        if token_antigo is None:
+            return False
+        marcador = f"{lease_path}.{token_antigo}.takeover"
+        if not self._create_exclusive(marcador, {'node': self.node_id}):
+            if not self._remove_stale(marcador) or not self._create_exclusive(marcador, {'node': self.node_id}):
+                return False
+
+        try:
+            # Confere se o lease ainda é o mesmo que foi considerado abandonado
+            if self._read_token(lease_path) == token_antigo:
+                get_logger('lease').info(f"♻️ Lease abandonado de {filename} assumido por {self.node_id}")
+                self._remove_quietly(lease_path)
+                return True
+            return False
+        finally:
+            self._remove_quietly(marcador)
+
+    def _remove_stale(self, path):
+        """Remove um marcador sem atualização há mais de ``ttl`` segundos; False se ele ainda é recente"""
+        try:
+            if time.time() - os.stat(path).st_mtime <= self.ttl:
+                return False
+        except FileNotFoundError:
+            return True
+        self._remove_quietly(path)
+        return True
+
+    def release(self, filename, done=False):
+        """
+        Libera o lease de um arquivo
+
+        Args:
+            filename (str): Nome do arquivo
+            done (bool): Se True, registra o arquivo como concluído no registro compartilhado
+        """
+        with self._lock:
+            token = self._ativos.pop(filename, None)
+        if token is None:
+            return
+
+        if done:
+            self._create_exclusive(self._done_path(filename), {
+                'node': self.node_id,
+                'token': token,
+                'concluido_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            self._remove_quietly(shared_journal_path(os.path.join(self.directory, filename)))
+        # Só remove o lease se ele ainda for deste nó
+        if self._read_token(self._lease_path(filename)) == token:
+            self._remove_quietly(self._lease_path(filename))
+
+    def _remove_quietly(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _ensure_heartbeat(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='cnab-lease-heartbeat', daemon=True)
+        self._thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._parar.wait(self.heartbeat):
+            with self._lock:
+                ativos = list(self._ativos)
+            for filename in ativos:
+                try:
+                    os.utime(self._lease_path(filename))
+                except OSError as e:
+                    get_logger('lease').warning(f"⚠️ Falha ao renovar lease de {filename}: {str(e)}")
+
+    def stop(self):
+        self._parar.set()
+
+
+_managers = {}
+
+
+def get_lease_manager(directory):
+    """
+    Retorna o LeaseManager de um diretório, criando-o na primeira chamada
+
+    Usa NODE_ID, LEASE_TTL (padrão: 120s) e LEASE_HEARTBEAT (padrão: 30s).
+    """
+    if directory not in _managers:
+        _managers[directory] = LeaseManager(
+            directory,
+            ttl=float(os.getenv('LEASE_TTL', '120')),
+            heartbeat=float(os.getenv('LEASE_HEARTBEAT', '30')),
+        )
+    return _managers[directory]
@@ -0,0 +1,164 @@
+import os
+import sys
+import csv
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Logger raiz do processador; módulos usam get_logger('<nome>') -> 'cnab.<nome>'
+NOME_LOGGER = 'cnab'
+
+_lock = threading.Lock()
+_listener = None
+
+
+def _log_file_path():
+    caminho = os.getenv('LOG_FILE', os.path.join('logs', 'cnab_processor.log'))
+    if not caminho:
+        return None
+    if not os.path.isabs(caminho):
+        caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), caminho)
+    return caminho
+
+
+def setup_logging():
+    """
+    Configura o logger 'cnab' uma única vez
+
+    As mensagens vão para uma fila (QueueHandler) e são gravadas por uma
+    thread (QueueListener) no console (stdout) e no arquivo rotativo LOG_FILE, de modo
+    que quem processa não espera pela escrita. O console mantém o formato
+    das mensagens (sem prefixo); o arquivo recebe data/hora e nível.
+
+    Variáveis: LOG_LEVEL (padrão INFO), LOG_FILE (vazio: sem arquivo),
+    LOG_MAX_BYTES e LOG_BACKUP_COUNT (rotação).
+    """
+    global _listener
+    with _lock:
+        logger = logging.getLogger(NOME_LOGGER)
+        if _listener is not None or logger.handlers:
+            # Já configurado (ou processo de processamento, com setup_worker_logging)
+            return logger
+
+        nivel = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+        console = logging.StreamHandler(sys.stdout)  # mesmo destino das mensagens que usam print
+        console.setFormatter(logging.Formatter('%(message)s'))
+        handlers = [console]
+
+        caminho = _log_file_path()
+        if caminho:
+            try:
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                arquivo = RotatingFileHandler(
+                    caminho,
+                    maxBytes=int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024))),
+                    backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+                    encoding='utf-8',
+                )
+                arquivo.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+                handlers.append(arquivo)
+            except OSError as e:
+                print(f"⚠️ Não foi possível abrir o arquivo de log {caminho}: {str(e)}")
+
+        fila = queue.SimpleQueue()
+        logger.setLevel(nivel)
+        logger.addHandler(QueueHandler(fila))
+        logger.propagate = False
+        _listener = QueueListener(fila, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return logger
+
+
+def setup_worker_logging(fila):
+    """
+    Configura o logger 'cnab' de um processo de processamento (daemon assíncrono)
+
+    As mensagens vão para ``fila`` (multiprocessing) e são gravadas pelos
+    handlers do processo principal (forward_worker_logs): um único processo
+    escreve no console e faz a rotação de LOG_FILE.
+    """
+    global _listener
+    with _lock:
+        logger = logging.getLogger(NOME_LOGGER)
+        if _listener is not None:
+            # Configurado na importação dos módulos: os handlers próprios dão lugar à fila
+            atexit.unregister(_listener.stop)
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO))
+        logger.addHandler(QueueHandler(fila))
+        logger.propagate = False
+        return logger
+
+
+def forward_worker_logs(fila):
+    """
+    Grava com os handlers deste processo as mensagens dos processos de processamento
+
+    Returns:
+        QueueListener: Já iniciado; chame stop() depois de encerrar os processos
+    """
+    setup_logging()
+    ouvinte = QueueListener(fila, *_listener.handlers, respect_handler_level=True)
+    ouvinte.start()
+    return ouvinte
+
+
+def get_logger(nome=None):
+    """Retorna o logger 'cnab' (ou 'cnab.<nome>'), configurando o subsistema na primeira chamada"""
+    setup_logging()
+    return logging.getLogger(f"{NOME_LOGGER}.{nome}" if nome else NOME_LOGGER)
+
+
+class RateLimitedLog:
+    """
+    Avisos por registro com limite por motivo
+
+    Os primeiros ``limite`` avisos de cada motivo são registrados
+    individualmente; os demais são apenas contados e resumidos em uma única
+    mensagem por motivo em ``flush()``.
+    """
+
+    def __init__(self, logger, limite=None):
+        self.logger = logger
+        self.limite = int(os.getenv('LOG_LIMITE_AVISOS_POR_MOTIVO', '20')) if limite is None else limite
+        self.contagem = {}
+
+    def log(self, nivel, motivo, mensagem):
+        quantidade = self.contagem.get(motivo, 0) + 1
+        self.contagem[motivo] = quantidade
+        if quantidade <= self.limite:
+            self.logger.log(nivel, mensagem)
+
+    def suppressed(self):
+        """Quantidade de avisos não registrados individualmente, por motivo"""
+        return {motivo: quantidade - self.limite
+                for motivo, quantidade in self.contagem.items() if quantidade > self.limite}
+
+    def flush(self, nivel=logging.WARNING):
+        for motivo, omitidos in self.suppressed().items():
+            self.logger.log(nivel, f"⚠️ {motivo}: mais {omitidos} ocorrência(s) omitida(s) "
+                                   f"({self.contagem[motivo]} no total)")
+
+
+def write_rejects_file(caminho, linhas_rejeitadas):
+    """
+    Grava as linhas rejeitadas em um arquivo CSV (separador ';'), de uma vez
+
+    Colunas: linha, motivo, detalhe, conteudo.
+
+    Args:
+        caminho (str): Caminho do arquivo _rejeitados
+        linhas_rejeitadas (list): Tuplas (numero_linha, codigo_motivo, detalhe, conteudo)
+    """
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['linha', 'motivo', 'detalhe', 'conteudo'])
+        writer.writerows(linhas_rejeitadas)
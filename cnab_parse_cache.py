@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import struct
+import uuid
+import hashlib
+import threading
+from itertools import compress
+
+import cnab_core
+from cnab_core import (
+    BankConfig, CnabResult, CnabIntegrity, content_hash, decode_cnab_text, detect_layout, filter_cnab, filter_cnab_lines,
+    is_padding_line, iter_classified_lines, _destinations,
+    DESTINO_ALTERADO, DESTINO_NORMAL, DESTINO_ANTECIPADO, DESTINO_TODOS, LAYOUT_CNAB400, TAMANHO_MINIMO_LINHA
+)
+from cnab_logging import get_logger
+
+
+def _code_version():
+    """
+    Versão da classificação em cache: hash do código de cnab_core e deste módulo
+
+    Qualquer mudança na classificação (iter_classified_lines) ou no formato
+    das entradas muda a chave, sem depender de um número mantido à mão. Sem
+    acesso aos fontes, a versão vale só para este processo.
+    """
+    sha = hashlib.sha256()
+    try:
+        for caminho in (cnab_core.__file__, __file__):
+            with open(caminho, 'rb') as f:
+                sha.update(f.read())
+    except OSError:
+        return uuid.uuid4().hex[:12]
+    return sha.hexdigest()[:12]
+
+
+VERSAO_CACHE = _code_version()
+
+# Formato da entrada: MAGICO + tamanho do cabeçalho JSON (uint32) + cabeçalho + um byte por linha
+MAGICO = b'CNPC'
+_TAMANHO_CABECALHO = struct.Struct('<I')
+
+# Códigos por linha: registros de dados são (índice da operação * 2 + 1 se antecipado);
+# linhas em branco depois do trailer usam o código das rejeitadas (nunca vão para as saídas)
+CODIGO_HEADER_TRAILER = 254
+CODIGO_REJEITADA = 255
+MAX_OPERACOES_DISTINTAS = CODIGO_HEADER_TRAILER // 2
+
+# Tabelas de bytes.translate que isolam cada destino de uma máscara DESTINO_*
+_BITS_DESTINO = {
+    destino: bytes(1 if codigo & destino else 0 for codigo in range(256))
+    for destino in (DESTINO_ALTERADO, DESTINO_NORMAL, DESTINO_ANTECIPADO)
+}
+
+_lock = threading.Lock()
+_caches = {}
+
+
+class ParsedColumns:
+    """
+    Classificação de um arquivo CNAB400, independente da configuração
+
+    ``codigos`` tem um byte por linha (header/trailer, rejeitada ou operação
+    + antecipado) e ``meta`` guarda a tabela de operações, os contadores, as
+    linhas rejeitadas e a integridade, ou seja, tudo o que não depende das
+    operações desejadas, da regra ou dos perfis.
+    """
+
+    __slots__ = ('meta', 'codigos')
+
+    def __init__(self, meta, codigos):
+        self.meta = meta
+        self.codigos = codigos
+
+    def to_bytes(self):
+        cabecalho = json.dumps(self.meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return MAGICO + _TAMANHO_CABECALHO.pack(len(cabecalho)) + cabecalho + bytes(self.codigos)
+
+    @classmethod
+    def from_bytes(cls, dados):
+        if dados[:len(MAGICO)] != MAGICO:
+            raise ValueError("entrada de cache inválida")
+        inicio = len(MAGICO) + _TAMANHO_CABECALHO.size
+        (tamanho,) = _TAMANHO_CABECALHO.unpack_from(dados, len(MAGICO))
+        meta = json.loads(dados[inicio:inicio + tamanho].decode('utf-8'))
+        codigos = bytes(dados[inicio + tamanho:])
+        if len(codigos) != meta['total_linhas']:
+            raise ValueError("entrada de cache truncada")
+        return cls(meta, codigos)
+
+
+def split_lines(texto):
+    """Separa o texto em linhas sem '\\n' (mesmo resultado de decode_cnab + rstrip, em nível C)"""
+    if '\r' in texto:
+        texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    linhas = texto.split('\n')
+    if linhas[-1] == '':
+        linhas.pop()
+    return linhas
+
+
+def build_columns(linhas):
+    """
+    Classifica as linhas uma vez, sem filtro, e gera as colunas do cache
+
+    A passada usa o próprio iter_classified_lines (mantendo tudo e separando
+    antecipadas), de modo que contadores, rejeições e integridade são
+    exatamente os da classificação normal.
+
+    Returns:
+        ParsedColumns: None se o arquivo tiver mais operações distintas que MAX_OPERACOES_DISTINTAS
+    """
+    resultado = CnabResult()
+    resultado.totais_titulos = {}
+    # Consome a passada inteira antes: as rejeições e a integridade só ficam completas no final
+    mantidas = iter([destinos for _, destinos in
+                     iter_classified_lines(linhas, BankConfig(separar_antecipacao=True), resultado)])
+    rejeitadas = {rejeitada[0] for rejeitada in resultado.linhas_rejeitadas}
+    # Trailer: última linha significativa (mesma regra de iter_classified_lines)
+    ultima = len(linhas) - 1
+    while ultima >= 0 and len(linhas[ultima]) < TAMANHO_MINIMO_LINHA and is_padding_line(linhas[ultima]):
+        ultima -= 1
+    operacoes = {}
+    codigos = bytearray(len(linhas))
+
+    for i, linha in enumerate(linhas):
+        if i + 1 in rejeitadas or i > ultima:
+            codigos[i] = CODIGO_REJEITADA
+            continue
+        destinos = next(mantidas)
+        if i == 0 or i == ultima:
+            codigos[i] = CODIGO_HEADER_TRAILER
+            continue
+        indice = operacoes.setdefault(linha[108:110].strip(), len(operacoes))
+        if indice >= MAX_OPERACOES_DISTINTAS:
+            return None
+        codigos[i] = indice * 2 + (1 if destinos & DESTINO_ANTECIPADO else 0)
+
+    integridade = resultado.integridade
+    meta = {
+        'versao': VERSAO_CACHE,
+        'operacoes': list(operacoes),
+        'total_linhas': resultado.total_linhas,
+        'linhas_validas': resultado.linhas_validas,
+        'linhas_invalidas': resultado.linhas_invalidas,
+        'contagem_operacoes': resultado.contagem_operacoes,
+        'operacoes_normais': resultado.operacoes_normais,
+        'operacoes_antecipadas': resultado.operacoes_antecipadas,
+        'operacoes_sem_tipo': resultado.operacoes_sem_tipo,
+        'rejeitadas': [list(rejeitada[:3]) for rejeitada in resultado.linhas_rejeitadas],
+        'integridade': {atributo: getattr(integridade, atributo) for atributo in CnabIntegrity.__slots__},
+        'totais': [list(chave) + total for chave, total in resultado.totais_titulos.items()],
+    }
+    return ParsedColumns(meta, bytes(codigos))
+
+
+def _apply_route(linhas, colunas, config, resultado):
+    """Preenche as saídas de ``resultado`` aplicando a configuração como máscara sobre as colunas"""
+    antecipado, normal = _destinations(config)
+    operacoes = config.operations
+    tabela = bytearray(256)
+    tabela[CODIGO_HEADER_TRAILER] = DESTINO_TODOS
+    for indice, codigo_operacao in enumerate(colunas.meta['operacoes']):
+        if not operacoes or not codigo_operacao or codigo_operacao in operacoes:
+            tabela[indice * 2] = normal
+            tabela[indice * 2 + 1] = antecipado
+    mascara = colunas.codigos.translate(tabela)
+
+    if config.rule is not None:
+        # A regra só é avaliada nos registros de dados que passaram pelo código da operação
+        regra = config.rule
+        mascara = bytearray(mascara)
+        candidatos = bytes(1 if tabela[codigo] and codigo != CODIGO_HEADER_TRAILER else 0 for codigo in range(256))
+        for i in compress(range(len(linhas)), colunas.codigos.translate(candidatos)):
+            if not regra(linhas[i]):
+                mascara[i] = 0
+
+    resultado.linhas_alteradas.extend(compress(linhas, mascara.translate(_BITS_DESTINO[DESTINO_ALTERADO])))
+    resultado.linhas_normais.extend(compress(linhas, mascara.translate(_BITS_DESTINO[DESTINO_NORMAL])))
+    resultado.linhas_antecipadas.extend(compress(linhas, mascara.translate(_BITS_DESTINO[DESTINO_ANTECIPADO])))
+    resultado.linhas_mantidas = len(mascara) - mascara.count(0)
+
+
+def apply_columns(linhas, colunas, config, resultado, perfis=None):
+    """
+    Monta o resultado da filtragem a partir das colunas em cache, sem reclassificar
+
+    Equivale a filter_cnab_lines para arquivos CNAB400: contadores,
+    rejeições e integridade vêm do cache; as saídas (principal e perfis) são
+    máscaras sobre os códigos por linha.
+    """
+    meta = colunas.meta
+    for atributo in ('total_linhas', 'linhas_validas', 'linhas_invalidas', 'contagem_operacoes',
+                     'operacoes_normais', 'operacoes_antecipadas', 'operacoes_sem_tipo'):
+        setattr(resultado, atributo, meta[atributo])
+    resultado.primeira_linha = linhas[0] if linhas else ''
+    resultado.linhas_rejeitadas = [(numero, motivo, detalhe, linhas[numero - 1])
+                                   for numero, motivo, detalhe in meta['rejeitadas']]
+    for atributo, valor in meta['integridade'].items():
+        setattr(resultado.integridade, atributo, valor)
+    if resultado.totais_titulos is not None:
+        resultado.totais_titulos = {(operacao, tipo, vencimento): [centavos, quantidade]
+                                    for operacao, tipo, vencimento, centavos, quantidade in meta['totais']}
+
+    _apply_route(linhas, colunas, config, resultado)
+    for perfil in perfis or ():
+        resultado_perfil = CnabResult(resultado.banco, perfil.nome)
+        resultado.perfis[perfil.nome] = resultado_perfil
+        _apply_route(linhas, colunas, perfil.config, resultado_perfil)
+    return resultado
+
+
+class ParseCache:
+    """
+    Cache persistente da classificação, com chave pelo conteúdo do arquivo
+
+    A chave é o SHA-256 dos bytes do arquivo mais o layout e VERSAO_CACHE (hash do código);
+    cada entrada é um arquivo <chave>.bin em ``diretorio``. A leitura atualiza
+    a data de modificação da entrada e, ao gravar, as entradas menos usadas
+    recentemente são removidas até o total caber em ``limite_bytes`` (LRU).
+    """
+
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+
+    def key(self, conteudo):
+        """Chave da entrada; ``conteudo`` é o SHA-256 (hex) dos bytes do arquivo"""
+        return f"{conteudo}_{LAYOUT_CNAB400.lower()}_{TAMANHO_MINIMO_LINHA}_v{VERSAO_CACHE}"
+
+    def _path(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.bin")
+
+    def load(self, chave):
+        """Retorna as colunas da chave (ou None); entradas ilegíveis são descartadas"""
+        caminho = self._path(chave)
+        try:
+            with open(caminho, 'rb') as f:
+                colunas = ParsedColumns.from_bytes(f.read())
+            os.utime(caminho)
+        except FileNotFoundError:
+            self.faltas += 1
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            get_logger('parse_cache').warning(f"⚠️ Entrada de cache descartada ({chave}): {str(e)}")
+            self._remove(caminho)
+            self.faltas += 1
+            return None
+        self.acertos += 1
+        return colunas
+
+    def store(self, chave, colunas):
+        """Grava a entrada de forma atômica e aplica o limite de tamanho"""
+        caminho = self._path(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            with open(temporario, 'wb') as f:
+                f.write(colunas.to_bytes())
+            os.replace(temporario, caminho)
+        except OSError as e:
+            get_logger('parse_cache').warning(f"⚠️ Não foi possível gravar o cache de classificação: {str(e)}")
+            self._remove(temporario)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove as entradas usadas há mais tempo até o total caber no limite"""
+        with self._lock:
+            entradas = []
+            try:
+                with os.scandir(self.diretorio) as itens:
+                    for item in itens:
+                        if item.name.endswith('.bin'):
+                            try:
+                                info = item.stat()
+                            except FileNotFoundError:
+                                continue
+                            entradas.append((info.st_mtime, info.st_size, item.path))
+            except FileNotFoundError:
+                return
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.limite_bytes:
+                    break
+                self._remove(caminho)
+                total -= tamanho
+
+    @staticmethod
+    def _remove(caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def get_parse_cache():
+    """
+    Retorna o cache de classificação se PARSE_CACHE=true; senão None
+
+    Diretório em PARSE_CACHE_DIR (padrão: cache/parse, relativo a este
+    módulo) e limite em PARSE_CACHE_MAX_MB (padrão: 256).
+    """
+    if os.getenv('PARSE_CACHE', 'false').lower() != 'true':
+        return None
+    diretorio = os.getenv('PARSE_CACHE_DIR', os.path.join('cache', 'parse'))
+    if not os.path.isabs(diretorio):
+        diretorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), diretorio)
+    with _lock:
+        if diretorio not in _caches:
+            limite = float(os.getenv('PARSE_CACHE_MAX_MB', '256'))
+            _caches[diretorio] = ParseCache(diretorio, int(limite * 1024 * 1024))
+        return _caches[diretorio]
+
+
+def filter_cnab_cached(data, config, perfis=None, cache=None, totais=False):
+    """
+    Mesmo resultado de cnab_core.filter_cnab, reaproveitando a classificação em cache
+
+    Na primeira vez que um conteúdo é visto, as linhas são classificadas sem
+    filtro e as colunas são gravadas no cache; a partir daí, qualquer
+    configuração (operações, separação, regra, perfis) é aplicada como
+    máscara, sem reclassificar. Arquivos CNAB240 (títulos com vários
+    segmentos e trailers reconstruídos) e o uso sem cache seguem o caminho
+    normal.
+
+    Args:
+        data (bytes | objeto com read()): Conteúdo do arquivo
+        config (BankConfig): Configuração compilada do banco
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile)
+        cache (ParseCache, optional): Cache a usar (padrão: get_parse_cache())
+        totais (bool, optional): Preenche ``hash_conteudo`` e ``totais_titulos`` (agregados);
+            os totais também ficam no cache
+
+    Returns:
+        CnabResult: Resultado com as linhas de cada saída, contadores e tempos
+    """
+    cache = cache or get_parse_cache()
+    if hasattr(data, 'read'):
+        data = data.read()
+    if cache is None or isinstance(data, str):
+        return filter_cnab(data, config, perfis, totais)
+
+    resultado = CnabResult(config.banco)
+    hash_conteudo = content_hash(data)
+    if totais:
+        resultado.hash_conteudo, resultado.totais_titulos = hash_conteudo, {}
+    inicio = time.perf_counter()
+    texto, resultado.encoding = decode_cnab_text(data)
+    linhas = split_lines(texto)
+    resultado.tempo_decodificacao = time.perf_counter() - inicio
+    if not linhas or detect_layout(linhas[0]) != LAYOUT_CNAB400:
+        return filter_cnab_lines(linhas, config, resultado, perfis)
+
+    inicio = time.perf_counter()
+    chave = cache.key(hash_conteudo)
+    colunas = cache.load(chave)
+    resultado.cache_classificacao = 'acerto'
+    if colunas is None:
+        resultado.cache_classificacao = 'falta'
+        colunas = build_columns(linhas)
+        if colunas is None:
+            resultado.cache_classificacao = None
+            return filter_cnab_lines(linhas, config, resultado, perfis)
+        cache.store(chave, colunas)
+
+    try:
+        apply_columns(linhas, colunas, config, resultado, perfis)
+    except Exception as e:
+        get_logger('parse_cache').warning(f"⚠️ Cache de classificação não aplicado, reclassificando: {str(e)}")
+        novo = CnabResult(config.banco)
+        novo.encoding, novo.tempo_decodificacao = resultado.encoding, resultado.tempo_decodificacao
+        if totais:
+            novo.hash_conteudo, novo.totais_titulos = hash_conteudo, {}
+        return filter_cnab_lines(linhas, config, novo, perfis)
+
+    resultado.tempo_classificacao = time.perf_counter() - inicio
+    for resultado_perfil in resultado.perfis.values():
+        resultado_perfil.share_counters(resultado)
+    return resultado
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: sem getrusage (psutil, se instalado, cobre RSS e handles)
+
+from cnab_logging import get_logger
+from cnab_compression import uncompressed_size
+
+# Memória usada no processamento por byte do arquivo .RET (medido: ~6x na classificação,
+# folga para gravação das saídas e planilhas)
+FATOR_MEMORIA_ARQUIVO_PADRAO = 8.0
+
+# Decisões do orçamento de memória
+ACAO_ADIAR = 'adiar'
+ACAO_RECUSAR = 'recusar'
+
+_metrics_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """PROFILING=true ativa a coleta de recursos por arquivo e por ciclo de varredura"""
+    return os.getenv('PROFILING', 'false').lower() == 'true'
+
+
+def current_rss_kb():
+    """Memória residente atual do processo (KB), ou None se não for possível medir"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_kb():
+    """Pico de memória residente do processo desde o início (KB), ou None"""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 1024 if sys.platform == 'darwin' else pico  # macOS informa em bytes
+    if psutil is not None:
+        memoria = psutil.Process().memory_info()
+        return getattr(memoria, 'peak_wset', memoria.rss) / 1024
+    return None
+
+
+def open_fds():
+    """Descritores (ou handles, no Windows) abertos pelo processo, ou None"""
+    if psutil is not None:
+        processo = psutil.Process()
+        return processo.num_fds() if hasattr(processo, 'num_fds') else processo.num_handles()
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def _metrics_path():
+    caminho = os.getenv('PROFILING_METRICS_FILE', os.path.join('logs', 'metricas.jsonl'))
+    if caminho and not os.path.isabs(caminho):
+        caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), caminho)
+    return caminho
+
+
+def record_metrics(tipo, dados):
+    """Acrescenta uma linha JSON ao arquivo PROFILING_METRICS_FILE (vazio: não grava)"""
+    caminho = _metrics_path()
+    if not caminho:
+        return
+    registro = {'tipo': tipo, 'momento': datetime.now().isoformat(timespec='seconds')}
+    registro.update(dados)
+    try:
+        with _metrics_lock:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    except OSError as e:
+        get_logger('profiling').warning(f"⚠️ Não foi possível gravar métricas em {caminho}: {str(e)}")
+
+
+class FileProfile:
+    """
+    Recursos usados no processamento de um arquivo
+
+    Registra RSS atual/pico e descritores abertos no início e no fim e, com
+    PROFILING_TRACEMALLOC=true, o pico de alocações Python e as maiores
+    alocações ainda retidas no fim do arquivo (PROFILING_TOP_ALOCACOES
+    linhas; o que cresce de um arquivo para outro indica vazamento). O
+    tracemalloc é global ao processo: com vários arquivos em paralelo os
+    valores se misturam.
+    """
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.tamanho = os.path.getsize(arquivo) if os.path.exists(arquivo) else 0
+        self.inicio = time.perf_counter()
+        self.rss_inicio = current_rss_kb()
+        self.pico_inicio = peak_rss_kb()
+        self.fds_inicio = open_fds()
+        self.dados = None
+
+        self.tracemalloc = os.getenv('PROFILING_TRACEMALLOC', 'false').lower() == 'true'
+        self._iniciou_tracemalloc = False
+        if self.tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._iniciou_tracemalloc = True
+            tracemalloc.reset_peak()
+
+    def stop(self, sucesso=True):
+        """
+        Encerra a medição, grava a linha de métricas e retorna os dados coletados
+
+        Só a primeira chamada mede; sucesso=False marca o arquivo como não
+        concluído (quarentena ou erro) na linha de métricas.
+        """
+        if self.dados is not None:
+            return self.dados
+        rss_fim = current_rss_kb()
+        pico = peak_rss_kb()
+        if pico is not None and rss_fim is not None:
+            pico = max(pico, rss_fim)  # ru_maxrss pode ainda não refletir a última medição
+        dados = {
+            'arquivo': os.path.basename(self.arquivo),
+            'sucesso': sucesso,
+            'tamanho_kb': round(self.tamanho / 1024, 2),
+            'segundos': round(time.perf_counter() - self.inicio, 3),
+            'rss_inicio_kb': self.rss_inicio,
+            'rss_fim_kb': rss_fim,
+            'pico_rss_kb': pico,
+            'pico_rss_inicio_kb': self.pico_inicio,
+            'fds_inicio': self.fds_inicio,
+            'fds_fim': open_fds(),
+        }
+        if self.tracemalloc and tracemalloc.is_tracing():
+            _, pico = tracemalloc.get_traced_memory()
+            limite = int(os.getenv('PROFILING_TOP_ALOCACOES', '5'))
+            estatisticas = tracemalloc.take_snapshot().statistics('lineno')[:limite]
+            dados['pico_tracemalloc_kb'] = round(pico / 1024, 1)
+            dados['maiores_alocacoes'] = [
+                {'local': f"{os.path.basename(e.traceback[0].filename)}:{e.traceback[0].lineno}",
+                 'kb': round(e.size / 1024, 1), 'blocos': e.count}
+                for e in estatisticas
+            ]
+            if self._iniciou_tracemalloc:
+                tracemalloc.stop()
+        self.dados = dados
+        record_metrics('arquivo', dados)
+        return dados
+
+    def report_lines(self):
+        """Linhas para a seção de recursos do relatório"""
+        dados = self.stop()
+        linhas = []
+        if dados['rss_fim_kb'] is not None:
+            linhas.append(f"  • Memória residente: {dados['rss_fim_kb'] / 1024:.1f} MB "
+                          f"(início {(dados['rss_inicio_kb'] or 0) / 1024:.1f} MB)")
+        if dados['pico_rss_kb'] is not None:
+            aumento = dados['pico_rss_kb'] - (dados['pico_rss_inicio_kb'] or 0)
+            linhas.append(f"  • Pico de memória do processo: {dados['pico_rss_kb'] / 1024:.1f} MB "
+                          f"(+{aumento / 1024:.1f} MB neste arquivo)")
+        if dados['fds_fim'] is not None:
+            linhas.append(f"  • Descritores abertos: {dados['fds_fim']} (início {dados['fds_inicio']})")
+        if 'pico_tracemalloc_kb' in dados:
+            linhas.append(f"  • Pico de alocações Python: {dados['pico_tracemalloc_kb'] / 1024:.1f} MB; "
+                          f"maiores alocações retidas:")
+            for alocacao in dados['maiores_alocacoes']:
+                linhas.append(f"      - {alocacao['local']}: {alocacao['kb'] / 1024:.2f} MB ({alocacao['blocos']} blocos)")
+        return linhas
+
+
+def start_file_profile(arquivo):
+    """Inicia a medição de um arquivo se PROFILING=true; senão retorna None"""
+    return FileProfile(arquivo) if profiling_enabled() else None
+
+
+def record_scan_cycle(diretorio, segundos, arquivos):
+    """Registra o custo de um ciclo de varredura (tempo, arquivos encontrados, RSS e descritores)"""
+    if not profiling_enabled():
+        return
+    dados = {
+        'diretorio': diretorio,
+        'segundos': round(segundos, 4),
+        'arquivos': arquivos,
+        'rss_kb': current_rss_kb(),
+        'fds': open_fds(),
+    }
+    record_metrics('varredura', dados)
+    get_logger('profiling').debug(f"🔎 Varredura de {diretorio}: {arquivos} arquivo(s) em {segundos * 1000:.1f} ms")
+
+
+def predict_memory_mb(tamanho_bytes):
+    """Memória prevista para processar um arquivo do tamanho informado (MEMORIA_FATOR_ARQUIVO x tamanho)"""
+    fator = float(os.getenv('MEMORIA_FATOR_ARQUIVO', str(FATOR_MEMORIA_ARQUIVO_PADRAO)))
+    return tamanho_bytes * fator / (1024 * 1024)
+
+
+def check_memory_budget(arquivo):
+    """
+    Compara a memória prevista para o arquivo com MEMORIA_ORCAMENTO_MB
+
+    Se a previsão sozinha excede o orçamento, o arquivo é recusado. Se só
+    excede somada à memória residente atual do processo, ele é adiado para
+    o próximo ciclo. Com MEMORIA_ORCAMENTO_MB=0 (padrão) não há verificação.
+    Para arquivos compactados vale o tamanho descompactado.
+
+    Returns:
+        tuple: (str ou None, str) - (ACAO_ADIAR, ACAO_RECUSAR ou None; mensagem)
+    """
+    orcamento = float(os.getenv('MEMORIA_ORCAMENTO_MB', '0') or 0)
+    if orcamento <= 0:
+        return None, ''
+    previsto = predict_memory_mb(uncompressed_size(arquivo))
+    if previsto > orcamento:
+        return ACAO_RECUSAR, (f"Memória prevista {previsto:.1f} MB excede o orçamento de "
+                              f"{orcamento:.1f} MB (MEMORIA_ORCAMENTO_MB)")
+    rss = current_rss_kb()
+    if rss is not None and rss / 1024 + previsto > orcamento:
+        return ACAO_ADIAR, (f"Memória prevista {previsto:.1f} MB + {rss / 1024:.1f} MB em uso excede o "
+                            f"orçamento de {orcamento:.1f} MB; arquivo adiado para o próximo ciclo")
+    return None, ''
@@ -0,0 +1,289 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from cnab_core import BankConfig, filter_cnab
+from cnab_banks import detect_file_bank
+from cnab_config import get_config
+from cnab_compression import open_cnab_input
+from process_cnab import should_process_file, write_cnab_outputs, list_output_files
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+# Timestamp fixo dos arquivos gerados no replay (nomes iguais entre execuções)
+TIMESTAMP_REPLAY = '20000101000000'
+
+# Abaixo deste tempo (segundos) a comparação de desempenho é só ruído
+TEMPO_MINIMO_COMPARACAO = 0.05
+
+
+def hash_output(caminho):
+    """
+    Hash SHA-256 de uma saída
+
+    Planilhas .xlsx são comparadas pelo conteúdo das células (o arquivo
+    em si muda a cada geração por causa dos metadados de data).
+    """
+    sha = hashlib.sha256()
+    if caminho.lower().endswith('.xlsx') and openpyxl is not None:
+        workbook = openpyxl.load_workbook(caminho, read_only=True)
+        try:
+            for planilha in workbook.worksheets:
+                sha.update(planilha.title.encode('utf-8'))
+                for linha in planilha.iter_rows(values_only=True):
+                    sha.update(repr(linha).encode('utf-8'))
+        finally:
+            workbook.close()
+        return sha.hexdigest()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+@contextlib.contextmanager
+def _silenced():
+    """Sem as mensagens do processamento (print e logger 'cnab') enquanto um arquivo é reprocessado"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        logging.disable(logging.CRITICAL)
+        try:
+            yield
+        finally:
+            logging.disable(logging.NOTSET)
+
+
+def replay_file(arquivo, pasta_saida, repeticoes=1):
+    """
+    Reprocessa um arquivo do corpus em uma pasta de trabalho e calcula o hash de cada saída
+
+    Usa a mesma configuração (.env) e o mesmo caminho de gravação de
+    process_cnab_file (write_cnab_outputs, inclusive perfis e CSV/XLS), mas
+    sem backup, relatório, cópias, quarentena nem registro em processed_files.md.
+    A classificação é sempre refeita (cnab_core.filter_cnab, sem o cache de
+    classificação), para que o replay confira o código atual.
+
+    Returns:
+        dict: arquivo, banco, bytes, segundos (melhor de ``repeticoes``), saidas {nome: hash},
+            integridade (divergências) e erro (None se ok)
+    """
+    nome = os.path.basename(arquivo)
+    pasta = os.path.join(pasta_saida, os.path.splitext(nome)[0])
+    os.makedirs(pasta, exist_ok=True)
+    copia = os.path.join(pasta, nome)
+    shutil.copy2(arquivo, copia)
+
+    config = get_config()
+    banco = detect_file_bank(arquivo).banco
+    config_banco = config.enabled_bank(banco) or BankConfig(banco or 'DESCONHECIDO')
+    perfis = config.profiles_for(banco) if config.enabled_bank(banco) else []
+    dados = {'arquivo': nome, 'banco': banco, 'bytes': os.path.getsize(arquivo), 'segundos': None,
+             'saidas': {}, 'integridade': [], 'erro': None}
+
+    try:
+        with _silenced():
+            for _ in range(max(1, repeticoes)):
+                inicio = time.perf_counter()
+                with open_cnab_input(copia) as f:
+                    resultado = filter_cnab(f.read(), config_banco, perfis)
+                saidas = [write_cnab_outputs(copia, resultado, config_banco.separar_antecipacao,
+                                             TIMESTAMP_REPLAY, [], trailer_totais=config_banco.trailer_totais)[0]]
+                for perfil in perfis:
+                    saidas.append(write_cnab_outputs(
+                        copia, resultado.perfis[perfil.nome], perfil.config.separar_antecipacao,
+                        TIMESTAMP_REPLAY, [], perfil=perfil.nome, output_format=perfil.formato,
+                        trailer_totais=config_banco.trailer_totais)[0])
+                segundos = time.perf_counter() - inicio
+                dados['segundos'] = segundos if dados['segundos'] is None else min(dados['segundos'], segundos)
+        dados['integridade'] = resultado.integridade.errors(config_banco.trailer_totais)
+        for saidas_atuais in saidas:
+            for _, caminho in list_output_files(saidas_atuais):
+                dados['saidas'][os.path.basename(caminho)] = hash_output(caminho)
+    except Exception as e:
+        dados['erro'] = f"{type(e).__name__}: {str(e)}"
+    return dados
+
+
+def list_corpus(diretorio):
+    """Arquivos .RET originais do corpus (mesmo filtro da varredura), em ordem de nome"""
+    return sorted(
+        os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+        if os.path.isfile(os.path.join(diretorio, nome)) and should_process_file(nome)
+    )
+
+
+def run_replay(arquivos, pasta_saida, workers=None, repeticoes=1):
+    """
+    Reprocessa os arquivos em paralelo (um processo por worker)
+
+    Returns:
+        dict: {nome do arquivo: resultado de replay_file}
+    """
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [executor.submit(replay_file, arquivo, pasta_saida, repeticoes) for arquivo in arquivos]
+        for futuro in as_completed(futuros):
+            dados = futuro.result()
+            resultados[dados['arquivo']] = dados
+    return resultados
+
+
+def compare_with_baseline(resultados, baseline, tolerancia=1.5):
+    """
+    Compara hashes e desempenho com a baseline
+
+    Returns:
+        tuple: (list, list) - (divergências de saída, regressões de desempenho); cada item é (arquivo, mensagem)
+    """
+    divergencias = []
+    lentos = []
+    anteriores = baseline.get('arquivos', {})
+
+    for nome, dados in sorted(resultados.items()):
+        if dados['erro']:
+            divergencias.append((nome, f"erro no reprocessamento: {dados['erro']}"))
+            continue
+        anterior = anteriores.get(nome)
+        if anterior is None:
+            divergencias.append((nome, "arquivo novo (não está na baseline)"))
+            continue
+        saidas_anteriores = anterior.get('saidas', {})
+        for saida in sorted(set(saidas_anteriores) | set(dados['saidas'])):
+            if saida not in dados['saidas']:
+                divergencias.append((nome, f"{saida}: não foi gerado"))
+            elif saida not in saidas_anteriores:
+                divergencias.append((nome, f"{saida}: saída nova"))
+            elif saidas_anteriores[saida] != dados['saidas'][saida]:
+                divergencias.append((nome, f"{saida}: conteúdo diferente"))
+        if anterior.get('integridade', []) != dados['integridade']:
+            divergencias.append((nome, f"integridade mudou: {'; '.join(dados['integridade']) or 'ok'}"))
+
+        segundos_anterior = anterior.get('segundos')
+        if (segundos_anterior and dados['segundos'] > TEMPO_MINIMO_COMPARACAO
+                and dados['segundos'] > segundos_anterior * tolerancia):
+            lentos.append((nome, f"{dados['segundos']:.3f}s (baseline {segundos_anterior:.3f}s, "
+                                 f"{dados['segundos'] / segundos_anterior:.2f}x)"))
+
+    for nome in sorted(set(anteriores) - set(resultados)):
+        divergencias.append((nome, "arquivo da baseline não está no corpus"))
+    return divergencias, lentos
+
+
+def _throughput(dados):
+    if not dados or not dados.get('segundos'):
+        return None
+    return dados['bytes'] / dados['segundos'] / (1024 * 1024)
+
+
+def format_report(resultados, baseline):
+    """Tabela de throughput por arquivo (MB/s), lado a lado com a baseline"""
+    anteriores = baseline.get('arquivos', {})
+    linhas = [f"{'Arquivo':<40} {'Banco':<10} {'KB':>9} {'MB/s':>8} {'Baseline':>9} {'Variação':>9}"]
+    for nome, dados in sorted(resultados.items()):
+        atual = _throughput(dados)
+        anterior = _throughput(anteriores.get(nome))
+        variacao = f"{(atual / anterior - 1) * 100:+.1f}%" if atual and anterior else '-'
+        linhas.append(f"{nome[:40]:<40} {str(dados['banco'] or '-'):<10} {dados['bytes'] / 1024:>9.1f} "
+                      f"{(f'{atual:.2f}' if atual else '-'):>8} {(f'{anterior:.2f}' if anterior else '-'):>9} "
+                      f"{variacao:>9}")
+    return '\n'.join(linhas)
+
+
+def load_baseline(caminho):
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(caminho, resultados):
+    baseline = {
+        'gerada_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'versao_config': get_config().version,
+        'arquivos': {nome: resultados[nome] for nome in sorted(resultados)},
+    }
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=1)
+    os.replace(temporario, caminho)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reprocessa um corpus de arquivos .RET e compara as saídas e o desempenho com uma baseline")
+    parser.add_argument('corpus', nargs='?', default=os.getenv('LOCAL_CNAB_DIR', 'cnab'),
+                        help="Diretório com os arquivos .RET originais (padrão: LOCAL_CNAB_DIR)")
+    parser.add_argument('--baseline', default=os.getenv('REPLAY_BASELINE', 'replay_baseline.json'),
+                        help="Arquivo JSON da baseline")
+    parser.add_argument('--atualizar', action='store_true', help="Grava o resultado desta execução como baseline")
+    parser.add_argument('--saida', help="Pasta de trabalho (padrão: pasta temporária, removida no fim)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos em paralelo (padrão: CPUs)")
+    parser.add_argument('--repeticoes', type=int, default=1, help="Execuções por arquivo; vale o melhor tempo")
+    parser.add_argument('--tolerancia', type=float, default=float(os.getenv('REPLAY_TOLERANCIA', '1.5')),
+                        help="Fator de tempo acima da baseline considerado regressão (padrão 1.5)")
+    parser.add_argument('--falhar-desempenho', action='store_true',
+                        help="Retorna erro também quando houver regressão de desempenho")
+    args = parser.parse_args()
+
+    arquivos = list_corpus(args.corpus)
+    if not arquivos:
+        print(f"⚠️ Nenhum arquivo .RET encontrado em {args.corpus}")
+        return 1
+
+    pasta_saida = args.saida or tempfile.mkdtemp(prefix='cnab_replay_')
+    os.makedirs(pasta_saida, exist_ok=True)
+    print(f"🔁 Reprocessando {len(arquivos)} arquivo(s) de {args.corpus} em {pasta_saida}")
+    inicio = time.perf_counter()
+    try:
+        resultados = run_replay(arquivos, pasta_saida, args.workers, args.repeticoes)
+    finally:
+        if not args.saida:
+            shutil.rmtree(pasta_saida, ignore_errors=True)
+    decorrido = time.perf_counter() - inicio
+
+    baseline = load_baseline(args.baseline)
+    print(format_report(resultados, baseline))
+    total_mb = sum(dados['bytes'] for dados in resultados.values()) / (1024 * 1024)
+    print(f"\n⏱️ {total_mb:.1f} MB em {decorrido:.2f}s ({total_mb / decorrido:.2f} MB/s no total)")
+
+    if args.atualizar:
+        save_baseline(args.baseline, resultados)
+        print(f"💾 Baseline gravada em {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"⚠️ Baseline {args.baseline} não encontrada; use --atualizar para criá-la")
+        return 1
+
+    if baseline.get('versao_config') != get_config().version:
+        print(f"⚠️ Configuração diferente da baseline ({baseline.get('versao_config')} -> {get_config().version})")
+    divergencias, lentos = compare_with_baseline(resultados, baseline, args.tolerancia)
+    for nome, mensagem in divergencias:
+        print(f"❌ {nome}: {mensagem}")
+    for nome, mensagem in lentos:
+        print(f"🐢 {nome}: {mensagem}")
+    if not divergencias and not lentos:
+        print("✅ Saídas idênticas à baseline e sem regressão de desempenho")
+    if divergencias or (lentos and args.falhar_desempenho):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
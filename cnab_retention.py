@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import glob
+import fnmatch
+import zipfile
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from dotenv import load_dotenv
+
+from cnab_logging import get_logger
+from cnab_compression import is_cnab_name
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+# Arquivo de índice do arquivamento (uma linha JSON por arquivo arquivado)
+NOME_INDICE = 'indice.jsonl'
+
+# Extensões arquivadas além dos .RET (puros ou compactados): planilhas, rejeitados e relatórios
+EXTENSOES_ARQUIVAVEIS = ('.csv', '.xlsx', '.txt')
+
+# Bloco de leitura/gravação do arquivamento (unidade do limite de I/O)
+TAMANHO_BLOCO = 256 * 1024
+
+# Intervalo de verificação enquanto há processamento em andamento
+ESPERA_PROCESSAMENTO = 1.0
+
+# Processamentos em andamento neste processo (o arquivamento aguarda enquanto houver algum)
+_ativos = 0
+_ativos_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def live_processing():
+    """Marca um processamento em andamento: o arquivamento em segundo plano pausa até ele terminar"""
+    global _ativos
+    with _ativos_lock:
+        _ativos += 1
+    try:
+        yield
+    finally:
+        with _ativos_lock:
+            _ativos -= 1
+
+
+def processing_active():
+    return _ativos > 0
+
+
+class IoThrottle:
+    """
+    Limita a taxa de I/O do arquivamento (bytes por segundo; 0 = sem limite)
+
+    Antes de cada bloco, também aguarda enquanto houver processamento em
+    andamento, para não disputar disco com os arquivos novos.
+    """
+
+    def __init__(self, bytes_por_segundo=0, parar=None):
+        self.bytes_por_segundo = bytes_por_segundo
+        self.parar = parar
+        self._inicio = time.monotonic()
+        self._bytes = 0
+
+    def consume(self, quantidade):
+        while processing_active() and not (self.parar and self.parar.is_set()):
+            time.sleep(ESPERA_PROCESSAMENTO)
+            self._inicio, self._bytes = time.monotonic(), 0
+        if self.bytes_por_segundo <= 0:
+            return
+        self._bytes += quantidade
+        adiantado = self._bytes / self.bytes_por_segundo - (time.monotonic() - self._inicio)
+        if adiantado > 0:
+            time.sleep(adiantado)
+
+    def copy(self, entrada, saida):
+        for bloco in iter(lambda: entrada.read(TAMANHO_BLOCO), b''):
+            self.consume(len(bloco))
+            saida.write(bloco)
+
+
+def archive_dir():
+    """Diretório dos arquivos mensais (RETENCAO_DIR, padrão: arquivo, relativo a este módulo)"""
+    diretorio = os.getenv('RETENCAO_DIR', 'arquivo')
+    if not os.path.isabs(diretorio):
+        diretorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), diretorio)
+    return diretorio
+
+
+def default_directories():
+    """Diretórios arquivados: LOCAL_CNAB_DIR, a pasta de backups cnab, REPORTS_DIR e NETWORK_STAGING_DIR"""
+    base = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(base, os.getenv('LOCAL_CNAB_DIR', 'cnab')), os.path.join(base, 'cnab'),
+            os.path.join(base, os.getenv('REPORTS_DIR', 'reports')),
+            os.path.join(base, os.getenv('NETWORK_STAGING_DIR', 'entrada_rede'))]
+
+
+def _crc32(caminho):
+    crc = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            crc = zlib.crc32(bloco, crc)
+    return crc
+
+
+def is_archivable(nome, is_processed=None):
+    """
+    Indica se um arquivo dos diretórios monitorados pode ir para o arquivo
+
+    Saídas, backups e cópias com timestamp (nome com '_'), planilhas,
+    rejeitados e relatórios; um .RET original só depois de registrado como
+    processado. Temporários (.tmp) nunca.
+    """
+    if nome.endswith('.tmp'):
+        return False
+    if not (is_cnab_name(nome) or os.path.splitext(nome)[1].lower() in EXTENSOES_ARQUIVAVEIS):
+        return False
+    return '_' in nome or bool(is_processed and is_processed(nome))
+
+
+class RetentionArchive:
+    """
+    Arquivamento por mês dos arquivos antigos dos diretórios monitorados
+
+    Arquivos com mais de ``dias`` dias (pela data de modificação) são
+    movidos para um segmento do mês, ``<diretorio>/<AAAA-MM>.<NNN>.zip``
+    (membro ``<pasta de origem>/<nome>``), e registrados em
+    ``indice.jsonl``, que aponta o zip de cada arquivo sem abrir os zips.
+    Cada passada grava um segmento novo, em um .tmp trocado por renomeação,
+    e nunca regrava os anteriores: o custo de uma passada é proporcional ao
+    que ela arquiva, não ao tamanho do mês. Só depois da renomeação o
+    índice é atualizado e os originais são removidos. Depois de uma queda,
+    os arquivos que já estão em um segmento do mês (mesmo tamanho e CRC)
+    são apenas indexados e removidos. Um arquivo com o mesmo membro de outro
+    já arquivado, mas com outro conteúdo (ex: nova entrega com o mesmo nome),
+    vai como ``<pasta>/<nome>.<crc32>.<extensão>``; o índice guarda o nome
+    original, usado na extração.
+    """
+
+    def __init__(self, diretorio, dias, throttle=None):
+        self.diretorio = diretorio
+        self.dias = dias
+        self.throttle = throttle or IoThrottle()
+        self.indice = os.path.join(diretorio, NOME_INDICE)
+
+    def load_index(self):
+        """Registros do índice; uma última linha incompleta (queda durante a gravação) é ignorada"""
+        registros = []
+        try:
+            with open(self.indice, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        registros.append(json.loads(linha))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return registros
+
+    def candidates(self, diretorios, is_processed=None, agora=None):
+        """
+        Arquivos elegíveis, agrupados por mês de modificação
+
+        Returns:
+            dict: {'AAAA-MM': [(caminho, membro, stat), ...]}
+        """
+        limite = (agora or time.time()) - self.dias * 86400
+        por_mes = {}
+        vistos = set()
+        for diretorio in diretorios:
+            real = os.path.realpath(diretorio)
+            if real in vistos or not os.path.isdir(diretorio):
+                continue
+            vistos.add(real)
+            rotulo = os.path.basename(real)
+            with os.scandir(diretorio) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file() or not is_archivable(entry.name, is_processed):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if st.st_mtime >= limite:
+                        continue
+                    mes = datetime.fromtimestamp(st.st_mtime).strftime('%Y-%m')
+                    por_mes.setdefault(mes, []).append((entry.path, f"{rotulo}/{entry.name}", st))
+        return por_mes
+
+    def month_segments(self, mes):
+        """Zips do mês em ordem de gravação (inclui o <AAAA-MM>.zip único de versões anteriores)"""
+        antigo = os.path.join(self.diretorio, f"{mes}.zip")
+        segmentos = sorted(glob.glob(os.path.join(self.diretorio, f"{mes}.[0-9][0-9][0-9].zip")))
+        return ([antigo] if os.path.exists(antigo) else []) + segmentos
+
+    def _write_month(self, mes, itens, parar=None):
+        """
+        Grava os arquivos ainda não arquivados em um segmento novo do mês (.tmp + renomeação)
+
+        Returns:
+            list: Registros do índice dos arquivos que estão em algum segmento do mês
+        """
+        # Membros já gravados por passadas anteriores (lê só o diretório central de cada zip)
+        existentes = {}
+        segmentos = self.month_segments(mes)
+        for segmento in segmentos:
+            with zipfile.ZipFile(segmento) as arquivo_zip:
+                for info in arquivo_zip.infolist():
+                    existentes[info.filename] = (os.path.basename(segmento), info)
+
+        numero = 1 + max((int(segmento.rsplit('.', 2)[1]) for segmento in segmentos
+                          if not segmento.endswith(f"{mes}.zip")), default=0)
+        destino = os.path.join(self.diretorio, f"{mes}.{numero:03d}.zip")
+        temporario = f"{destino}.tmp"
+
+        registros = []
+        novos = 0
+        arquivado_em = datetime.now().isoformat(timespec='seconds')
+        nome_destino = os.path.basename(destino)
+        with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for caminho, membro, st in itens:
+                if parar and parar.is_set():
+                    break
+                anterior = existentes.get(membro)
+                if anterior is not None:
+                    crc = _crc32(caminho)
+                    if anterior[1].file_size != st.st_size or anterior[1].CRC != crc:
+                        # Mesmo membro com outro conteúdo: nome desambiguado pelo CRC do conteúdo
+                        raiz, extensao = os.path.splitext(membro)
+                        membro = f"{raiz}.{crc:08x}{extensao}"
+                        anterior = existentes.get(membro)
+                if anterior is not None and anterior[1].file_size == st.st_size:
+                    # Já arquivado (passada interrompida ou mesmo conteúdo): só indexa
+                    nome_zip = anterior[0]
+                else:
+                    # Data do membro = modificação do arquivo (o zip não representa datas antes de 1980)
+                    data = datetime.fromtimestamp(max(st.st_mtime, 315532800)).timetuple()[:6]
+                    info = zipfile.ZipInfo(membro, data)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.file_size = st.st_size
+                    with open(caminho, 'rb') as entrada, arquivo_zip.open(info, 'w', force_zip64=True) as saida:
+                        self.throttle.copy(entrada, saida)
+                    nome_zip = nome_destino
+                    existentes[membro] = (nome_zip, info)
+                    novos += 1
+                registros.append({'nome': os.path.basename(caminho), 'origem': os.path.dirname(caminho),
+                                  'arquivo': nome_zip, 'membro': membro, 'bytes': st.st_size,
+                                  'mtime': st.st_mtime, 'arquivado_em': arquivado_em})
+        if not novos:
+            os.remove(temporario)
+            return registros
+        with open(temporario, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temporario, destino)
+        return registros
+
+    def _append_index(self, registros):
+        with open(self.indice, 'a', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, diretorios, is_processed=None, parar=None):
+        """
+        Executa uma passada de arquivamento
+
+        Returns:
+            tuple: (int, int) - (arquivos arquivados, bytes liberados nos diretórios)
+        """
+        por_mes = self.candidates(diretorios, is_processed)
+        if not por_mes:
+            return 0, 0
+        os.makedirs(self.diretorio, exist_ok=True)
+        indexados = {(registro['arquivo'], registro['membro']) for registro in self.load_index()}
+        total, liberados = 0, 0
+        for mes in sorted(por_mes):
+            if parar and parar.is_set():
+                break
+            registros = self._write_month(mes, por_mes[mes], parar)
+            self._append_index([registro for registro in registros
+                                if (registro['arquivo'], registro['membro']) not in indexados])
+            for registro in registros:
+                try:
+                    os.remove(os.path.join(registro['origem'], registro['nome']))
+                except FileNotFoundError:
+                    pass
+                total += 1
+                liberados += registro['bytes']
+        return total, liberados
+
+    def find(self, padrao):
+        """Registros do índice cujo nome corresponde ao padrão (glob, ex: 'CBR001*')"""
+        return [registro for registro in self.load_index() if fnmatch.fnmatch(registro['nome'], padrao)]
+
+    def extract(self, registro, destino):
+        """
+        Extrai um arquivo arquivado para o diretório de destino, com a data de modificação original
+
+        Returns:
+            str: Caminho do arquivo extraído
+        """
+        os.makedirs(destino, exist_ok=True)
+        caminho = os.path.join(destino, registro['nome'])
+        with zipfile.ZipFile(os.path.join(self.diretorio, registro['arquivo'])) as arquivo_zip:
+            with arquivo_zip.open(registro['membro']) as entrada, open(f"{caminho}.tmp", 'wb') as saida:
+                shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        os.replace(f"{caminho}.tmp", caminho)
+        os.utime(caminho, (registro['mtime'], registro['mtime']))
+        return caminho
+
+
+class RetentionWorker(threading.Thread):
+    """
+    Tarefa em segundo plano que executa o arquivamento a cada RETENCAO_INTERVALO_HORAS
+
+    O I/O é limitado a RETENCAO_MB_S e pausa enquanto houver arquivos em
+    processamento (live_processing), para nunca competir com o processamento.
+    """
+
+    def __init__(self, diretorios, is_processed=None, dias=30, intervalo_horas=24.0, mb_por_segundo=5.0):
+        super().__init__(name='cnab-retencao', daemon=True)
+        self.diretorios = diretorios
+        self.is_processed = is_processed
+        self.intervalo = intervalo_horas * 3600
+        self.parar = threading.Event()
+        throttle = IoThrottle(mb_por_segundo * 1024 * 1024, self.parar)
+        self.arquivo = RetentionArchive(archive_dir(), dias, throttle)
+
+    def run(self):
+        logger = get_logger('retencao')
+        while not self.parar.is_set():
+            try:
+                total, liberados = self.arquivo.run(self.diretorios, self.is_processed, self.parar)
+                if total:
+                    logger.info(f"🗄️ {total} arquivo(s) antigo(s) arquivado(s) em {self.arquivo.diretorio} "
+                                f"({liberados / (1024 * 1024):.1f} MB liberados)")
+            except Exception as e:
+                logger.error(f"❌ Erro no arquivamento: {str(e)}")
+            self.parar.wait(self.intervalo)
+
+    def stop(self):
+        self.parar.set()
+
+
+def start_retention_worker(is_processed=None, diretorios=None):
+    """
+    Inicia o arquivamento em segundo plano se RETENCAO_DIAS > 0
+
+    Returns:
+        RetentionWorker: None se a retenção estiver desativada
+    """
+    dias = int(os.getenv('RETENCAO_DIAS', '0') or 0)
+    if dias <= 0:
+        return None
+    worker = RetentionWorker(
+        diretorios or default_directories(), is_processed, dias,
+        intervalo_horas=float(os.getenv('RETENCAO_INTERVALO_HORAS', '24')),
+        mb_por_segundo=float(os.getenv('RETENCAO_MB_S', '5')),
+    )
+    worker.start()
+    get_logger('retencao').info(f"🗄️ Arquivamento de arquivos com mais de {dias} dia(s) em {worker.arquivo.diretorio}")
+    return worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento mensal das saídas e backups antigos")
+    parser.add_argument('--listar', metavar='PADRAO', help="Lista os arquivos arquivados cujo nome corresponde ao padrão")
+    parser.add_argument('--extrair', metavar='PADRAO', help="Extrai os arquivos arquivados cujo nome corresponde ao padrão")
+    parser.add_argument('--destino', default='.', help="Diretório de destino da extração (padrão: atual)")
+    parser.add_argument('--executar', action='store_true', help="Executa uma passada de arquivamento agora, sem limite de I/O")
+    args = parser.parse_args()
+
+    if args.executar:
+        from process_cnab import is_file_processed
+        dias = int(os.getenv('RETENCAO_DIAS', '0') or 0)
+        if dias <= 0:
+            print("⚠️ RETENCAO_DIAS não configurado (> 0)")
+            return 1
+        total, liberados = RetentionArchive(archive_dir(), dias).run(default_directories(), is_file_processed)
+        print(f"🗄️ {total} arquivo(s) arquivado(s) ({liberados / (1024 * 1024):.1f} MB liberados)")
+        return 0
+
+    arquivo = RetentionArchive(archive_dir(), 0)
+    padrao = args.extrair or args.listar
+    if not padrao:
+        parser.print_help()
+        return 1
+    registros = arquivo.find(padrao)
+    if not registros:
+        print(f"⚠️ Nenhum arquivo arquivado corresponde a {padrao}")
+        return 1
+    for registro in registros:
+        if args.extrair:
+            print(f"📤 {arquivo.extract(registro, args.destino)}")
+        else:
+            print(f"{registro['nome']:<60} {registro['bytes'] / 1024:>10.1f} KB  "
+                  f"{registro['arquivo']}  ({registro['origem']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
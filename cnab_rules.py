@@ -0,0 +1,233 @@
+import re
+from functools import lru_cache
+
+# Campos do layout CNAB400 disponíveis nas regras: nome -> (início, fim, tipo)
+#   texto: comparação de strings (sem espaços nas pontas)
+#   numero: inteiro; literais de valor monetário são convertidos para a escala do campo
+#   data: DDMMAA no arquivo; literais no formato DD/MM/AAAA
+CAMPOS = {
+    'operacao': (108, 110, 'texto'),
+    'vencimento': (110, 116, 'data'),
+    'documento': (116, 131, 'texto'),
+    'valor_titulo': (152, 165, 'numero'),
+    'valor': (251, 267, 'numero'),
+    'tipo': (318, 319, 'texto'),
+}
+
+# Escala dos campos monetários (valor informado em reais na regra)
+ESCALA_VALOR = {
+    'valor': 1000,        # mesma escala usada em generate_csv_utils (dividido por 1000)
+    'valor_titulo': 100,  # centavos
+}
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<abre>\()|
+        (?P<fecha>\))|
+        (?P<op>>=|<=|!=|\^=|\$=|\*=|=|>|<)|
+        (?P<texto>'[^']*'|"[^"]*")|
+        (?P<palavra>[^\s()'"<>=!^$*]+)
+    )""", re.VERBOSE)
+
+
+class RuleSyntaxError(ValueError):
+    """Regra de filtro inválida"""
+
+
+def _int(valor):
+    """Converte um campo numérico; retorna -1 se não for numérico"""
+    valor = valor.strip()
+    return int(valor) if valor.isdigit() else -1
+
+
+def _tokenize(regra):
+    tokens = []
+    posicao = 0
+    regra = regra.strip()
+    while posicao < len(regra):
+        m = _TOKEN.match(regra, posicao)
+        if not m or m.end() == posicao:
+            raise RuleSyntaxError(f"Caractere inesperado na posição {posicao + 1}: {regra[posicao:]!r}")
+        posicao = m.end()
+        tipo = m.lastgroup
+        valor = m.group(tipo)
+        if tipo == 'texto':
+            valor = valor[1:-1]
+        elif tipo == 'palavra' and valor.upper() in ('AND', 'OR', 'NOT', 'E', 'OU', 'NAO', 'NÃO'):
+            tipo = {'E': 'AND', 'OU': 'OR', 'NAO': 'NOT', 'NÃO': 'NOT'}.get(valor.upper(), valor.upper())
+        tokens.append((tipo, valor))
+    return tokens
+
+
+def _literal_data(valor):
+    m = re.fullmatch(r'(\d{2})/(\d{2})/(\d{4})', valor)
+    if not m:
+        raise RuleSyntaxError(f"Data inválida: {valor!r} (use DD/MM/AAAA)")
+    dia, mes, ano = m.groups()
+    return f"{ano}{mes}{dia}"
+
+
+def _literal_numero(campo, valor):
+    try:
+        numero = float(valor.replace('.', '').replace(',', '.')) if ',' in valor else float(valor)
+    except ValueError:
+        raise RuleSyntaxError(f"Valor numérico inválido para {campo}: {valor!r}")
+    return int(round(numero * ESCALA_VALOR.get(campo, 1)))
+
+
+def _field_expression(campo):
+    """Expressão Python que extrai o campo da linha ``l`` já no formato comparável"""
+    if campo not in CAMPOS:
+        raise RuleSyntaxError(f"Campo desconhecido: {campo!r} (disponíveis: {', '.join(sorted(CAMPOS))})")
+    inicio, fim, tipo = CAMPOS[campo]
+    if tipo == 'numero':
+        return f"_int(l[{inicio}:{fim}])", tipo
+    if tipo == 'data':
+        # DDMMAA -> AAAAMMDD (anos 00-30 são 2000-2030, como em generate_csv_utils)
+        return (f"(('20' if l[{inicio + 4}:{fim}] <= '30' else '19') + "
+                f"l[{inicio + 4}:{fim}] + l[{inicio + 2}:{inicio + 4}] + l[{inicio}:{inicio + 2}])"), tipo
+    return f"l[{inicio}:{fim}].strip()", tipo
+
+
+def _compile_comparison(campo, operador, valor):
+    expressao, tipo = _field_expression(campo)
+
+    if tipo == 'numero':
+        if operador in ('^=', '$=', '*='):
+            raise RuleSyntaxError(f"Operador {operador} não se aplica ao campo numérico {campo}")
+        literal = repr(_literal_numero(campo, valor))
+    elif tipo == 'data':
+        if operador in ('^=', '$=', '*='):
+            raise RuleSyntaxError(f"Operador {operador} não se aplica ao campo de data {campo}")
+        literal = repr(_literal_data(valor))
+    else:
+        literal = repr(valor)
+
+    if operador == '^=':
+        return f"{expressao}.startswith({literal})"
+    if operador == '$=':
+        return f"{expressao}.endswith({literal})"
+    if operador == '*=':
+        return f"({literal} in {expressao})"
+    return f"({expressao} {'==' if operador == '=' else operador} {literal})"
+
+
+class _Parser:
+    """Analisador recursivo: OR < AND < NOT < comparação/parênteses"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.posicao = 0
+
+    def _peek(self):
+        return self.tokens[self.posicao] if self.posicao < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self.posicao += 1
+        return token
+
+    def parse(self):
+        expressao = self._or()
+        if self.posicao != len(self.tokens):
+            raise RuleSyntaxError(f"Trecho inesperado: {self._peek()[1]!r}")
+        return expressao
+
+    def _or(self):
+        partes = [self._and()]
+        while self._peek()[0] == 'OR':
+            self._next()
+            partes.append(self._and())
+        return partes[0] if len(partes) == 1 else '(' + ' or '.join(partes) + ')'
+
+    def _and(self):
+        partes = [self._not()]
+        while self._peek()[0] == 'AND':
+            self._next()
+            partes.append(self._not())
+        return partes[0] if len(partes) == 1 else '(' + ' and '.join(partes) + ')'
+
+    def _not(self):
+        if self._peek()[0] == 'NOT':
+            self._next()
+            return f"(not {self._not()})"
+        return self._atom()
+
+    def _atom(self):
+        tipo, valor = self._next()
+        if tipo is None:
+            raise RuleSyntaxError("Regra incompleta")
+        if tipo == 'abre':
+            expressao = self._or()
+            if self._next()[0] != 'fecha':
+                raise RuleSyntaxError("Parêntese não fechado")
+            return expressao
+        if tipo != 'palavra':
+            raise RuleSyntaxError(f"Campo esperado, encontrado: {valor!r}")
+        campo = valor.lower()
+        tipo_op, operador = self._next()
+        if tipo_op != 'op':
+            raise RuleSyntaxError(f"Operador esperado após {campo!r}")
+        tipo_valor, literal = self._next()
+        if tipo_valor not in ('palavra', 'texto'):
+            raise RuleSyntaxError(f"Valor esperado após {campo} {operador}")
+        return _compile_comparison(campo, operador, literal)
+
+
+def compile_rule_source(regra):
+    """Converte a regra em uma expressão Python sobre a linha ``l``"""
+    tokens = _tokenize(regra)
+    if not tokens:
+        raise RuleSyntaxError("Regra vazia")
+    return _Parser(tokens).parse()
+
+
+def compile_rule(regra):
+    """
+    Compila uma regra de filtro em um único predicado Python
+
+    Exemplo: ``operacao = 06 AND valor >= 1000,00 AND (documento $= '-E' OR vencimento < 01/08/2025)``
+
+    Operadores: = != > >= < <= ^= (começa com) $= (termina com) *= (contém);
+    conectores AND/OR/NOT (ou E/OU/NAO) e parênteses. Valores monetários são
+    informados em reais e datas em DD/MM/AAAA.
+
+    Args:
+        regra (str): Texto da regra
+
+    Returns:
+        callable: Função linha -> bool, ou None se a regra estiver vazia
+
+    Raises:
+        RuleSyntaxError: Se a regra for inválida
+    """
+    if not regra or not regra.strip():
+        return None
+    return _eval_lambda(compile_rule_source(regra))
+
+
+def _eval_lambda(expressao):
+    codigo = compile(f"lambda l: {expressao}", '<regra>', 'eval')
+    return eval(codigo, {'__builtins__': {}, '_int': _int})
+
+
+@lru_cache(maxsize=32)
+def compile_sort_key(campos):
+    """
+    Compila uma chave de ordenação sobre campos do layout
+
+    Args:
+        campos (str): Campos separados por vírgula, ex: 'vencimento,documento'
+            (datas são comparadas como AAAAMMDD e valores como inteiros)
+
+    Returns:
+        callable: Função linha -> tupla, ou None se nenhum campo for informado
+
+    Raises:
+        RuleSyntaxError: Se algum campo for desconhecido
+    """
+    nomes = [campo.strip().lower() for campo in (campos or '').split(',') if campo.strip()]
+    if not nomes:
+        return None
+    expressoes = [_field_expression(campo)[0] for campo in nomes]
+    return _eval_lambda(f"({', '.join(expressoes)},)")
@@ -0,0 +1,127 @@
+import os
+import time
+from dotenv import load_dotenv
+
+import network_fs
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+
+def snapshot_dir(directory):
+    """
+    Lista um diretório com os.scandir, retornando nome e metadados de cada arquivo
+
+    Args:
+        directory (str): Diretório a ser listado
+
+    Returns:
+        list: Tuplas (nome, tamanho, mtime_ns, inode)
+    """
+    entradas = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                entradas.append((entry.name, st.st_size, st.st_mtime_ns, entry.inode()))
+            except OSError:
+                # Arquivo removido/renomeado durante a listagem
+                continue
+    return entradas
+
+
+class DirectoryScanner:
+    """
+    Varredura incremental de um diretório de arquivos .RET.
+
+    Mantém um cache (tamanho, mtime, inode) por nome de arquivo: entradas sem
+    alteração desde a última varredura não passam de novo pelos filtros nem
+    pela verificação do registro. Um arquivo só é entregue depois que seu
+    tamanho fica estável por ``settle_seconds`` (transferência concluída).
+    """
+
+    def __init__(self, directory, accept=None, is_processed=None, settle_seconds=5.0):
+        self.directory = directory
+        self.accept = accept or (lambda nome: True)
+        self.is_processed = is_processed or (lambda nome: False)
+        self.settle_seconds = settle_seconds
+        self._cache = {}
+
+    def _list(self):
+        guard = network_fs.guard_for(self.directory)
+        if guard:
+            try:
+                return guard.call(snapshot_dir, self.directory)
+            except network_fs.ShareUnavailableError:
+                return None
+        return snapshot_dir(self.directory)
+
+    def scan(self):
+        """
+        Executa uma varredura
+
+        Returns:
+            list: Caminhos completos dos arquivos prontos para processamento
+        """
+        entradas = self._list()
+        if entradas is None:
+            return []
+
+        agora = time.time()
+        prontos = []
+        vistos = set()
+
+        for nome, tamanho, mtime_ns, inode in entradas:
+            vistos.add(nome)
+            assinatura = (tamanho, mtime_ns, inode)
+            item = self._cache.get(nome)
+
+            if item is None or item['assinatura'] != assinatura:
+                # Entrada nova ou alterada: reavaliar filtros e estabilidade
+                ignorado = not self.accept(nome) or self.is_processed(nome)
+                item = {
+                    'assinatura': assinatura,
+                    'estavel_desde': min(agora, mtime_ns / 1e9) if item is None else agora,
+                    'ignorado': ignorado,
+                    'entregue': False,
+                }
+                self._cache[nome] = item
+
+            if item['ignorado'] or item['entregue']:
+                continue
+
+            if agora - item['estavel_desde'] >= self.settle_seconds:
+                item['entregue'] = True
+                prontos.append(os.path.join(self.directory, nome))
+
+        # Remove do cache os arquivos que saíram do diretório
+        for nome in list(self._cache):
+            if nome not in vistos:
+                del self._cache[nome]
+
+        return prontos
+
+    def forget(self, nome):
+        """Permite que um arquivo seja entregue novamente (ex: após falha no processamento)"""
+        self._cache.pop(nome, None)
+
+
+_scanners = {}
+
+
+def get_scanner(directory, accept=None, is_processed=None):
+    """
+    Retorna o scanner de um diretório, criando-o na primeira chamada
+
+    A janela de estabilidade vem de FILE_SETTLE_SECONDS (padrão: 5 segundos).
+    """
+    if directory not in _scanners:
+        _scanners[directory] = DirectoryScanner(
+            directory,
+            accept=accept,
+            is_processed=is_processed,
+            settle_seconds=float(os.getenv('FILE_SETTLE_SECONDS', '5')),
+        )
+    return _scanners[directory]
@@ -0,0 +1,219 @@
+import os
+import time
+from dotenv import load_dotenv
+
+from cnab_logging import get_logger
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+POLITICAS = ('newest_first', 'smallest_first', 'fifo')
+
+
+def parse_bank_weights(valor):
+    """
+    Converte 'BB:2,BRADESCO:1' em {'BB': 2.0, 'BRADESCO': 1.0}
+
+    Entradas inválidas são ignoradas.
+    """
+    pesos = {}
+    for parte in (valor or '').split(','):
+        banco, _, peso = parte.partition(':')
+        banco = banco.strip().upper()
+        if not banco or not peso.strip():
+            continue
+        try:
+            pesos[banco] = float(peso)
+        except ValueError:
+            get_logger('agendador').warning(f"⚠️ Peso inválido para o banco {banco}: {peso}")
+    return pesos
+
+
+class PendingFile:
+    """Arquivo descoberto aguardando processamento"""
+
+    __slots__ = ('path', 'tamanho', 'mtime', 'banco', 'descoberto_em')
+
+    def __init__(self, path, tamanho, mtime, banco=None, descoberto_em=None):
+        self.path = path
+        self.tamanho = tamanho
+        self.mtime = mtime
+        self.banco = banco
+        self.descoberto_em = descoberto_em if descoberto_em is not None else time.time()
+
+    @property
+    def tempo_fila(self):
+        return time.time() - self.descoberto_em
+
+
+class FileScheduler:
+    """
+    Ordena os arquivos pendentes de um diretório por prioridade.
+
+    A ordem é dada por:
+      1. itens que esperaram mais que ``age_boost_seconds`` (promovidos),
+         do mais antigo para o mais recente;
+      2. peso do banco (maior primeiro);
+      3. política: ``newest_first`` (mtime mais recente), ``smallest_first``
+         (menor tamanho) ou ``fifo`` (ordem de descoberta).
+
+    Arquivos acima de ``bulk_size_kb`` são considerados carga em massa: a cada
+    ciclo, eles só são iniciados enquanto o tempo gasto com eles no ciclo for
+    menor que ``bulk_budget_seconds``; o restante fica para o próximo ciclo.
+
+    drain() atende um consumidor sequencial (process_directory); consumidores
+    concorrentes (daemon assíncrono) usam best()/take()/charge() e
+    new_cycle() a cada varredura.
+
+    A fila não tem trava: só a thread dona (o event loop, no daemon) altera
+    a fila. describe(), que faz o stat e identifica o banco, não altera a
+    fila e pode rodar em um executor; add_items() insere o resultado.
+    """
+
+    def __init__(self, policy='newest_first', bank_weights=None, age_boost_seconds=600.0,
+                 bulk_size_kb=5120.0, bulk_budget_seconds=60.0, bank_of=None):
+        if policy not in POLITICAS:
+            get_logger('agendador').warning(f"⚠️ Política de agendamento inválida: {policy}. Usando newest_first")
+            policy = 'newest_first'
+        self.policy = policy
+        self.bank_weights = bank_weights or {}
+        self.age_boost_seconds = age_boost_seconds
+        self.bulk_size_bytes = bulk_size_kb * 1024
+        self.bulk_budget_seconds = bulk_budget_seconds
+        self.bank_of = bank_of
+        self.tempo_massa = 0.0
+        self._pendentes = {}
+
+    def __len__(self):
+        return len(self._pendentes)
+
+    def __contains__(self, path):
+        return path in self._pendentes
+
+    def describe(self, paths):
+        """
+        Monta os PendingFile dos caminhos (stat e banco), sem alterar a fila
+
+        Arquivos que sumiram antes do stat são ignorados.
+
+        Returns:
+            list: PendingFile dos caminhos ainda existentes
+        """
+        itens = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            banco = self.bank_of(path) if self.bank_weights and self.bank_of else None
+            itens.append(PendingFile(path, st.st_size, st.st_mtime, banco))
+        return itens
+
+    def add_items(self, itens):
+        """Insere itens montados por describe() (caminhos já presentes são ignorados)"""
+        for item in itens:
+            self._pendentes.setdefault(item.path, item)
+
+    def add(self, paths):
+        """Adiciona arquivos descobertos (caminhos já presentes são ignorados)"""
+        self.add_items(self.describe([path for path in paths if path not in self._pendentes]))
+
+    def _key(self, item, agora):
+        if agora - item.descoberto_em >= self.age_boost_seconds:
+            # Promovidos: o que espera há mais tempo primeiro, independente da política
+            return (0, 0.0, item.descoberto_em)
+        peso = -self.bank_weights.get(item.banco, 1.0) if self.bank_weights else 0.0
+        if self.policy == 'newest_first':
+            criterio = -item.mtime
+        elif self.policy == 'smallest_first':
+            criterio = item.tamanho
+        else:
+            criterio = item.descoberto_em
+        return (1, peso, criterio)
+
+    def is_bulk(self, item):
+        return item.tamanho >= self.bulk_size_bytes
+
+    def new_cycle(self):
+        """Reinicia o orçamento de arquivos em massa (consumidores concorrentes, a cada varredura)"""
+        self.tempo_massa = 0.0
+
+    def best(self):
+        """
+        Item de maior prioridade agora, sem retirá-lo da fila
+
+        Itens em massa só são considerados enquanto houver orçamento no ciclo.
+
+        Returns:
+            tuple: (chave de ordenação, PendingFile) ou (None, None) se não houver item
+        """
+        agora = time.time()
+        candidatos = [item for item in list(self._pendentes.values())
+                      if not (self.is_bulk(item) and self.tempo_massa >= self.bulk_budget_seconds)]
+        if not candidatos:
+            return None, None
+        item = min(candidatos, key=lambda candidato: self._key(candidato, agora))
+        return self._key(item, agora), item
+
+    def take(self, item):
+        """Retira um item da fila (em geral, o retornado por best())"""
+        self._pendentes.pop(item.path, None)
+
+    def charge(self, item, segundos):
+        """Contabiliza no orçamento do ciclo o tempo de processamento de um item em massa"""
+        if self.is_bulk(item):
+            self.tempo_massa += segundos
+
+    def drain(self):
+        """
+        Gera os itens do ciclo atual em ordem de prioridade
+
+        O tempo entre a entrega de um item em massa e o pedido do próximo é
+        contabilizado no orçamento do ciclo. Itens em massa que excedem o
+        orçamento permanecem na fila para o próximo ciclo.
+
+        Yields:
+            PendingFile: Próximo arquivo a processar
+        """
+        agora = time.time()
+        ordenados = sorted(self._pendentes.values(), key=lambda item: self._key(item, agora))
+        tempo_massa = 0.0
+        adiados = 0
+
+        for item in ordenados:
+            em_massa = self.is_bulk(item)
+            if em_massa and tempo_massa >= self.bulk_budget_seconds:
+                adiados += 1
+                continue
+
+            del self._pendentes[item.path]
+            inicio = time.perf_counter()
+            yield item
+            if em_massa:
+                tempo_massa += time.perf_counter() - inicio
+
+        if adiados:
+            get_logger('agendador').info(f"⏳ {adiados} arquivo(s) grande(s) adiado(s) para o próximo ciclo "
+                                         f"(orçamento de {self.bulk_budget_seconds:g}s esgotado)")
+
+
+_schedulers = {}
+
+
+def get_scheduler(directory, bank_of=None):
+    """
+    Retorna o agendador de um diretório, criando-o na primeira chamada
+
+    Configurado por SCHEDULER_POLICY, SCHEDULER_BANK_WEIGHTS, SCHEDULER_AGE_BOOST_SECONDS,
+    SCHEDULER_BULK_SIZE_KB e SCHEDULER_BULK_BUDGET_SECONDS.
+    """
+    if directory not in _schedulers:
+        _schedulers[directory] = FileScheduler(
+            policy=os.getenv('SCHEDULER_POLICY', 'newest_first').strip().lower(),
+            bank_weights=parse_bank_weights(os.getenv('SCHEDULER_BANK_WEIGHTS', '')),
+            age_boost_seconds=float(os.getenv('SCHEDULER_AGE_BOOST_SECONDS', '600')),
+            bulk_size_kb=float(os.getenv('SCHEDULER_BULK_SIZE_KB', '5120')),
+            bulk_budget_seconds=float(os.getenv('SCHEDULER_BULK_BUDGET_SECONDS', '60')),
+            bank_of=bank_of,
+        )
+    return _schedulers[directory]
@@ -0,0 +1,198 @@
+import os
+import heapq
+import tempfile
+from itertools import chain, groupby, islice
+
+from cnab_core import split_header_trailer
+from cnab_rules import compile_sort_key, RuleSyntaxError
+from cnab_logging import get_logger
+
+# Máximo de runs abertos ao mesmo tempo em uma etapa de intercalação
+MAX_RUNS_POR_INTERCALACAO = 64
+
+
+def _write_run(pasta, numero, linhas):
+    caminho = os.path.join(pasta, f"run_{numero:06d}.txt")
+    with open(caminho, 'w', encoding='utf-8') as f:
+        for linha in linhas:
+            f.write(linha)
+            f.write('\n')
+    return caminho
+
+
+def _read_run(arquivo):
+    for linha in arquivo:
+        yield linha.rstrip('\n')
+
+
+def _merge_runs(runs, chave):
+    """Intercala runs ordenados, gerando as linhas em ordem (estável entre runs)"""
+    arquivos = [open(caminho, 'r', encoding='utf-8') for caminho in runs]
+    try:
+        yield from heapq.merge(*(_read_run(arquivo) for arquivo in arquivos), key=chave)
+    finally:
+        for arquivo in arquivos:
+            arquivo.close()
+
+
+def sort_records(registros, chave, max_registros_memoria=200000, tmp_dir=None):
+    """
+    Ordena registros pela chave, com memória limitada
+
+    Até ``max_registros_memoria`` registros a ordenação é feita em memória.
+    Acima disso, os registros são ordenados em blocos gravados como runs
+    temporários e depois intercalados (merge sort externo); com muitos runs a
+    intercalação é feita em etapas de até MAX_RUNS_POR_INTERCALACAO arquivos.
+    A ordenação é estável: registros com a mesma chave mantêm a ordem original.
+
+    Args:
+        registros (iterable): Linhas de registros de dados (sem '\\n')
+        chave (callable): Função linha -> chave de ordenação
+        max_registros_memoria (int): Máximo de registros mantidos em memória
+        tmp_dir (str, optional): Diretório dos runs temporários (padrão do sistema)
+
+    Yields:
+        str: Registros em ordem
+    """
+    iterador = iter(registros)
+    bloco = list(islice(iterador, max_registros_memoria))
+    if len(bloco) < max_registros_memoria:
+        bloco.sort(key=chave)
+        yield from bloco
+        return
+
+    with tempfile.TemporaryDirectory(prefix='cnab_sort_', dir=tmp_dir) as pasta:
+        runs = []
+        while bloco:
+            bloco.sort(key=chave)
+            runs.append(_write_run(pasta, len(runs), bloco))
+            bloco = list(islice(iterador, max_registros_memoria))
+
+        # Intercalação em etapas quando há mais runs que o limite de arquivos abertos
+        numero = len(runs)
+        while len(runs) > MAX_RUNS_POR_INTERCALACAO:
+            proximos = []
+            for inicio in range(0, len(runs), MAX_RUNS_POR_INTERCALACAO):
+                grupo = runs[inicio:inicio + MAX_RUNS_POR_INTERCALACAO]
+                proximos.append(_write_run(pasta, numero, _merge_runs(grupo, chave)))
+                numero += 1
+                for caminho in grupo:
+                    os.remove(caminho)
+            runs = proximos
+
+        yield from _merge_runs(runs, chave)
+
+
+def sort_cnab_lines(linhas, chave, max_registros_memoria=200000, tmp_dir=None):
+    """
+    Ordena os registros de dados de uma saída, mantendo header e trailer nas pontas
+
+    Args:
+        linhas (list): Linhas da saída (header, registros e trailer)
+        chave (callable): Função linha -> chave de ordenação (ver cnab_rules.compile_sort_key)
+        max_registros_memoria (int): Limite para ordenar em memória (acima disso usa runs temporários)
+        tmp_dir (str, optional): Diretório dos runs temporários
+
+    Yields:
+        str: Linhas da saída com os registros ordenados
+    """
+    header, registros, trailer = split_header_trailer(linhas)
+    yield from header
+    yield from sort_records(registros, chave, max_registros_memoria, tmp_dir)
+    yield from trailer
+
+
+def iter_partitions(registros_ordenados, chave_particao):
+    """
+    Agrupa registros já ordenados pela chave de partição
+
+    Cada grupo é gerado sob demanda (apenas o grupo atual fica em uso), então
+    o grupo precisa ser consumido antes de avançar para o próximo.
+
+    Yields:
+        tuple: (valor_da_chave, iterador de registros do grupo)
+    """
+    yield from groupby(registros_ordenados, key=chave_particao)
+
+
+def _partition_label(valor):
+    return valor if valor.isdigit() else 'sem_data'
+
+
+def iter_output_pieces(linhas, registros_por_parte=0, ordenacao=None):
+    """
+    Gera as peças em que uma saída deve ser gravada
+
+    Aplica, nesta ordem, a ordenação (``ordenacao['chave']``), o particionamento
+    por data de vencimento (``ordenacao['particionar']``) e a divisão em partes
+    de até ``registros_por_parte`` registros. Cada peça tem o header e o
+    trailer originais (recalculado na gravação com RECALCULAR_TRAILER=true). As peças são
+    geradas sob demanda e cada uma deve ser consumida antes da próxima.
+
+    Args:
+        linhas (list): Linhas da saída (header, registros e trailer)
+        registros_por_parte (int): Máximo de registros por peça (0: sem limite)
+        ordenacao (dict, optional): Configuração retornada por get_sort_settings
+
+    Yields:
+        tuple: (str, iterable) - (sufixo do nome do arquivo, linhas da peça); sufixo vazio
+            quando a saída é gravada em um único arquivo
+    """
+    header, registros, trailer = split_header_trailer(linhas)
+    ordenacao = ordenacao or {}
+    if ordenacao.get('chave'):
+        registros = sort_records(registros, ordenacao['chave'], ordenacao['max_registros_memoria'],
+                                 ordenacao['tmp_dir'])
+
+    if ordenacao.get('particionar'):
+        grupos = ((f"_{_partition_label(valor)}", grupo)
+                  for (valor,), grupo in iter_partitions(registros, ordenacao['chave_particao']))
+    else:
+        grupos = [('', registros)]
+
+    for sufixo, grupo in grupos:
+        if registros_por_parte <= 0:
+            yield sufixo, chain(header, grupo, trailer)
+            continue
+        iterador = iter(grupo)
+        bloco = list(islice(iterador, registros_por_parte))
+        proximo = list(islice(iterador, registros_por_parte))
+        if not proximo:
+            yield sufixo, header + bloco + trailer
+            continue
+        numero = 1
+        while bloco:
+            yield f"{sufixo}_parte{numero:03d}", header + bloco + trailer
+            bloco, proximo = proximo, list(islice(iterador, registros_por_parte))
+            numero += 1
+
+
+def get_sort_settings():
+    """
+    Lê a configuração de ordenação/particionamento das saídas
+
+    ORDENAR_SAIDA: campos do layout (ex: 'vencimento,documento'); vazio mantém a ordem original.
+    PARTICIONAR_SAIDA_POR_DATA: grava o arquivo alterado em uma partição por data de vencimento.
+    ORDENACAO_MAX_REGISTROS_MEMORIA e ORDENACAO_TMP_DIR controlam a ordenação externa.
+
+    Returns:
+        dict: chave (callable ou None), particionar (bool), chave_particao (callable ou None),
+            max_registros_memoria (int), tmp_dir (str ou None)
+    """
+    campos = os.getenv('ORDENAR_SAIDA', '').strip()
+    particionar = os.getenv('PARTICIONAR_SAIDA_POR_DATA', 'false').lower() == 'true'
+    if particionar:
+        # As partições exigem a saída ordenada primeiro pela data
+        campos = ','.join(['vencimento'] + [c for c in campos.split(',') if c.strip()])
+    try:
+        chave = compile_sort_key(campos)
+    except RuleSyntaxError as e:
+        get_logger('ordenacao').warning(f"⚠️ ORDENAR_SAIDA inválida, mantendo a ordem original: {str(e)}")
+        chave, particionar = None, False
+    return {
+        'chave': chave,
+        'particionar': particionar,
+        'chave_particao': compile_sort_key('vencimento') if particionar else None,
+        'max_registros_memoria': max(1, int(os.getenv('ORDENACAO_MAX_REGISTROS_MEMORIA', '200000'))),
+        'tmp_dir': os.getenv('ORDENACAO_TMP_DIR') or None,
+    }
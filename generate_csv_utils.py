@@ -124,6 +124,32 @@ def extract_document_data(linha):
         return None
 
 
+def extract_title_amount(linha):
+    """
+    Extrai valor e vencimento de um título para os agregados financeiros
+
+    Mesmas regras de extract_document_data (validação, arredondamento do
+    valor e século do ano), sem montar o dicionário: o valor em centavos é
+    exatamente o que vai para o CSV/XLS, de modo que os totais batem com as
+    planilhas.
+
+    Args:
+        linha (str): Linha do arquivo CNAB
+
+    Returns:
+        tuple: (int, str) - (valor em centavos, vencimento AAAA-MM-DD)
+               ou None se a linha não for um título válido
+    """
+    if not is_valid_title_record(linha):
+        return None
+    # is_valid_title_record garante valor numérico e data DDMMAA com 6 dígitos
+    valor_int = int(linha[251:267])
+    data_str = linha[110:116]
+    ano = int(data_str[4:6])
+    ano_completo = 2000 + ano if ano <= 30 else 1900 + ano
+    return int(f"{valor_int / 1000:.2f}".replace('.', '')), f"{ano_completo}-{data_str[2:4]}-{data_str[:2]}"
+
+
 def generate_csv_from_cnab_lines(linhas_antecipadas, output_path):
     """
     Gera arquivo CSV a partir das linhas de operações antecipadas
@@ -147,8 +173,9 @@ def generate_csv_from_cnab_lines(linhas_antecipadas, output_path):
         if not dados_documentos:
             return False, "Nenhum documento válido encontrado"
         
-        # Gerar CSV
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
+        # Gerar CSV (em arquivo temporário, publicado de uma vez no final)
+        temporario = f"{output_path}.tmp"
+        with open(temporario, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['n_documento', 'valor', 'data_pagamento']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             
@@ -158,6 +185,7 @@ def generate_csv_from_cnab_lines(linhas_antecipadas, output_path):
             # Escrever dados
             for dados in dados_documentos:
                 writer.writerow(dados)
+        os.replace(temporario, output_path)
         
         return True, f"CSV gerado com sucesso: {len(dados_documentos)} registros salvos em {output_path}"
         
@@ -244,8 +272,10 @@ def generate_xls_from_cnab_lines(linhas, xls_path):
             for cell in row:
                 cell.border = thin_border
         
-        # Salvar arquivo
-        wb.save(xls_path)
+        # Salvar arquivo (em arquivo temporário, publicado de uma vez no final)
+        temporario = f"{xls_path}.tmp"
+        wb.save(temporario)
+        os.replace(temporario, xls_path)
         
         return True, f"XLS gerado com sucesso: {len(dados_documentos)} registros salvos em {xls_path}"
         
@@ -253,12 +283,13 @@ def generate_xls_from_cnab_lines(linhas, xls_path):
         return False, f"Erro ao gerar XLS: {str(e)}"
 
 
-def generate_output_for_antecipated_operations(arquivo_antecipado):
+def generate_output_for_antecipated_operations(arquivo_antecipado, output_format=None):
     """
     Gera arquivo de saída (CSV ou XLS) para operações antecipadas a partir de um arquivo .ret
     
     Args:
         arquivo_antecipado (str): Caminho para o arquivo .ret com operações antecipadas
+        output_format (str, optional): 'csv' ou 'xls'; se não informado, usa OUTPUT_FORMAT do .env
         
     Returns:
         tuple: (bool, str, str) - (sucesso, mensagem, caminho_arquivo)
@@ -269,7 +300,7 @@ def generate_output_for_antecipated_operations(arquivo_antecipado):
             return False, f"Arquivo não encontrado: {arquivo_antecipado}", None
         
         # Obter formato de saída do .env (padrão: csv)
-        output_format = os.getenv('OUTPUT_FORMAT', 'csv').lower()
+        output_format = (output_format or os.getenv('OUTPUT_FORMAT', 'csv')).lower()
         
         # Definir caminho do arquivo de saída
         nome_base = os.path.splitext(arquivo_antecipado)[0]
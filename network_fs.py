@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from dotenv import load_dotenv
+
+from cnab_logging import get_logger
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+
+class ShareUnavailableError(OSError):
+    """Compartilhamento de rede indisponível ou sem resposta dentro do tempo limite"""
+
+
+class ShareGuard:
+    """
+    Acesso a um compartilhamento de rede com tempo limite e estado de saúde.
+
+    As operações são executadas em um pool de threads e abandonadas após
+    ``timeout`` segundos. Cada falha (tempo esgotado ou erro de rede) coloca o
+    compartilhamento em espera com backoff exponencial; durante a espera as
+    chamadas falham imediatamente, sem tocar a rede. Caminhos inexistentes
+    também ficam em cache negativo por ``negative_ttl`` segundos.
+    """
+
+    def __init__(self, root, timeout=10.0, backoff_base=5.0, backoff_max=300.0, negative_ttl=30.0, workers=4):
+        self.root = root
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.negative_ttl = negative_ttl
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='cnab-share')
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._indisponivel_ate = 0.0
+        self._cache_negativo = {}
+
+    @property
+    def disponivel(self):
+        return time.monotonic() >= self._indisponivel_ate
+
+    @property
+    def falhas(self):
+        return self._falhas
+
+    def _registrar_falha(self, motivo):
+        with self._lock:
+            self._falhas += 1
+            espera = min(self.backoff_max, self.backoff_base * (2 ** (self._falhas - 1)))
+            self._indisponivel_ate = time.monotonic() + espera
+        get_logger('rede').warning(
+            f"⚠️ Compartilhamento {self.root} indisponível ({motivo}). Nova tentativa em {espera:.0f}s")
+
+    def _registrar_sucesso(self):
+        if self._falhas:
+            with self._lock:
+                self._falhas = 0
+                self._indisponivel_ate = 0.0
+                self._cache_negativo.clear()
+            get_logger('rede').info(f"✅ Compartilhamento {self.root} disponível novamente")
+
+    def call(self, func, *args):
+        """
+        Executa uma operação no compartilhamento respeitando o tempo limite
+
+        Raises:
+            ShareUnavailableError: Compartilhamento em espera ou operação sem resposta
+        """
+        if not self.disponivel:
+            raise ShareUnavailableError(f"Compartilhamento em espera: {self.root}")
+
+        futuro = self._executor.submit(func, *args)
+        try:
+            resultado = futuro.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._registrar_falha(f"sem resposta em {self.timeout:g}s")
+            raise ShareUnavailableError(f"Tempo esgotado em {self.root}")
+        except (FileNotFoundError, FileExistsError, PermissionError, IsADirectoryError, NotADirectoryError):
+            # Respostas válidas do servidor: o compartilhamento está saudável
+            self._registrar_sucesso()
+            raise
+        except OSError as e:
+            self._registrar_falha(str(e))
+            raise ShareUnavailableError(str(e)) from e
+
+        self._registrar_sucesso()
+        return resultado
+
+    def exists(self, path):
+        """os.path.exists com tempo limite e cache negativo (False se indisponível)"""
+        expira = self._cache_negativo.get(path)
+        if expira and expira > time.monotonic():
+            return False
+        try:
+            existe = self.call(os.path.exists, path)
+        except ShareUnavailableError:
+            return False
+        if existe:
+            self._cache_negativo.pop(path, None)
+        else:
+            self._cache_negativo[path] = time.monotonic() + self.negative_ttl
+        return existe
+
+
+class PendingOutputs:
+    """
+    Fila local de arquivos que não puderam ser copiados para o compartilhamento.
+
+    Cada item é uma cópia do arquivo no diretório de pendências mais um
+    arquivo .json com o diretório e o nome de destino.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._contador = 0
+
+    def add(self, source_path, target_dir, target_name=None):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._contador += 1
+            item_id = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{self._contador:04d}"
+        nome = target_name or os.path.basename(source_path)
+        copia = os.path.join(self.directory, f"{item_id}.dat")
+        shutil.copy2(source_path, copia)
+
+        manifesto = os.path.join(self.directory, f"{item_id}.json")
+        with open(manifesto + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'target_dir': target_dir, 'target_name': nome, 'origem': source_path}, f)
+        os.replace(manifesto + '.tmp', manifesto)
+        get_logger('rede').info(f"📥 {nome} aguardando o compartilhamento {target_dir}")
+
+    def items(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.directory) if f.endswith('.json'))
+
+    def flush(self, copiar):
+        """
+        Tenta enviar os itens pendentes, em ordem de chegada
+
+        Um destino indisponível é pulado até a próxima passada; os itens dos
+        demais destinos continuam sendo enviados.
+
+        Args:
+            copiar (callable): Função (origem, target_dir, target_name) que faz a cópia
+
+        Returns:
+            int: Número de itens enviados
+        """
+        enviados = 0
+        indisponiveis = set()
+        for item_id in self.items():
+            manifesto = os.path.join(self.directory, f"{item_id}.json")
+            copia = os.path.join(self.directory, f"{item_id}.dat")
+            try:
+                with open(manifesto, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+                if dados['target_dir'] in indisponiveis:
+                    continue
+                copiar(copia, dados['target_dir'], dados['target_name'])
+            except ShareUnavailableError:
+                indisponiveis.add(dados['target_dir'])
+                continue
+            except Exception as e:
+                get_logger('rede').warning(f"⚠️ Erro ao enviar pendência {item_id}: {str(e)}")
+                continue
+            os.remove(manifesto)
+            os.remove(copia)
+            enviados += 1
+        return enviados
+
+
+_guards = {}
+_pending = None
+
+
+def _normalize(path):
+    return os.path.normcase(os.path.normpath(path)) if path else path
+
+
+def configure(share_roots=None, pending_dir=None):
+    """
+    Define os compartilhamentos protegidos e o diretório de pendências
+
+    Por padrão usa NETWORK_CNAB_DIR e o diretório PENDING_OUTPUTS_DIR (padrão: pendentes).
+    """
+    global _pending
+    if share_roots is None:
+        share_roots = [os.getenv('NETWORK_CNAB_DIR')]
+    if pending_dir is None:
+        pending_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.getenv('PENDING_OUTPUTS_DIR', 'pendentes'))
+
+    _guards.clear()
+    for root in share_roots:
+        if root:
+            _guards[_normalize(root)] = ShareGuard(
+                root,
+                timeout=float(os.getenv('NETWORK_FS_TIMEOUT', '10')),
+                backoff_base=float(os.getenv('NETWORK_FS_BACKOFF_BASE', '5')),
+                backoff_max=float(os.getenv('NETWORK_FS_BACKOFF_MAX', '300')),
+                negative_ttl=float(os.getenv('NETWORK_FS_NEGATIVE_TTL', '30')),
+            )
+    _pending = PendingOutputs(pending_dir)
+
+
+def guard_for(path):
+    """Retorna o ShareGuard responsável pelo caminho ou None se o caminho for local"""
+    if _pending is None:
+        configure()
+    caminho = _normalize(path)
+    for root, guard in _guards.items():
+        if caminho == root or caminho.startswith(root.rstrip(os.sep) + os.sep):
+            return guard
+    return None
+
+
+def path_exists(path):
+    """os.path.exists protegido para caminhos no compartilhamento de rede"""
+    if not path:
+        return False
+    guard = guard_for(path)
+    return guard.exists(path) if guard else os.path.exists(path)
+
+
+def list_dir(path):
+    """os.listdir protegido; retorna lista vazia se o compartilhamento estiver indisponível"""
+    guard = guard_for(path)
+    if not guard:
+        return os.listdir(path)
+    try:
+        return guard.call(os.listdir, path)
+    except ShareUnavailableError:
+        return []
+
+
+def file_size(path):
+    """os.path.getsize protegido para caminhos no compartilhamento; None se não existe ou sem resposta"""
+    guard = guard_for(path)
+    try:
+        return guard.call(os.path.getsize, path) if guard else os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def call(path, func, *args):
+    """
+    Executa ``func(*args)`` sob o ShareGuard do caminho (direto, se o caminho for local)
+
+    Raises:
+        ShareUnavailableError: Compartilhamento em espera ou operação sem resposta
+    """
+    guard = guard_for(path)
+    return guard.call(func, *args) if guard else func(*args)
+
+
+def remove(path):
+    """os.remove protegido para caminhos no compartilhamento"""
+    call(path, os.remove, path)
+
+
+def _publish_copy(source_path, destino, cancelada=None):
+    """
+    Copia para um temporário e renomeia: quem lê o diretório nunca vê um arquivo pela metade
+
+    Cada tentativa usa o próprio temporário (<destino>.<id>.tmp). Uma cópia
+    abandonada pelo tempo limite continua na thread do pool; se ``cancelada``
+    foi sinalizado enquanto isso, ela descarta o temporário em vez de publicar,
+    e a pendência enfileirada no lugar dela não disputa o mesmo arquivo.
+    """
+    temporario = f"{destino}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copy2(source_path, temporario)
+        if cancelada is not None and cancelada.is_set():
+            os.remove(temporario)
+            return
+        os.replace(temporario, destino)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+
+def _copy_now(source_path, target_dir, target_name=None):
+    destino = os.path.join(target_dir, target_name or os.path.basename(source_path))
+    guard = guard_for(target_dir)
+    if guard:
+        cancelada = threading.Event()
+        try:
+            guard.call(_publish_copy, source_path, destino, cancelada)
+        except ShareUnavailableError:
+            # A cópia pode terminar depois do tempo limite: cancela antes de ela virar pendência
+            cancelada.set()
+            raise
+    else:
+        _publish_copy(source_path, destino)
+    return destino
+
+
+def fetch_local(source_path, target_dir):
+    """
+    Copia um arquivo do compartilhamento para um diretório local, sob o ShareGuard da origem
+
+    Quem processa o arquivo passa a ler só a cópia local: um compartilhamento
+    travado interrompe apenas esta cópia (tempo limite), nunca o processamento.
+
+    Returns:
+        str: Caminho da cópia local
+
+    Raises:
+        ShareUnavailableError: Compartilhamento em espera ou cópia sem resposta
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    destino = os.path.join(target_dir, os.path.basename(source_path))
+    guard = guard_for(source_path)
+    if not guard:
+        _publish_copy(source_path, destino)
+        return destino
+    cancelada = threading.Event()
+    try:
+        guard.call(_publish_copy, source_path, destino, cancelada)
+    except ShareUnavailableError:
+        # A cópia abandonada não deve substituir uma cópia local mais recente
+        cancelada.set()
+        raise
+    return destino
+
+
+def copy_to_dir(source_path, target_dir, target_name=None):
+    """
+    Copia um arquivo para um diretório; se for um compartilhamento indisponível,
+    o arquivo entra na fila local de pendências
+
+    Returns:
+        str or None: Caminho de destino se copiado, None se ficou pendente
+    """
+    try:
+        return _copy_now(source_path, target_dir, target_name)
+    except ShareUnavailableError:
+        _pending.add(source_path, target_dir, target_name)
+        return None
+
+
+def flush_pending():
+    """Envia os arquivos pendentes para os compartilhamentos que voltaram a responder"""
+    if _pending is None:
+        configure()
+    if not _pending.items():
+        return 0
+    if not any(guard.disponivel for guard in _guards.values()):
+        return 0
+    enviados = _pending.flush(_copy_now)
+    if enviados:
+        get_logger('rede').info(f"📤 {enviados} arquivo(s) pendente(s) enviados ao compartilhamento")
+    return enviados
@@ -1,11 +1,38 @@
 import os
 import time
+import logging
+import threading
 import traceback
 import shutil
 from datetime import datetime
 from dotenv import load_dotenv
 import re
 
+from cnab_core import (
+    BankConfig, renumber_cnab_lines,
+    LAYOUT_CNAB240, MOTIVO_TAMANHO_INSUFICIENTE, TAMANHO_MINIMO_LINHA
+)
+from cnab_banks import bank_signature, detect_bank, read_first_record
+from cnab_logging import get_logger, RateLimitedLog, write_rejects_file
+from cnab_parse_cache import filter_cnab_cached
+from cnab_journal import open_journal, hash_file, ETAPA_INICIO, ETAPA_SAIDAS, ETAPA_CONCLUIDO
+from cnab_compression import (
+    cnab_name, compress_file, compression_of, is_cnab_name, open_cnab_input, output_codec,
+    EXTENSAO_POR_CODEC
+)
+from cnab_profiling import (
+    check_memory_budget, record_scan_cycle, start_file_profile, ACAO_ADIAR, ACAO_RECUSAR
+)
+import network_fs
+from cnab_scanner import get_scanner
+from cnab_lease import get_lease_manager, multi_node_enabled
+from cnab_scheduler import get_scheduler
+from cnab_config import get_config
+from cnab_sort import get_sort_settings, iter_output_pieces, sort_cnab_lines
+from cnab_retention import live_processing, start_retention_worker
+from cnab_concurrency import report_lines
+from cnab_aggregates import aggregates_enabled, format_money, record_file_aggregates, DUPLICADO
+
 # Importa utilitários para geração de CSV
 try:
     from generate_csv_utils import generate_output_for_antecipated_operations
@@ -16,73 +43,26 @@ except ImportError:
 # Carrega as variáveis de ambiente
 load_dotenv()
 
+# Mensagens do processamento: console (stdout) e arquivo de log, via cnab_logging
+logger = get_logger('process_cnab')
+
 def identify_bank(first_line):
-    """Identifica o banco baseado na primeira linha do arquivo"""
-    if not first_line:
-        return None
-    
-    # Verifica o código do banco nas posições 77-79
-    if len(first_line) < 79:
-        print(f"ALERTA: Primeira linha com formato inválido. Comprimento: {len(first_line)}, esperado >= 79")
-        return None
-        
-    bank_code = first_line[76:79]
-    print("\nAnalisando primeira linha do arquivo:")
-    print(f"Conteúdo nas posições 76-79: '{bank_code}'")
-    
-    if bank_code == "237" or "BRADESCO" in first_line:
-        print("Banco identificado como BRADESCO")
-        return "BRADESCO"
-    elif bank_code == "001" or "BANCO DO BRASIL" in first_line:
-        print("Banco identificado como Banco do Brasil")
-        return "BB"
-    
-    print("AVISO: Banco não identificado na primeira linha")
-    return None
+    """
+    Identifica o banco baseado na primeira linha do arquivo
 
-def load_bank_operations():
-    """Carrega as configurações de operações dos bancos do arquivo .env"""
-    bb_operations = os.getenv('BB_OPERACAO', '').split(',')
-    bb_enabled = os.getenv('BB_ENABLE', 'false').lower() == 'true'
-    bb_separar_antecipacao = os.getenv('BB_SEPARAR_ANTECIPACAO', 'false').lower() == 'true'
-    
-    bradesco_operations = os.getenv('BRADESCO_OPERACAO', '').split(',')
-    bradesco_enabled = os.getenv('BRADESCO_ENABLE', 'false').lower() == 'true'
-    bradesco_separar_antecipacao = os.getenv('BRADESCO_SEPARAR_ANTECIPACAO', 'false').lower() == 'true'
-    
-    return {
-        'BB': {
-            'operations': bb_operations,
-            'enabled': bb_enabled,
-            'separar_antecipacao': bb_separar_antecipacao
-        },
-        'BRADESCO': {
-            'operations': bradesco_operations,
-            'enabled': bradesco_enabled,
-            'separar_antecipacao': bradesco_separar_antecipacao
-        }
-    }
+    Usa a tabela de assinaturas de cnab_banks (código de compensação na
+    posição do layout CNAB400/CNAB240). Retorna a chave do banco ou None.
+    """
+    return detect_bank(first_line).banco
 
-def is_valid_operation(operacao, bank_config):
+def load_bank_operations():
     """
-    Valida se uma operação é válida para um banco específico com base nas configurações.
+    Retorna as configurações de operações dos bancos
     
-    Args:
-        operacao (str): Código da operação a ser validada
-        bank_config (dict): Configurações do banco (contém a lista de operações válidas)
-        
-    Returns:
-        bool: True se a operação for válida, False caso contrário
+    Os valores do .env são validados e compilados uma única vez por cnab_config
+    (recarregados automaticamente quando o .env muda).
     """
-    # Remover espaços em branco e validar
-    operacao = operacao.strip() if operacao else ""
-    
-    # Se a operação estiver vazia, é inválida
-    if not operacao:
-        return False
-    
-    # Verifica se a operação está na lista de operações permitidas para o banco
-    return operacao in bank_config['operations']
+    return get_config().as_dict()
 
 def copy_file(source_path, target_dir, timestamp=None, keep_original_name=False):
     """
@@ -98,7 +78,7 @@ def copy_file(source_path, target_dir, timestamp=None, keep_original_name=False)
         str or None: Caminho do arquivo copiado se bem-sucedido, None caso contrário
     """
     try:
-        if target_dir and os.path.exists(target_dir):
+        if target_dir and network_fs.path_exists(target_dir):
             # Gera o novo nome
             filename = os.path.basename(source_path)
             name_without_ext = os.path.splitext(filename)[0]
@@ -112,7 +92,7 @@ def copy_file(source_path, target_dir, timestamp=None, keep_original_name=False)
             target_path = os.path.join(target_dir, new_filename)
             
             # Se o arquivo já existe no destino, não copia novamente
-            if not os.path.exists(target_path):
+            if not network_fs.path_exists(target_path):
                 try:
                     # Tentativa com diferentes encodings
                     encoding_list = ['utf-8', 'iso-8859-1', 'latin1', 'cp1252']
@@ -136,29 +116,31 @@ def copy_file(source_path, target_dir, timestamp=None, keep_original_name=False)
                         with open(target_path, 'w', encoding='utf-8') as target:
                             target.write(content)
                     
-                    print(f"Arquivo {'original' if keep_original_name else ''} copiado para: {target_path}")
+                    logger.info(f"Arquivo {'original' if keep_original_name else ''} copiado para: {target_path}")
                     return target_path
                 except Exception as e:
-                    print(f"Erro ao ler/escrever arquivo: {str(e)}")
+                    logger.error(f"Erro ao ler/escrever arquivo: {str(e)}")
                     
                     # Tentativa final usando shutil.copy2 (preserva metadados)
                     try:
                         import shutil
                         shutil.copy2(source_path, target_path)
-                        print(f"Arquivo copiado para {target_path} usando método alternativo")
+                        logger.info(f"Arquivo copiado para {target_path} usando método alternativo")
                         return target_path
                     except Exception as e2:
-                        print(f"Erro final ao copiar arquivo: {str(e2)}")
+                        logger.error(f"Erro final ao copiar arquivo: {str(e2)}")
             else:
-                print(f"Arquivo já existe no destino: {target_path}")
+                logger.info(f"Arquivo já existe no destino: {target_path}")
                 return target_path
     except Exception as e:
-        print(f"Erro ao copiar arquivo para {target_dir}: {str(e)}")
+        logger.error(f"Erro ao copiar arquivo para {target_dir}: {str(e)}")
     return None
 
 def generate_processing_report(banco, total_lines, linhas_validas, linhas_invalidas, lines_kept, 
                           count_por_operacao, count_normal, count_antecipado, 
-                          count_tipo_desconhecido, tempo_total, output_files=None):
+                          count_tipo_desconhecido, tempo_total, output_files=None, tempo_fila=None,
+                          versao_config=None, regra=None, perfis=None, erros_integridade=None,
+                          recursos=None, paralelismo=None):
     """
     Gera um relatório detalhado do processamento do arquivo CNAB
     
@@ -174,6 +156,13 @@ def generate_processing_report(banco, total_lines, linhas_validas, linhas_invali
         count_tipo_desconhecido (int): Número de linhas com tipo não identificado
         tempo_total (float): Tempo total de processamento em segundos
         output_files (list): Lista de arquivos gerados pelo processamento
+        tempo_fila (float, optional): Tempo em segundos que o arquivo aguardou na fila
+        versao_config (str, optional): Versão da configuração usada no processamento
+        regra (str, optional): Regra de filtro multi-campo aplicada
+        perfis (dict, optional): Registros mantidos por perfil de saída adicional
+        erros_integridade (list, optional): Divergências de trailer/sequencial (vazia: arquivo íntegro)
+        recursos (list, optional): Linhas da seção de recursos (memória, descritores), com PROFILING=true
+        paralelismo (list, optional): Níveis de paralelismo escolhidos, com CONCORRENCIA_ADAPTATIVA=true
     
     Returns:
         str: Relatório formatado em texto
@@ -187,6 +176,17 @@ def generate_processing_report(banco, total_lines, linhas_validas, linhas_invali
     report.append(f"\n📊 INFORMAÇÕES GERAIS:")
     report.append(f"  • Banco identificado: {banco}")
     report.append(f"  • Total de linhas no arquivo: {total_lines}")
+    if tempo_fila is not None:
+        report.append(f"  • Tempo em fila: {tempo_fila:.2f} segundos")
+    if versao_config:
+        report.append(f"  • Versão da configuração: {versao_config}")
+    if erros_integridade is not None:
+        if erros_integridade:
+            report.append(f"  • Integridade: {len(erros_integridade)} divergência(s)")
+            for erro in erros_integridade:
+                report.append(f"      - {erro}")
+        else:
+            report.append(f"  • Integridade: OK (header, trailer e sequencial conferidos)")
     
     # Calcular registros de dados (excluindo header e trailer)
     # linhas_validas já deve representar apenas os registros de dados válidos
@@ -200,6 +200,24 @@ def generate_processing_report(banco, total_lines, linhas_validas, linhas_invali
         report.append(f"  • Registros válidos (dados): {linhas_validas}")
         report.append(f"  • Registros inválidos: {linhas_invalidas}")
         report.append(f"  • Registros mantidos: {lines_kept}")
+    if regra:
+        report.append(f"  • Regra de filtro: {regra}")
+    
+    # Perfis de saída adicionais
+    if perfis:
+        report.append(f"\n🧩 PERFIS DE SAÍDA:")
+        for nome, mantidos in perfis.items():
+            report.append(f"  • {nome}: {mantidos} registros mantidos")
+    
+    # Recursos usados no processamento (PROFILING=true)
+    if recursos:
+        report.append(f"\n🧠 RECURSOS:")
+        report.extend(recursos)
+    
+    # Paralelismo escolhido pelo controlador adaptativo (CONCORRENCIA_ADAPTATIVA=true)
+    if paralelismo:
+        report.append(f"\n⚙️ PARALELISMO:")
+        report.extend(paralelismo)
     
     # Detalhes das operações
     report.append(f"\n🔍 ANÁLISE DE OPERAÇÕES:")
@@ -241,8 +259,9 @@ def generate_processing_report(banco, total_lines, linhas_validas, linhas_invali
         for idx, file_path in enumerate(unique_files, 1):
             file_name = os.path.basename(file_path)
             file_dir = os.path.dirname(file_path)
-            if os.path.exists(file_path):
-                file_size = os.path.getsize(file_path) / 1024  # KB
+            file_size = network_fs.file_size(file_path)
+            if file_size is not None:
+                file_size = file_size / 1024  # KB
                 report.append(f"  {idx}. {file_name} ({file_size:.2f} KB)")
                 report.append(f"     📂 {file_dir}")
             else:
@@ -269,13 +288,30 @@ def backup_original_file(cnab_filepath):
         if not os.path.exists(cnab_dir):
             try:
                 os.makedirs(cnab_dir)
-                print(f"Pasta de backup 'cnab' criada: {cnab_dir}")
+                logger.info(f"Pasta de backup 'cnab' criada: {cnab_dir}")
             except Exception as e:
-                print(f"Erro ao criar pasta de backup 'cnab': {str(e)}")
+                logger.error(f"Erro ao criar pasta de backup 'cnab': {str(e)}")
                 return None, False
         
         # Obter o nome do arquivo original
         original_filename = os.path.basename(cnab_filepath)
+        
+        # Backup compactado (COMPACTAR_BACKUP): sempre com timestamp no nome; o '_' impede que
+        # ele seja tratado como um arquivo novo se a pasta cnab for monitorada
+        codec = output_codec('COMPACTAR_BACKUP') if not compression_of(original_filename) else None
+        if codec:
+            filename_parts = os.path.splitext(original_filename)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = os.path.join(
+                cnab_dir, f"{filename_parts[0]}_{timestamp}{filename_parts[1]}{EXTENSAO_POR_CODEC[codec]}")
+            try:
+                compress_file(cnab_filepath, backup_path, codec)
+                file_size = os.path.getsize(backup_path) / 1024  # KB
+                logger.info(f"Backup compactado ({codec}) realizado com sucesso: {backup_path} ({file_size:.2f} KB)")
+                return backup_path, True
+            except Exception as e:
+                logger.error(f"Erro no backup compactado, gravando sem compressão: {str(e)}")
+        
         backup_path = os.path.join(cnab_dir, original_filename)
         
         # Verificar se o arquivo já existe no backup
@@ -290,32 +326,32 @@ def backup_original_file(cnab_filepath):
             import shutil
             shutil.copy2(cnab_filepath, backup_path)
             file_size = os.path.getsize(backup_path) / 1024  # KB
-            print(f"Backup realizado com sucesso: {backup_path} ({file_size:.2f} KB)")
+            logger.info(f"Backup realizado com sucesso: {backup_path} ({file_size:.2f} KB)")
             return backup_path, True
         except Exception as e:
-            print(f"Erro no método principal de backup: {str(e)}")
+            logger.error(f"Erro no método principal de backup: {str(e)}")
             
             # Método alternativo: cópia binária direta
             try:
-                print("Tentando método alternativo de backup...")
+                logger.info("Tentando método alternativo de backup...")
                 with open(cnab_filepath, 'rb') as src_file:
                     with open(backup_path, 'wb') as dst_file:
                         dst_file.write(src_file.read())
                 
                 if os.path.exists(backup_path):
                     file_size = os.path.getsize(backup_path) / 1024  # KB
-                    print(f"Backup realizado com método alternativo: {backup_path} ({file_size:.2f} KB)")
+                    logger.info(f"Backup realizado com método alternativo: {backup_path} ({file_size:.2f} KB)")
                     return backup_path, True
                 else:
-                    print("Falha no backup alternativo: arquivo não foi criado")
+                    logger.info("Falha no backup alternativo: arquivo não foi criado")
                     return None, False
             except Exception as e2:
-                print(f"Falha final no backup: {str(e2)}")
+                logger.info(f"Falha final no backup: {str(e2)}")
                 return None, False
                 
     except Exception as e:
-        print(f"Erro ao realizar backup do arquivo original: {str(e)}")
-        print(traceback.format_exc())
+        logger.error(f"Erro ao realizar backup do arquivo original: {str(e)}")
+        logger.error(traceback.format_exc())
         return None, False
 
 def should_process_file(filename):
@@ -332,15 +368,371 @@ def should_process_file(filename):
     if '_' in filename:
         return False
     
-    # Verifica extensão
-    if not (filename.upper().endswith('.RET') or filename.lower().endswith('.ret')):
+    # Verifica extensão (.RET puro ou compactado: .RET.gz, .RET.zst, .zip)
+    if not is_cnab_name(filename):
         return False
     
     return True
 
-def process_cnab_file(arquivo, operacoes_desejadas=None, banco=None, separar_antecipacao=False, output_dirs=None):
+def write_cnab_lines(caminho, linhas, renumerar=True, trailer_totais=False, parte=False):
+    """
+    Grava as linhas de uma saída CNAB
+
+    Por padrão as linhas são gravadas como foram lidas (header e trailer
+    originais, como o ERP sempre recebeu). Com RECALCULAR_TRAILER=true, o
+    sequencial é renumerado e, se o banco declara totais do arquivo no
+    trailer (``trailer_totais``, ver BankConfig), o trailer passa a refletir a
+    quantidade e o valor total dos registros mantidos. ``renumerar=False``
+    grava as linhas como estão mesmo assim (saídas CNAB240, cujos trailers já
+    são reconstruídos na classificação).
+
+    ``parte=True`` (partes de DIVIDIR_SAIDA_REGISTROS e partições por data)
+    renumera sempre, independente de RECALCULAR_TRAILER: com o sequencial
+    original, cada parte teria lacunas e não seria um arquivo CNAB válido.
+
+    A gravação é atômica: o conteúdo vai para <caminho>.tmp e só então
+    substitui o arquivo final.
+    """
+    if renumerar and (parte or os.getenv('RECALCULAR_TRAILER', 'false').lower() == 'true'):
+        linhas = renumber_cnab_lines(linhas, trailer_totais)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(linhas))
+    os.replace(temporario, caminho)
+
+def _sorted_output(linhas, ordenacao):
+    """Linhas de uma saída na ordem configurada em ORDENAR_SAIDA"""
+    if not ordenacao['chave']:
+        return linhas
+    return sort_cnab_lines(linhas, ordenacao['chave'], ordenacao['max_registros_memoria'], ordenacao['tmp_dir'])
+
+def write_cnab_outputs(arquivo, resultado, separar_antecipacao, timestamp, relatorio, perfil=None,
+                       output_format=None, trailer_totais=False):
+    """
+    Grava no diretório do arquivo original as saídas de um processamento
+
+    Args:
+        arquivo (str): Caminho para o arquivo CNAB original
+        resultado (CnabResult): Resultado retornado por filter_cnab
+        separar_antecipacao (bool): Indica se devem ser gerados os arquivos normal/antecipado
+        timestamp (str): Timestamp usado nos nomes dos arquivos gerados
+        relatorio (list): Lista de mensagens do relatório (recebe alertas)
+        perfil (str, optional): Nome do perfil de saída; entra no nome dos arquivos
+            (<nome>_<perfil>_alterado) e dispensa a cópia do original
+        output_format (str, optional): Formato da planilha de antecipadas ('csv'/'xls'); padrão OUTPUT_FORMAT
+        trailer_totais (bool, optional): O trailer do banco traz quantidade/valor do próprio
+            arquivo e é recalculado junto com o sequencial (BankConfig.trailer_totais)
+
+    Com ORDENAR_SAIDA, os registros de todas as saídas são ordenados pelos campos
+    informados. Com PARTICIONAR_SAIDA_POR_DATA=true, o arquivo alterado é gravado
+    em uma partição por data de vencimento (_alterado_AAAAMMDD) e, com
+    DIVIDIR_SAIDA_REGISTROS > 0, em partes de até esse número de registros
+    (_alterado_parte001, ...). Cada parte tem o header e o trailer originais com
+    o sequencial sempre renumerado (e os totais do trailer recalculados se o
+    banco os declara); a saída única só é renumerada com
+    RECALCULAR_TRAILER=true. 'partes' lista os caminhos e 'alterado' aponta
+    para o primeiro.
+
+    Saídas CNAB240 são gravadas em um único arquivo alterado, na ordem
+    original: os trailers de lote/arquivo já vêm reconstruídos da
+    classificação e o layout não tem separação normal/antecipado.
+
+    Returns:
+        tuple: (dict, list) - (caminhos de saída por tipo, lista de (caminho, tamanho_kb) gerados)
+    """
+    diretorio = os.path.dirname(arquivo)
+    nome_base, extensao = os.path.splitext(cnab_name(arquivo))
+    arquivos_gerados = []
+
+    # Nome do arquivo alterado (sem timestamp se já tiver)
+    sufixo_perfil = f"_{perfil}" if perfil else ""
+    if re.search(r'\d{14}', nome_base):
+        arquivo_alterado = os.path.join(diretorio, f"{nome_base}{sufixo_perfil}_alterado{extensao}")
+    else:
+        arquivo_alterado = os.path.join(diretorio, f"{nome_base}_{timestamp}{sufixo_perfil}_alterado{extensao}")
+
+    saidas = {
+        'alterado': arquivo_alterado,
+        'normal': None,
+        'antecipado': None,
+        'output_antecipado': None,
+    }
+
+    # Salvar arquivo alterado com as linhas filtradas (ordenado, particionado e em partes, se configurado)
+    cnab240 = resultado.layout == LAYOUT_CNAB240
+    if cnab240:
+        # Trailers de lote/arquivo já reconstruídos; sem ordenação, partes nem separação por tipo
+        ordenacao, registros_por_parte, separar_antecipacao = None, 0, False
+    else:
+        ordenacao = get_sort_settings()
+        registros_por_parte = int(os.getenv('DIVIDIR_SAIDA_REGISTROS', '0') or 0)
+    raiz_alterado, extensao_alterado = os.path.splitext(arquivo_alterado)
+    for sufixo, linhas_peca in iter_output_pieces(resultado.linhas_alteradas, registros_por_parte, ordenacao):
+        if not sufixo:
+            write_cnab_lines(arquivo_alterado, linhas_peca, not cnab240, trailer_totais)
+            tamanho_alterado = os.path.getsize(arquivo_alterado) / 1024  # KB
+            logger.info(f"💾 Arquivo alterado salvo: {os.path.basename(arquivo_alterado)} ({tamanho_alterado:.2f} KB)")
+            arquivos_gerados.append((arquivo_alterado, tamanho_alterado))
+            continue
+        arquivo_peca = f"{raiz_alterado}{sufixo}{extensao_alterado}"
+        write_cnab_lines(arquivo_peca, linhas_peca, trailer_totais=trailer_totais, parte=True)
+        tamanho_peca = os.path.getsize(arquivo_peca) / 1024  # KB
+        logger.info(f"💾 Parte do arquivo alterado salva: {os.path.basename(arquivo_peca)} ({tamanho_peca:.2f} KB)")
+        arquivos_gerados.append((arquivo_peca, tamanho_peca))
+        saidas.setdefault('partes', []).append(arquivo_peca)
+    if saidas.get('partes'):
+        saidas['alterado'] = saidas['partes'][0]
+        relatorio.append(f"  • Arquivo alterado gravado em {len(saidas['partes'])} partes")
+
+    # Cria cópia do arquivo original com timestamp se necessário (uma vez, na saída principal);
+    # um original compactado é copiado como está (X_<timestamp>.RET.gz)
+    if not perfil and not re.search(r'\d{14}', nome_base):
+        sufixo_compressao = os.path.splitext(arquivo)[1] if compression_of(arquivo) else ''
+        arquivo_original_com_timestamp = os.path.join(
+            diretorio, f"{nome_base}_{timestamp}{extensao}{sufixo_compressao}")
+        shutil.copy2(arquivo, arquivo_original_com_timestamp)
+        tamanho_original = os.path.getsize(arquivo_original_com_timestamp) / 1024  # KB
+        logger.info(f"💾 Cópia do original salva: {os.path.basename(arquivo_original_com_timestamp)} ({tamanho_original:.2f} KB)")
+        arquivos_gerados.append((arquivo_original_com_timestamp, tamanho_original))
+
+    if not separar_antecipacao:
+        return saidas, arquivos_gerados
+
+    # Salvar arquivo de operações normais
+    arquivo_normal = arquivo_alterado.replace('_alterado', '_normal')
+    if resultado.linhas_normais:
+        write_cnab_lines(arquivo_normal, _sorted_output(resultado.linhas_normais, ordenacao),
+                         trailer_totais=trailer_totais)
+        tamanho_normal = os.path.getsize(arquivo_normal) / 1024  # KB
+        logger.info(f"💾 Arquivo normal salvo: {os.path.basename(arquivo_normal)} ({tamanho_normal:.2f} KB)")
+        arquivos_gerados.append((arquivo_normal, tamanho_normal))
+        saidas['normal'] = arquivo_normal
+    else:
+        logger.warning("⚠️ Nenhuma operação normal encontrada, arquivo normal não gerado")
+        relatorio.append("⚠️ ALERTA: Nenhuma operação normal encontrada")
+
+    # Salvar arquivo de operações antecipadas
+    arquivo_antecipado = arquivo_alterado.replace('_alterado', '_antecipado')
+    if resultado.linhas_antecipadas:
+        write_cnab_lines(arquivo_antecipado, _sorted_output(resultado.linhas_antecipadas, ordenacao),
+                         trailer_totais=trailer_totais)
+        tamanho_antecipado = os.path.getsize(arquivo_antecipado) / 1024  # KB
+        logger.info(f"💾 Arquivo antecipado salvo: {os.path.basename(arquivo_antecipado)} ({tamanho_antecipado:.2f} KB)")
+        arquivos_gerados.append((arquivo_antecipado, tamanho_antecipado))
+        saidas['antecipado'] = arquivo_antecipado
+
+        # Gerar arquivo de saída (CSV/XLS) para operações antecipadas
+        if generate_output_for_antecipated_operations:
+            formato = output_format or os.getenv('OUTPUT_FORMAT', 'csv')
+            output_format = formato.upper()
+            try:
+                sucesso_output, mensagem_output, caminho_output = generate_output_for_antecipated_operations(
+                    arquivo_antecipado, formato)
+                if sucesso_output and caminho_output:
+                    tamanho_output = os.path.getsize(caminho_output) / 1024  # KB
+                    logger.info(f"📈 {output_format} antecipado gerado: {os.path.basename(caminho_output)} ({tamanho_output:.2f} KB)")
+                    arquivos_gerados.append((caminho_output, tamanho_output))
+                    relatorio.append(f"📈 {output_format}: {mensagem_output}")
+                    saidas['output_antecipado'] = caminho_output
+                else:
+                    logger.warning(f"⚠️ Falha ao gerar {output_format}: {mensagem_output}")
+                    relatorio.append(f"⚠️ {output_format}: {mensagem_output}")
+            except Exception as e:
+                logger.error(f"❌ Erro ao gerar {output_format}: {str(e)}")
+                relatorio.append(f"❌ Erro {output_format}: {str(e)}")
+    else:
+        logger.warning("⚠️ Nenhuma operação antecipada encontrada, arquivo antecipado não gerado")
+        relatorio.append("⚠️ ALERTA: Nenhuma operação antecipada encontrada")
+
+    return saidas, arquivos_gerados
+
+def list_output_files(saidas):
+    """
+    Lista os arquivos de um dicionário retornado por write_cnab_outputs
+
+    Returns:
+        list: [(descricao, caminho)] na ordem de cópia
+    """
+    arquivos = []
+    if saidas.get('partes'):
+        arquivos.extend(("💾 Parte do arquivo alterado", caminho) for caminho in saidas['partes'])
+    elif saidas.get('alterado'):
+        arquivos.append(("💾 Arquivo alterado", saidas['alterado']))
+    for chave, descricao in (('normal', "💾 Arquivo normal"),
+                             ('antecipado', "💾 Arquivo antecipado"),
+                             ('output_antecipado', "📈 Arquivo de saída antecipado")):
+        if saidas.get(chave):
+            arquivos.append((descricao, saidas[chave]))
+    return arquivos
+
+def copy_outputs_to_dirs(saidas, output_dirs, diretorio_origem, journal=None):
+    """
+    Copia os arquivos gerados por write_cnab_outputs para os diretórios de saída
+
+    Args:
+        saidas (dict): Caminhos de saída por tipo (retornado por write_cnab_outputs)
+        output_dirs (list): Lista de diretórios de destino
+        diretorio_origem (str): Diretório onde as saídas foram gravadas (não recebe cópia)
+        journal (ProcessingJournal, optional): Cada cópia concluída (ou enfileirada) é
+            registrada; cópias já registradas são puladas ao retomar um processamento
+
+    Com COMPACTAR_COPIAS (gzip, zip ou zstd), cada saída é compactada uma vez
+    ao lado do original (ex: _alterado.RET.gz, mantida como arquivo) e é essa
+    versão que segue para os diretórios. Planilhas .xlsx já são compactadas
+    e seguem como estão.
+
+    Returns:
+        list: Lista de (caminho, tamanho_kb) dos arquivos copiados
+    """
+    arquivos_copiados = []
+    arquivos = list_output_files(saidas)
+    codec = output_codec('COMPACTAR_COPIAS')
+    compactados = {}
+
+    for output_dir in output_dirs or []:
+        if not output_dir or output_dir == diretorio_origem:
+            continue
+        # Diretórios no compartilhamento de rede são tratados por network_fs (pendências se indisponível)
+        if not network_fs.guard_for(output_dir) and not os.path.exists(output_dir):
+            continue
+
+        logger.info(f"\n📂 Copiando arquivos para diretório adicional: {output_dir}")
+        for descricao, origem in arquivos:
+            if journal and journal.copied(origem, output_dir):
+                logger.info(f"{descricao} já copiado anteriormente: {os.path.basename(origem)}")
+                continue
+            try:
+                enviado = origem
+                if codec and not origem.lower().endswith('.xlsx'):
+                    if origem not in compactados:
+                        compactados[origem] = compress_file(origem, origem + EXTENSAO_POR_CODEC[codec], codec)
+                    enviado = compactados[origem]
+                destino = network_fs.copy_to_dir(enviado, output_dir)
+                if journal:
+                    journal.record_copy(origem, output_dir)
+                if not destino:
+                    continue
+                tamanho = (network_fs.file_size(destino) or os.path.getsize(enviado)) / 1024  # KB
+                logger.info(f"{descricao} copiado: {os.path.basename(destino)} ({tamanho:.2f} KB)")
+                arquivos_copiados.append((destino, tamanho))
+            except Exception as e:
+                logger.error(f"❌ Erro ao copiar {os.path.basename(origem)} para {output_dir}: {str(e)}")
+
+    return arquivos_copiados
+
+class DeferredCopies(list):
+    """
+    Cópias adiadas de process_cnab_file (argumento copias_adiadas)
+
+    A lista recebe os caminhos a copiar (saídas e relatório). Enquanto houver
+    cópias em aberto, o arquivo não é registrado como processado e o journal
+    é mantido: uma queda antes do fim das cópias retoma o arquivo pelas que
+    ainda não foram registradas. Quem faz as cópias chama copied() para cada
+    uma (também quando ela ficou na fila de pendências do compartilhamento)
+    e complete() depois da última.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.arquivo = None
+        self.journal = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Devolvida pelo processo de processamento do daemon: a trava não atravessa processos
+        estado = self.__dict__.copy()
+        del estado['_lock']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    def pending_for(self, diretorio):
+        """Caminhos ainda não copiados (nem enfileirados) para o diretório"""
+        if self.journal is None:
+            return list(self)
+        return [origem for origem in self if not self.journal.copied(origem, diretorio)]
+
+    def copied(self, origem, diretorio):
+        """Registra no journal uma cópia concluída ou enfileirada em pendências"""
+        if self.journal is not None:
+            with self._lock:
+                self.journal.record_copy(origem, diretorio)
+
+    def complete(self):
+        """Todas as cópias feitas: registra o arquivo como processado e remove o journal"""
+        register_processed_file(os.path.basename(self.arquivo))
+        if self.journal is not None:
+            self.journal.finish()
+
+def write_rejects_sidecar(arquivo, linhas_rejeitadas, timestamp):
+    """
+    Grava as linhas rejeitadas de um arquivo em <nome>_<timestamp>_rejeitados.csv, ao lado do original
+
+    Returns:
+        str: Caminho do arquivo gerado, ou None em caso de erro
+    """
+    diretorio = os.path.dirname(arquivo)
+    nome_base = os.path.splitext(cnab_name(arquivo))[0]
+    if not re.search(r'\d{14}', nome_base):
+        nome_base = f"{nome_base}_{timestamp}"
+    caminho = os.path.join(diretorio, f"{nome_base}_rejeitados.csv")
+    try:
+        write_rejects_file(caminho, linhas_rejeitadas)
+        return caminho
+    except OSError as e:
+        logger.warning(f"⚠️ Erro ao gravar linhas rejeitadas: {str(e)}")
+        return None
+
+def quarantine_file(arquivo, erros):
+    """
+    Move um arquivo com falha de integridade para a quarentena (QUARENTENA_DIR, padrão: quarentena)
+
+    O motivo é gravado em <nome>.motivo.txt ao lado do arquivo. Como o arquivo sai
+    do diretório monitorado, uma nova entrega com o mesmo nome é processada normalmente.
+
+    Args:
+        arquivo (str): Caminho do arquivo CNAB
+        erros (list): Divergências encontradas
+
+    Returns:
+        str or None: Caminho do arquivo na quarentena, ou None em caso de erro
+    """
+    try:
+        quarentena_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      os.getenv('QUARENTENA_DIR', 'quarentena'))
+        os.makedirs(quarentena_dir, exist_ok=True)
+        nome_base, extensao = os.path.splitext(os.path.basename(arquivo))
+        destino = os.path.join(quarentena_dir, os.path.basename(arquivo))
+        if os.path.exists(destino):
+            destino = os.path.join(quarentena_dir, f"{nome_base}_{datetime.now().strftime('%Y%m%d%H%M%S')}{extensao}")
+        shutil.move(arquivo, destino)
+        with open(f"{destino}.motivo.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Quarentena em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"Origem: {arquivo}\n")
+            for erro in erros:
+                f.write(f"- {erro}\n")
+        logger.warning(f"🚫 Arquivo movido para a quarentena: {destino}")
+        return destino
+    except Exception as e:
+        logger.error(f"❌ Erro ao mover {os.path.basename(arquivo)} para a quarentena: {str(e)}")
+        return None
+
+def process_cnab_file(arquivo, operacoes_desejadas=None, banco=None, separar_antecipacao=False, output_dirs=None,
+                      copias_adiadas=None, tempo_fila=None, versao_config=None, bank_config=None, perfis=None,
+                      origem=None):
     """
     Processa um arquivo CNAB, filtrando por operações desejadas e identificando o banco.
+
+    A filtragem em si é feita por cnab_core.filter_cnab (sem efeitos colaterais;
+    com PARSE_CACHE=true, via cnab_parse_cache.filter_cnab_cached); esta função
+    cuida do backup, da gravação das saídas, das cópias, do relatório e do
+    registro do arquivo como processado.
+
+    Cada etapa concluída vai para o journal do arquivo (cnab_journal.py). Se
+    um processamento anterior foi interrompido depois de gravar as saídas, e
+    elas continuam íntegras, só as etapas seguintes são refeitas.
     
     Args:
         arquivo (str): Caminho para o arquivo CNAB
@@ -348,332 +740,304 @@ def process_cnab_file(arquivo, operacoes_desejadas=None, banco=None, separar_ant
         banco (str, optional): Nome do banco para forçar a identificação
         separar_antecipacao (bool, optional): Indica se deve separar operações antecipadas
         output_dirs (list, optional): Lista de diretórios onde salvar os arquivos processados
+        copias_adiadas (DeferredCopies, optional): Se informada, as cópias para output_dirs não são
+            feitas; os caminhos dos arquivos a copiar (saídas e relatório) são adicionados a ela, e o
+            registro do arquivo e a remoção do journal ficam para copias_adiadas.complete()
+        tempo_fila (float, optional): Tempo em segundos que o arquivo aguardou na fila (vai para o relatório)
+        versao_config (str, optional): Versão da configuração usada (vai para o relatório)
+        bank_config (BankConfig, optional): Configuração compilada do banco; sua regra
+            multi-campo (<BANCO>_REGRA), se houver, é aplicada junto com as operações
+        perfis (list, optional): Perfis de saída adicionais (OutputProfile), gerados na mesma
+            leitura e classificação do arquivo, cada um com seus próprios arquivos
+        origem (str, optional): Caminho no compartilhamento quando ``arquivo`` é a cópia local
+            feita por _process_share_file (o journal multi-nó fica junto do original)
         
     Returns:
         tuple: (caminho_arquivo_alterado, string_relatorio, status_processamento)
     """
-    import time
+    # Arquivos no compartilhamento de rede são processados a partir de uma cópia local
+    if origem is None and network_fs.guard_for(arquivo):
+        return _process_share_file(arquivo, operacoes_desejadas, banco, separar_antecipacao, output_dirs,
+                                   copias_adiadas, tempo_fila, versao_config, bank_config, perfis)
+
     inicio_processamento = time.time()
     
-    print(f"\n🔄 Processando arquivo: {os.path.basename(arquivo)}")
+    logger.info(f"\n🔄 Processando arquivo: {os.path.basename(arquivo)}")
     tamanho_arquivo = os.path.getsize(arquivo) / 1024  # KB
-    print(f"📦 Tamanho do arquivo: {tamanho_arquivo:.2f} KB")
+    logger.info(f"📦 Tamanho do arquivo: {tamanho_arquivo:.2f} KB")
     
-    # Fazer backup do arquivo original na pasta cnab
-    backup_path, backup_success = backup_original_file(arquivo)
-    
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    
-    # Preparar relatório
-    relatorio = []
-    relatorio.append("=" * 80)
-    relatorio.append(f"RELATÓRIO DE PROCESSAMENTO CNAB - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    relatorio.append("=" * 80)
-    relatorio.append("")
-    
-    # Contadores para estatísticas
-    total_linhas = 0
-    linhas_validas = 0
-    linhas_invalidas = 0
-    linhas_mantidas = 0
-    
-    # Contadores para tipos de operações
-    contagem_operacoes = {}
-    
-    # Contadores para tipos de valor (normal/antecipado)
-    operacoes_normais = 0
-    operacoes_antecipadas = 0
-    operacoes_sem_tipo = 0
-    
-    # Lista para guardar arquivos gerados
-    arquivos_gerados = []
-    
-    # Adicionar o arquivo de backup à lista se o backup foi bem-sucedido
-    if backup_success and backup_path:
-        backup_tamanho = os.path.getsize(backup_path) / 1024  # KB
-        arquivos_gerados.append((backup_path, backup_tamanho))
-        print(f"📁 Backup original salvo em: {backup_path} ({backup_tamanho:.2f} KB)")
+    # Processamento interrompido depois de gravar as saídas: retoma pelas cópias/relatório/registro
+    journal = open_journal(arquivo, origem)
+    if journal and journal.stage(ETAPA_CONCLUIDO):
+        # Modo multi-nó: o nó anterior concluiu o arquivo e caiu antes de gravar o .done do lease
+        logger.info("♻️ Processamento já concluído antes da interrupção; apenas registrando o arquivo")
+        if copias_adiadas is None:
+            register_processed_file(os.path.basename(arquivo))
+        else:
+            copias_adiadas.arquivo, copias_adiadas.journal = arquivo, journal
+        return None, "Processamento já concluído antes da interrupção", True
+    retomada = journal.stage(ETAPA_SAIDAS) if journal else None
+    if retomada is not None:
+        if journal.outputs_intact(retomada):
+            logger.info("♻️ Retomando processamento interrompido: saídas já gravadas, refazendo apenas as etapas pendentes")
+            return _finish_processing(arquivo, retomada['relatorio'], retomada['saidas'],
+                                      [tuple(gerado) for gerado in retomada['arquivos']], output_dirs,
+                                      copias_adiadas, inicio_processamento - retomada['segundos'], None, journal)
+        logger.warning("⚠️ Saídas do processamento interrompido foram alteradas ou removidas; reprocessando o arquivo")
     
-    # Detectar banco
+    # Orçamento de memória (MEMORIA_ORCAMENTO_MB): recusa para a quarentena ou adia para o próximo ciclo
+    acao_memoria, mensagem_memoria = check_memory_budget(arquivo)
+    if acao_memoria == ACAO_RECUSAR:
+        logger.warning(f"🚫 {mensagem_memoria}")
+        quarantine_file(arquivo, [mensagem_memoria])
+        return None, mensagem_memoria, False
+    if acao_memoria == ACAO_ADIAR:
+        logger.info(f"⏸️ {mensagem_memoria}")
+        return None, mensagem_memoria, False
+    perfil_recursos = start_file_profile(arquivo)
     try:
-        banco_detectado = identify_bank(arquivo) if not banco else banco
-        if not banco_detectado:
-            print("⚠️ Não foi possível identificar o banco do arquivo")
-            relatorio.append("⚠️ ALERTA: Não foi possível identificar o banco do arquivo")
-            banco_detectado = "DESCONHECIDO"
+        # Fazer backup do arquivo original na pasta cnab (reaproveita o de uma tentativa interrompida)
+        inicio_journal = journal.stage(ETAPA_INICIO) if journal else None
+        if inicio_journal and inicio_journal['backup'] and os.path.exists(inicio_journal['backup']):
+            backup_path, backup_success = inicio_journal['backup'], True
         else:
-            print(f"🏦 Banco identificado: {banco_detectado}")
-            relatorio.append(f"📊 INFORMAÇÕES GERAIS:")
-            relatorio.append(f"  • Banco identificado: {banco_detectado}")
-    except Exception as e:
-        print(f"❌ Erro ao identificar banco: {str(e)}")
-        relatorio.append(f"❌ ERRO: Falha ao identificar banco - {str(e)}")
-        banco_detectado = "ERRO"
+            backup_path, backup_success = backup_original_file(arquivo)
     
-    # Definir caminhos dos arquivos de saída
-    diretorio = os.path.dirname(arquivo)
-    nome_arquivo = os.path.basename(arquivo)
-    nome_base, extensao = os.path.splitext(nome_arquivo)
+        # Mesmo timestamp da tentativa interrompida: saídas parciais são sobrescritas, não duplicadas
+        timestamp = inicio_journal['timestamp'] if inicio_journal else datetime.now().strftime("%Y%m%d%H%M%S")
+        if journal and not inicio_journal:
+            journal.append(ETAPA_INICIO, timestamp=timestamp, backup=backup_path if backup_success else None)
     
-    # Nome do arquivo alterado (sem timestamp se já tiver)
-    if re.search(r'\d{14}', nome_base):
-        arquivo_alterado = os.path.join(diretorio, f"{nome_base}_alterado{extensao}")
-    else:
-        arquivo_alterado = os.path.join(diretorio, f"{nome_base}_{timestamp}_alterado{extensao}")
+        # Preparar relatório
+        relatorio = []
+        relatorio.append("=" * 80)
+        relatorio.append(f"RELATÓRIO DE PROCESSAMENTO CNAB - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        relatorio.append("=" * 80)
+        relatorio.append("")
     
-    # Nomes para arquivos separados por tipo
-    arquivo_normal = arquivo_alterado.replace('_alterado', '_normal')
-    arquivo_antecipado = arquivo_alterado.replace('_alterado', '_antecipado')
+        # Lista para guardar arquivos gerados
+        arquivos_gerados = []
     
-    # Verificar se as operações desejadas foram especificadas
-    if not operacoes_desejadas or not isinstance(operacoes_desejadas, list) or len(operacoes_desejadas) == 0:
-        print("⚠️ Nenhuma operação desejada especificada, mantendo todas as linhas")
-        relatorio.append("⚠️ ALERTA: Nenhuma operação desejada especificada, mantendo todas as linhas")
+        # Adicionar o arquivo de backup à lista se o backup foi bem-sucedido
+        if backup_success and backup_path:
+            backup_tamanho = os.path.getsize(backup_path) / 1024  # KB
+            arquivos_gerados.append((backup_path, backup_tamanho))
+            logger.info(f"📁 Backup original salvo em: {backup_path} ({backup_tamanho:.2f} KB)")
     
-    try:
-        # Primeiro, tente com UTF-8
-        with open(arquivo, 'r', encoding='utf-8') as f:
-            primeira_linha = f.readline()
-            # Verificar se a primeira linha está no formato esperado
-            if len(primeira_linha.strip()) < 240:  # CNAB400 tem pelo menos 400 caracteres por linha
-                print(f"⚠️ A primeira linha não está no formato esperado. Comprimento: {len(primeira_linha.strip())}")
-                relatorio.append(f"⚠️ ALERTA: Primeira linha com formato incorreto ({len(primeira_linha.strip())} caracteres)")
-    except UnicodeDecodeError:
-        # Se falhar com UTF-8, tente com latin-1
+        # Detectar banco
         try:
-            with open(arquivo, 'r', encoding='latin-1') as f:
-                primeira_linha = f.readline()
-                if len(primeira_linha.strip()) < 240:
-                    print(f"⚠️ A primeira linha não está no formato esperado. Comprimento: {len(primeira_linha.strip())}")
-                    relatorio.append(f"⚠️ ALERTA: Primeira linha com formato incorreto ({len(primeira_linha.strip())} caracteres)")
+            banco_detectado = identify_bank(read_first_record(arquivo)) if not banco else banco
+            if not banco_detectado:
+                logger.warning("⚠️ Não foi possível identificar o banco do arquivo")
+                relatorio.append("⚠️ ALERTA: Não foi possível identificar o banco do arquivo")
+                banco_detectado = "DESCONHECIDO"
+            else:
+                logger.info(f"🏦 Banco identificado: {banco_detectado}")
+                relatorio.append(f"📊 INFORMAÇÕES GERAIS:")
+                relatorio.append(f"  • Banco identificado: {banco_detectado}")
         except Exception as e:
-            print(f"❌ Erro ao verificar primeira linha: {str(e)}")
-            relatorio.append(f"❌ ERRO: Falha ao verificar primeira linha - {str(e)}")
+            logger.error(f"❌ Erro ao identificar banco: {str(e)}")
+            relatorio.append(f"❌ ERRO: Falha ao identificar banco - {str(e)}")
+            banco_detectado = "ERRO"
     
-    # Listas para as linhas de cada tipo
-    linhas_normais = []
-    linhas_antecipadas = []
+        # Verificar se as operações desejadas foram especificadas
+        if not operacoes_desejadas or not isinstance(operacoes_desejadas, list) or len(operacoes_desejadas) == 0:
+            logger.warning("⚠️ Nenhuma operação desejada especificada, mantendo todas as linhas")
+            relatorio.append("⚠️ ALERTA: Nenhuma operação desejada especificada, mantendo todas as linhas")
     
-    # Ler o arquivo e processar
-    try:
-        # Primeiro tente com UTF-8
+        config = BankConfig(banco_detectado, operacoes_desejadas, separar_antecipacao=separar_antecipacao,
+                            trailer_totais=bank_config.trailer_totais if bank_config is not None else False)
+        if bank_config is not None and bank_config.rule is not None:
+            config.rule, config.rule_source = bank_config.rule, bank_config.rule_source
+            logger.info(f"🔎 Regra de filtro: {config.rule_source}")
+            relatorio.append(f"  • Regra de filtro: {config.rule_source}")
+        diretorio = os.path.dirname(arquivo)
+    
+        # Ler o arquivo e processar
         try:
-            with open(arquivo, 'r', encoding='utf-8') as f:
-                linhas = f.readlines()
-        except UnicodeDecodeError:
-            # Se falhar, tente com latin-1
-            with open(arquivo, 'r', encoding='latin-1') as f:
-                linhas = f.readlines()
-        
-        total_linhas = len(linhas)
-        print(f"📊 Total de linhas no arquivo: {total_linhas}")
-        relatorio.append(f"  • Total de linhas no arquivo: {total_linhas}")
-        
-        # Processar linha por linha
-        linhas_alteradas = []
-        
-        for i, linha in enumerate(linhas):
-            total_linhas = i + 1  # Contar total de linhas
-            try:
-                linha = linha.rstrip('\n')
-                
-                # Verificar se a linha tem o tamanho mínimo esperado
-                if len(linha.strip()) < 240:
-                    linhas_invalidas += 1
-                    print(f"⚠️ Linha {i+1} ignorada: tamanho insuficiente ({len(linha.strip())} caracteres)")
-                    continue
-                
-                # Se for header (primeira linha) ou trailer (última linha), manter sempre
-                if i == 0 or i == len(linhas) - 1:
-                    linhas_alteradas.append(linha)
-                    linhas_normais.append(linha)
-                    linhas_antecipadas.append(linha)
-                    linhas_mantidas += 1
-                    continue
-                
-                # Contar apenas registros de dados (não header/trailer) como linhas válidas
-                linhas_validas += 1
-                
-                # Extrair código da operação (posição pode variar de acordo com o layout)
-                codigo_operacao = None
-                if len(linha) >= 108:  # Layout CNAB400
-                    codigo_operacao = linha[108:110].strip()
-                
-                # Extrair tipo de operação (coluna 319 - 1: Antecipada, 2: Normal)
-                tipo_operacao = None
-                if len(linha) >= 320:
-                    tipo_operacao = linha[318:319].strip()  # Zero-based index
-                
-                # Registrar estatística de operação
-                if codigo_operacao:
-                    if codigo_operacao in contagem_operacoes:
-                        contagem_operacoes[codigo_operacao] += 1
-                    else:
-                        contagem_operacoes[codigo_operacao] = 1
-                
-                # Registrar estatística por tipo
-                if tipo_operacao == '1':
-                    operacoes_antecipadas += 1
-                elif tipo_operacao == '2':
-                    operacoes_normais += 1
+            with open_cnab_input(arquivo) as f:
+                resultado = filter_cnab_cached(f, config, perfis, totais=aggregates_enabled())
+            if resultado.cache_classificacao == 'acerto':
+                logger.info("⚡ Classificação reaproveitada do cache (conteúdo já processado)")
+                relatorio.append("  • Cache de classificação: reaproveitado")
+        
+            # Verificar se a primeira linha está no formato esperado
+            tamanho_primeira_linha = len(resultado.primeira_linha.strip())
+            if resultado.layout == LAYOUT_CNAB240:
+                logger.info("📐 Layout CNAB240: títulos agrupados por segmento, trailers de lote reconstruídos")
+                relatorio.append(f"  • Layout: {resultado.layout}")
+                if config.rule is not None:
+                    logger.warning("⚠️ Regra de filtro ignorada: regras usam campos do layout CNAB400")
+                    relatorio.append("⚠️ ALERTA: Regra de filtro ignorada no layout CNAB240")
+            elif tamanho_primeira_linha < TAMANHO_MINIMO_LINHA:
+                logger.warning(f"⚠️ A primeira linha não está no formato esperado. Comprimento: {tamanho_primeira_linha}")
+                relatorio.append(f"⚠️ ALERTA: Primeira linha com formato incorreto ({tamanho_primeira_linha} caracteres)")
+        
+            logger.info(f"📊 Total de linhas no arquivo: {resultado.total_linhas}")
+            relatorio.append(f"  • Total de linhas no arquivo: {resultado.total_linhas}")
+        
+            # Avisos por linha limitados por motivo; a lista completa vai para o arquivo _rejeitados
+            avisos = RateLimitedLog(logger)
+            for numero_linha, motivo, detalhe, _ in resultado.linhas_rejeitadas:
+                if motivo == MOTIVO_TAMANHO_INSUFICIENTE:
+                    avisos.log(logging.WARNING, motivo, f"⚠️ Linha {numero_linha} ignorada: {detalhe}")
                 else:
-                    operacoes_sem_tipo += 1
-                
-                # Verificar se a operação está entre as desejadas
-                if not operacoes_desejadas or not codigo_operacao or codigo_operacao in operacoes_desejadas:
-                    linhas_alteradas.append(linha)
-                    linhas_mantidas += 1
-                    
-                    # Separar por tipo se solicitado
-                    if separar_antecipacao:
-                        if tipo_operacao == '1':
-                            linhas_antecipadas.append(linha)
-                        else:  # Incluir sem tipo ou com tipo 2 no arquivo normal
-                            linhas_normais.append(linha)
-                    else:
-                        # Se não for separar, adiciona em ambos para garantir header e trailer
-                        linhas_normais.append(linha)
-                        linhas_antecipadas.append(linha)
-                
-            except Exception as e:
-                linhas_invalidas += 1
-                print(f"❌ Erro ao processar linha {i+1}: {str(e)}")
-                relatorio.append(f"❌ ERRO: Linha {i+1} - {str(e)}")
-                continue
+                    avisos.log(logging.ERROR, motivo, f"❌ Erro ao processar linha {numero_linha}: {detalhe}")
+                    if avisos.contagem[motivo] <= avisos.limite:
+                        relatorio.append(f"❌ ERRO: Linha {numero_linha} - {detalhe}")
+            avisos.flush()
+            for motivo, omitidos in avisos.suppressed().items():
+                relatorio.append(f"⚠️ {motivo}: mais {omitidos} linha(s) omitida(s) deste relatório")
         
-        # Salvar arquivo alterado com as linhas filtradas
-        with open(arquivo_alterado, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(linhas_alteradas))
-        
-        tamanho_alterado = os.path.getsize(arquivo_alterado) / 1024  # KB
-        print(f"💾 Arquivo alterado salvo: {os.path.basename(arquivo_alterado)} ({tamanho_alterado:.2f} KB)")
-        arquivos_gerados.append((arquivo_alterado, tamanho_alterado))
-        
-        # Cria cópia do arquivo original com timestamp se necessário
-        if not re.search(r'\d{14}', nome_base):
-            arquivo_original_com_timestamp = os.path.join(diretorio, f"{nome_base}_{timestamp}{extensao}")
-            shutil.copy2(arquivo, arquivo_original_com_timestamp)
-            tamanho_original = os.path.getsize(arquivo_original_com_timestamp) / 1024  # KB
-            print(f"💾 Cópia do original salva: {os.path.basename(arquivo_original_com_timestamp)} ({tamanho_original:.2f} KB)")
-            arquivos_gerados.append((arquivo_original_com_timestamp, tamanho_original))
-        
-        # Separar por tipo (normal e antecipado) se solicitado
-        if separar_antecipacao:
-            # Salvar arquivo de operações normais
-            if linhas_normais:
-                with open(arquivo_normal, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(linhas_normais))
-                tamanho_normal = os.path.getsize(arquivo_normal) / 1024  # KB
-                print(f"💾 Arquivo normal salvo: {os.path.basename(arquivo_normal)} ({tamanho_normal:.2f} KB)")
-                arquivos_gerados.append((arquivo_normal, tamanho_normal))
-            else:
-                print("⚠️ Nenhuma operação normal encontrada, arquivo normal não gerado")
-                relatorio.append("⚠️ ALERTA: Nenhuma operação normal encontrada")
-            
-            # Salvar arquivo de operações antecipadas
-            if linhas_antecipadas:
-                with open(arquivo_antecipado, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(linhas_antecipadas))
-                tamanho_antecipado = os.path.getsize(arquivo_antecipado) / 1024  # KB
-                print(f"💾 Arquivo antecipado salvo: {os.path.basename(arquivo_antecipado)} ({tamanho_antecipado:.2f} KB)")
-                arquivos_gerados.append((arquivo_antecipado, tamanho_antecipado))
-                
-                # Gerar arquivo de saída (CSV/XLS) para operações antecipadas
-                if generate_output_for_antecipated_operations:
+            # Verificar integridade (sequencial, header/trailer e, se o banco declara, totais do trailer)
+            # antes de gravar qualquer arquivo derivado do conteúdo
+            erros_integridade = resultado.integridade.errors(config.trailer_totais)
+            for erro in erros_integridade:
+                logger.info(f"🛡️ Integridade: {erro}")
+                relatorio.append(f"❌ INTEGRIDADE: {erro}")
+            if erros_integridade and os.getenv('VALIDAR_INTEGRIDADE', 'true').lower() == 'true':
+                quarantine_file(arquivo, erros_integridade)
+                # O backup de um arquivo recusado não deve ficar junto dos backups válidos
+                if backup_success and backup_path:
                     try:
-                        output_format = os.getenv('OUTPUT_FORMAT', 'csv').upper()
-                        sucesso_output, mensagem_output, caminho_output = generate_output_for_antecipated_operations(arquivo_antecipado)
-                        if sucesso_output and caminho_output:
-                            tamanho_output = os.path.getsize(caminho_output) / 1024  # KB
-                            print(f"📈 {output_format} antecipado gerado: {os.path.basename(caminho_output)} ({tamanho_output:.2f} KB)")
-                            arquivos_gerados.append((caminho_output, tamanho_output))
-                            relatorio.append(f"📈 {output_format}: {mensagem_output}")
-                        else:
-                            print(f"⚠️ Falha ao gerar {output_format}: {mensagem_output}")
-                            relatorio.append(f"⚠️ {output_format}: {mensagem_output}")
-                    except Exception as e:
-                        output_format = os.getenv('OUTPUT_FORMAT', 'csv').upper()
-                        print(f"❌ Erro ao gerar {output_format}: {str(e)}")
-                        relatorio.append(f"❌ Erro {output_format}: {str(e)}")
-            else:
-                print("⚠️ Nenhuma operação antecipada encontrada, arquivo antecipado não gerado")
-                relatorio.append("⚠️ ALERTA: Nenhuma operação antecipada encontrada")
+                        os.remove(backup_path)
+                    except OSError as e:
+                        logger.warning(f"⚠️ Erro ao remover o backup do arquivo em quarentena: {str(e)}")
+                if journal:
+                    journal.finish()
+                relatorio.append("❌ Arquivo movido para a quarentena; nenhuma saída foi gerada")
+                return None, '\n'.join(relatorio), False
         
-        # Se foram especificados diretórios adicionais de saída, copia os arquivos para eles
-        if output_dirs:
-            for output_dir in output_dirs:
-                if output_dir and os.path.exists(output_dir) and output_dir != diretorio:
-                    print(f"\n📂 Copiando arquivos para diretório adicional: {output_dir}")
-                    
-                    # Copia o arquivo alterado
-                    destino_alterado = os.path.join(output_dir, os.path.basename(arquivo_alterado))
-                    try:
-                        shutil.copy2(arquivo_alterado, destino_alterado)
-                        tamanho = os.path.getsize(destino_alterado) / 1024  # KB
-                        print(f"💾 Arquivo alterado copiado: {os.path.basename(destino_alterado)} ({tamanho:.2f} KB)")
-                        arquivos_gerados.append((destino_alterado, tamanho))
-                    except Exception as e:
-                        print(f"❌ Erro ao copiar arquivo alterado para {output_dir}: {str(e)}")
-                    
-                    # Copia o arquivo normal se existir
-                    if separar_antecipacao and linhas_normais:
-                        destino_normal = os.path.join(output_dir, os.path.basename(arquivo_normal))
-                        try:
-                            shutil.copy2(arquivo_normal, destino_normal)
-                            tamanho = os.path.getsize(destino_normal) / 1024  # KB
-                            print(f"💾 Arquivo normal copiado: {os.path.basename(destino_normal)} ({tamanho:.2f} KB)")
-                            arquivos_gerados.append((destino_normal, tamanho))
-                        except Exception as e:
-                            print(f"❌ Erro ao copiar arquivo normal para {output_dir}: {str(e)}")
-                    
-                    # Copia o arquivo antecipado se existir
-                    if separar_antecipacao and linhas_antecipadas:
-                        destino_antecipado = os.path.join(output_dir, os.path.basename(arquivo_antecipado))
-                        try:
-                            shutil.copy2(arquivo_antecipado, destino_antecipado)
-                            tamanho = os.path.getsize(destino_antecipado) / 1024  # KB
-                            print(f"💾 Arquivo antecipado copiado: {os.path.basename(destino_antecipado)} ({tamanho:.2f} KB)")
-                            arquivos_gerados.append((destino_antecipado, tamanho))
-                            
-                            # Copia o arquivo de saída (CSV/XLS) antecipado se existir
-                            output_format = os.getenv('OUTPUT_FORMAT', 'csv').lower()
-                            if output_format == 'xls':
-                                output_antecipado = arquivo_antecipado.replace('.ret', '.xlsx').replace('.RET', '.xlsx')
-                            else:
-                                output_antecipado = arquivo_antecipado.replace('.ret', '.csv').replace('.RET', '.csv')
-                            
-                            if os.path.exists(output_antecipado):
-                                destino_output = os.path.join(output_dir, os.path.basename(output_antecipado))
-                                try:
-                                    shutil.copy2(output_antecipado, destino_output)
-                                    tamanho_output = os.path.getsize(destino_output) / 1024  # KB
-                                    format_upper = output_format.upper()
-                                    print(f"📈 {format_upper} antecipado copiado: {os.path.basename(destino_output)} ({tamanho_output:.2f} KB)")
-                                    arquivos_gerados.append((destino_output, tamanho_output))
-                                except Exception as e:
-                                    format_upper = output_format.upper()
-                                    print(f"❌ Erro ao copiar {format_upper} antecipado para {output_dir}: {str(e)}")
-                        except Exception as e:
-                            print(f"❌ Erro ao copiar arquivo antecipado para {output_dir}: {str(e)}")
+            if resultado.linhas_rejeitadas and os.getenv('GERAR_ARQUIVO_REJEITADOS', 'true').lower() == 'true':
+                arquivo_rejeitados = write_rejects_sidecar(arquivo, resultado.linhas_rejeitadas, timestamp)
+                if arquivo_rejeitados:
+                    tamanho_rejeitados = os.path.getsize(arquivo_rejeitados) / 1024  # KB
+                    logger.info(f"💾 Linhas rejeitadas salvas: {os.path.basename(arquivo_rejeitados)} ({tamanho_rejeitados:.2f} KB)")
+                    relatorio.append(f"  • Linhas rejeitadas: {len(resultado.linhas_rejeitadas)} "
+                                     f"(ver {os.path.basename(arquivo_rejeitados)})")
+                    arquivos_gerados.append((arquivo_rejeitados, tamanho_rejeitados))
+        
+            # Gravar as saídas no diretório do arquivo e copiar para os diretórios adicionais
+            saidas, arquivos_escritos = write_cnab_outputs(arquivo, resultado, separar_antecipacao, timestamp, relatorio,
+                                                           trailer_totais=config.trailer_totais)
+            arquivos_gerados.extend(arquivos_escritos)
+            saidas_por_perfil = [saidas]
+        
+            # Perfis adicionais: mesmas linhas já classificadas, arquivos próprios
+            for perfil in perfis or ():
+                resultado_perfil = resultado.perfis[perfil.nome]
+                logger.info(f"🧩 Perfil {perfil.nome}: {resultado_perfil.registros_mantidos} registros mantidos")
+                relatorio.append(f"  • Perfil {perfil.nome}: {resultado_perfil.registros_mantidos} registros mantidos")
+                saidas_perfil, arquivos_perfil = write_cnab_outputs(
+                    arquivo, resultado_perfil, perfil.config.separar_antecipacao, timestamp, relatorio,
+                    perfil=perfil.nome, output_format=perfil.formato, trailer_totais=config.trailer_totais)
+                arquivos_gerados.extend(arquivos_perfil)
+                saidas_por_perfil.append(saidas_perfil)
+        
+            # Dados do relatório (registros mantidos contam apenas dados, não header/trailer)
+            dados_relatorio = {
+                'banco': banco_detectado,
+                'total_linhas': resultado.total_linhas,
+                'linhas_validas': resultado.linhas_validas,
+                'linhas_invalidas': resultado.linhas_invalidas,
+                'linhas_mantidas': resultado.linhas_mantidas,
+                'registros_mantidos': resultado.registros_mantidos,
+                'contagem_operacoes': resultado.contagem_operacoes,
+                'operacoes_normais': resultado.operacoes_normais,
+                'operacoes_antecipadas': resultado.operacoes_antecipadas,
+                'operacoes_sem_tipo': resultado.operacoes_sem_tipo,
+                'tempo_fila': tempo_fila,
+                'versao_config': versao_config,
+                'regra': config.rule_source,
+                'perfis': {nome: r.registros_mantidos for nome, r in resultado.perfis.items()},
+                'erros_integridade': erros_integridade,
+                # Totais dos agregados (CNAB400), já somados na classificação; no journal, como lista
+                'agregados': {
+                    'hash': resultado.hash_conteudo,
+                    'totais': [list(chave) + total for chave, total in resultado.totais_titulos.items()],
+                } if resultado.totais_titulos is not None and resultado.layout != LAYOUT_CNAB240 else None,
+            }
+            if journal:
+                journal.append(ETAPA_SAIDAS, saidas=saidas_por_perfil, arquivos=arquivos_gerados,
+                               hashes={caminho: hash_file(caminho) for caminho, _ in arquivos_gerados},
+                               relatorio=dados_relatorio, segundos=time.time() - inicio_processamento)
     
-    except Exception as e:
-        print(f"❌ Erro ao processar arquivo: {str(e)}")
-        print(traceback.format_exc())
-        relatorio.append(f"❌ ERRO CRÍTICO: {str(e)}")
-        return None, '\n'.join(relatorio), False
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar arquivo: {str(e)}")
+            logger.error(traceback.format_exc())
+            relatorio.append(f"❌ ERRO CRÍTICO: {str(e)}")
+            return None, '\n'.join(relatorio), False
+    
+        return _finish_processing(arquivo, dados_relatorio, saidas_por_perfil, arquivos_gerados, output_dirs,
+                                  copias_adiadas, inicio_processamento, perfil_recursos, journal)
+    finally:
+        # Também nos caminhos de quarentena e erro: desliga o tracemalloc e grava a linha de métricas
+        if perfil_recursos:
+            perfil_recursos.stop(sucesso=False)
+
+def network_staging_dir():
+    """Diretório local das cópias de arquivos do compartilhamento (NETWORK_STAGING_DIR, padrão: entrada_rede)"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('NETWORK_STAGING_DIR', 'entrada_rede'))
+
+def _process_share_file(arquivo, operacoes_desejadas, banco, separar_antecipacao, output_dirs, copias_adiadas,
+                        tempo_fila, versao_config, bank_config, perfis):
+    """
+    Processa um arquivo do compartilhamento de rede a partir de uma cópia local
+
+    Só a cópia (network_fs.fetch_local) e a remoção do original tocam o
+    compartilhamento, ambas sob o ShareGuard: tamanho, backup, hash, leitura e
+    gravação das saídas acontecem no disco local. As saídas voltam para o
+    diretório do arquivo pelas cópias de output_dirs (network_fs.copy_to_dir,
+    com pendências se o compartilhamento cair no meio).
+    """
+    diretorio_rede = os.path.dirname(arquivo)
+    try:
+        copia_local = network_fs.fetch_local(arquivo, network_staging_dir())
+    except (network_fs.ShareUnavailableError, OSError) as e:
+        mensagem = f"Não foi possível copiar {os.path.basename(arquivo)} do compartilhamento: {str(e)}"
+        logger.warning(f"⚠️ {mensagem}")
+        return None, mensagem, False
+
+    destinos = list(output_dirs or [])
+    if copias_adiadas is None and diretorio_rede not in destinos:
+        destinos.append(diretorio_rede)
+    try:
+        return process_cnab_file(copia_local, operacoes_desejadas, banco, separar_antecipacao, destinos,
+                                 copias_adiadas, tempo_fila, versao_config, bank_config, perfis, origem=arquivo)
+    finally:
+        if os.path.exists(copia_local):
+            os.remove(copia_local)
+        else:
+            # A cópia foi para a quarentena: o original também sai do diretório monitorado
+            try:
+                network_fs.remove(arquivo)
+            except (network_fs.ShareUnavailableError, OSError) as e:
+                logger.warning(f"⚠️ Erro ao remover {os.path.basename(arquivo)} do compartilhamento: {str(e)}")
+
+def _finish_processing(arquivo, dados, saidas_por_perfil, arquivos_gerados, output_dirs, copias_adiadas,
+                       inicio_processamento, perfil_recursos, journal):
+    """
+    Etapas de process_cnab_file depois das saídas gravadas: cópias, relatório e registro
+
+    Também é o ponto de retomada de um processamento interrompido (dados,
+    saídas e arquivos gerados vêm do journal).
+    """
+    diretorio = os.path.dirname(arquivo)
+    for saidas_atuais in saidas_por_perfil:
+        if copias_adiadas is None:
+            arquivos_gerados.extend(copy_outputs_to_dirs(saidas_atuais, output_dirs, diretorio, journal))
+        else:
+            copias_adiadas.extend(caminho for _, caminho in list_output_files(saidas_atuais))
     
     # Calcular estatísticas finais
     tempo_processamento = time.time() - inicio_processamento
-    velocidade_processamento = total_linhas / tempo_processamento if tempo_processamento > 0 else 0
-    
-    porcentagem_validas = (linhas_validas / total_linhas) * 100 if total_linhas > 0 else 0
-    porcentagem_invalidas = (linhas_invalidas / total_linhas) * 100 if total_linhas > 0 else 0
-    porcentagem_mantidas = (linhas_mantidas / total_linhas) * 100 if total_linhas > 0 else 0
+    total_linhas = dados['total_linhas']
+    porcentagem_mantidas = (dados['linhas_mantidas'] / total_linhas) * 100 if total_linhas > 0 else 0
     
     # Exibir resumo final
-    print(f"\n✅ Processamento concluído em {tempo_processamento:.2f} segundos")
-    print(f"📊 Linhas no arquivo: {total_linhas}")
-    print(f"📊 Linhas mantidas: {linhas_mantidas} ({porcentagem_mantidas:.2f}%)")
+    logger.info(f"\n✅ Processamento concluído em {tempo_processamento:.2f} segundos")
+    logger.info(f"📊 Linhas no arquivo: {total_linhas}")
+    logger.info(f"📊 Linhas mantidas: {dados['linhas_mantidas']} ({porcentagem_mantidas:.2f}%)")
     
     # Preparar lista de arquivos para o relatório (remover duplicatas por nome de arquivo)
     arquivos_unicos = {}
@@ -684,98 +1048,188 @@ def process_cnab_file(arquivo, operacoes_desejadas=None, banco=None, separar_ant
     
     arquivos_para_relatorio = [caminho for caminho, _ in arquivos_unicos.values()]
     
-    # Corrigir registros mantidos (apenas registros de dados, não header/trailer)
-    registros_mantidos_corrigidos = max(0, linhas_mantidas - 2) if total_linhas > 2 else linhas_mantidas
-    
-    # Gerar relatório usando a função corrigida
+    # Gerar relatório
     relatorio_texto = generate_processing_report(
-        banco_detectado, 
+        dados['banco'], 
         total_linhas, 
-        linhas_validas,  # Já conta apenas registros de dados
-        linhas_invalidas, 
-        registros_mantidos_corrigidos,  # Usar valor corrigido
-        contagem_operacoes,
-        operacoes_normais,
-        operacoes_antecipadas,
-        operacoes_sem_tipo,
+        dados['linhas_validas'],
+        dados['linhas_invalidas'], 
+        dados['registros_mantidos'],
+        dados['contagem_operacoes'],
+        dados['operacoes_normais'],
+        dados['operacoes_antecipadas'],
+        dados['operacoes_sem_tipo'],
         tempo_processamento,
-        arquivos_para_relatorio
+        arquivos_para_relatorio,
+        dados['tempo_fila'],
+        dados['versao_config'],
+        dados['regra'],
+        dados['perfis'],
+        dados['erros_integridade'],
+        perfil_recursos.report_lines() if perfil_recursos else None,
+        report_lines()
     )
     
     # Salvar relatório detalhado em arquivo
-    report_path = save_processing_report(banco_detectado, relatorio_texto, arquivo, output_dirs)
+    report_path = save_processing_report(dados['banco'], relatorio_texto, arquivo,
+                                         output_dirs if copias_adiadas is None else None)
     if report_path:
         arquivos_gerados.append((report_path, os.path.getsize(report_path) / 1024))
+        if copias_adiadas is not None:
+            copias_adiadas.append(report_path)
     
-    # Registrar o arquivo como processado
-    register_processed_file(os.path.basename(arquivo))
+    # Totais por banco/operação/tipo/vencimento (uma única vez por conteúdo do arquivo)
+    if aggregates_enabled() and dados.get('agregados'):
+        try:
+            agregados = record_file_aggregates(
+                os.path.basename(arquivo), dados['banco'], dados['agregados']['hash'],
+                {(operacao, tipo, vencimento): [centavos, quantidade]
+                 for operacao, tipo, vencimento, centavos, quantidade in dados['agregados']['totais']})
+            if agregados and agregados[0] == DUPLICADO:
+                logger.info("💰 Agregados: conteúdo já contabilizado anteriormente (mesmo hash), valores não somados de novo")
+            elif agregados:
+                logger.info(f"💰 Agregados: {agregados[1]} título(s), R$ {format_money(agregados[2])} somados aos totais")
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao registrar os agregados: {str(e)}")
     
-    print(f"\n✅ Processamento concluído com sucesso!")
-    return True
+    # Registrar o arquivo como processado (com cópias adiadas, só depois que elas terminarem)
+    if copias_adiadas is None:
+        register_processed_file(os.path.basename(arquivo))
+        if journal:
+            journal.finish()
+    else:
+        copias_adiadas.arquivo, copias_adiadas.journal = arquivo, journal
+    
+    logger.info(f"\n✅ Processamento concluído com sucesso!")
+    return saidas_por_perfil[0]['alterado'], relatorio_texto, True
+
+def read_first_line(file_path):
+    """Lê a primeira linha de um arquivo (apenas o primeiro registro); retorna "" em caso de erro"""
+    try:
+        return network_fs.call(file_path, read_first_record, file_path)
+    except network_fs.ShareUnavailableError:
+        return ""
+
+def resolve_bank_settings(file_path, bank_configs):
+    """
+    Identifica o banco de um arquivo e retorna a configuração a ser aplicada
+    
+    Args:
+        file_path (str): Caminho do arquivo CNAB
+        bank_configs (dict): Configurações retornadas por load_bank_operations
+        
+    Returns:
+        tuple: (banco_identificado, operacoes_desejadas, separar_antecipacao)
+    """
+    banco_identificado = identify_bank(read_first_line(file_path))
+    
+    # Define as operações desejadas e se deve separar por antecipação com base no banco identificado
+    operacoes_desejadas = None
+    separar_antecipacao = False
+    
+    configuracao = bank_configs.get(banco_identificado)
+    if configuracao and configuracao['enabled']:
+        operacoes_desejadas = configuracao['operations']
+        separar_antecipacao = configuracao['separar_antecipacao']
+        logger.info(f"{bank_signature(banco_identificado).descricao} identificado. Separar antecipação: {separar_antecipacao}")
+    else:
+        logger.info(f"Banco não identificado ou não habilitado: {banco_identificado}")
+    
+    return banco_identificado, operacoes_desejadas, separar_antecipacao
 
 def process_directory(directory, output_dirs=None):
-    """Processa todos os arquivos .RET em um diretório"""
+    """Processa os arquivos .RET novos (e com transferência concluída) de um diretório"""
     try:
-        # Carrega as configurações dos bancos
-        bank_configs = load_bank_operations()
+        # Modo multi-nó: reivindicação por lease e registro compartilhado no próprio diretório
+        leases = get_lease_manager(directory) if multi_node_enabled() else None
+        if leases:
+            is_processed = lambda nome: is_file_processed(nome) or leases.is_done(nome)
+        else:
+            is_processed = is_file_processed
+        
+        # Varredura incremental: apenas arquivos .RET novos/alterados, não processados e estáveis
+        scanner = get_scanner(directory, accept=should_process_file, is_processed=is_processed)
         
-        # Lista todos os arquivos .RET (case insensitive) que não têm underscore
-        ret_files = [f for f in os.listdir(directory) 
-                    if (f.upper().endswith('.RET') or f.lower().endswith('.ret')) and should_process_file(f)]
+        # Fila de prioridade: arquivos recentes/pequenos antes de reprocessamentos em massa
+        scheduler = get_scheduler(directory, bank_of=lambda path: identify_bank(read_first_line(path)))
+        inicio_varredura = time.perf_counter()
+        encontrados = scanner.scan()
+        record_scan_cycle(directory, time.perf_counter() - inicio_varredura, len(encontrados))
+        scheduler.add(encontrados)
         
-        for filename in ret_files:
-            # Verifica se o arquivo já foi processado
-            if is_file_processed(filename):
-                print(f"Arquivo {filename} já foi processado anteriormente. Pulando...")
+        for item in scheduler.drain():
+            file_path = item.path
+            filename = os.path.basename(file_path)
+            
+            if leases and not leases.claim(filename):
+                logger.info(f"Arquivo {filename} em processamento ou já processado por outro nó. Pulando...")
+                scanner.forget(filename)
                 continue
             
-            # Processa o arquivo
-            file_path = os.path.join(directory, filename)
+            # Configuração vigente para este arquivo (troca atômica se o .env mudar entre arquivos)
+            config = get_config()
             
             # Primeiro identifica o banco para determinar a configuração correta
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    primeira_linha = f.readline()
-            except UnicodeDecodeError:
-                try:
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        primeira_linha = f.readline()
-                except Exception:
-                    primeira_linha = ""
-            
-            banco_identificado = identify_bank(primeira_linha)
-            
-            # Define as operações desejadas e se deve separar por antecipação com base no banco identificado
-            operacoes_desejadas = None
-            separar_antecipacao = False
-            
-            if banco_identificado == "BB" and bank_configs['BB']['enabled']:
-                operacoes_desejadas = bank_configs['BB']['operations']
-                separar_antecipacao = bank_configs['BB']['separar_antecipacao']
-                print(f"Banco do Brasil identificado. Separar antecipação: {separar_antecipacao}")
-            elif banco_identificado == "BRADESCO" and bank_configs['BRADESCO']['enabled']:
-                operacoes_desejadas = bank_configs['BRADESCO']['operations']
-                separar_antecipacao = bank_configs['BRADESCO']['separar_antecipacao']
-                print(f"Bradesco identificado. Separar antecipação: {separar_antecipacao}")
-            else:
-                print(f"Banco não identificado ou não habilitado: {banco_identificado}")
+            banco_identificado, operacoes_desejadas, separar_antecipacao = resolve_bank_settings(file_path, config.as_dict())
             
             # Processa o arquivo com as configurações corretas
-            if process_cnab_file(file_path, operacoes_desejadas, banco_identificado, separar_antecipacao, output_dirs):
-                print(f"\nArquivo {filename} processado com sucesso!")
+            sucesso = False
+            try:
+                with live_processing():
+                    _, _, sucesso = process_cnab_file(file_path, operacoes_desejadas, banco_identificado, separar_antecipacao,
+                                                      output_dirs, tempo_fila=item.tempo_fila,
+                                                      versao_config=config.version,
+                                                      bank_config=config.enabled_bank(banco_identificado),
+                                                      perfis=config.profiles_for(banco_identificado))
+            except FileNotFoundError:
+                # Removido ou movido depois da varredura: os demais arquivos do ciclo seguem normalmente
+                logger.info(f"Arquivo {filename} removido ou movido antes do processamento. Pulando...")
+                scanner.forget(filename)
+                continue
+            finally:
+                if leases:
+                    leases.release(filename, done=sucesso)
+            if sucesso:
+                logger.info(f"\nArquivo {filename} processado com sucesso!")
             else:
-                print(f"\nErro ao processar o arquivo {filename}")
+                logger.error(f"\nErro ao processar o arquivo {filename}")
+                scanner.forget(filename)
     except Exception as e:
-        print(f"Erro ao processar diretório {directory}: {str(e)}")
-        print(traceback.format_exc())
+        logger.error(f"Erro ao processar diretório {directory}: {str(e)}")
+        logger.error(traceback.format_exc())
+
+# Cache do registro de arquivos processados: (mtime_ns, tamanho, conjunto de nomes)
+_processed_cache = (None, None, frozenset())
+
+def _parse_processed_names(content):
+    """Extrai os nomes de arquivo das linhas '- <nome> - Processado em ...' / '- <nome> (processado em ...)'"""
+    nomes = set()
+    for linha in content.splitlines():
+        if not linha.startswith('- '):
+            continue
+        nome = linha[2:].split(' - ', 1)[0].split(' (', 1)[0].strip()
+        if nome:
+            nomes.add(nome)
+    return frozenset(nomes)
 
 def is_file_processed(filename):
+    """
+    Verifica se um arquivo já consta no registro processed_files.md
+    
+    O registro só é relido quando o arquivo muda (mtime/tamanho).
+    """
+    global _processed_cache
     try:
-        with open('processed_files.md', 'r', encoding='utf-8') as file:
-            content = file.read()
-            return filename in content
+        st = os.stat('processed_files.md')
     except FileNotFoundError:
         return False
+    
+    mtime_ns, tamanho, nomes = _processed_cache
+    if (st.st_mtime_ns, st.st_size) != (mtime_ns, tamanho):
+        with open('processed_files.md', 'r', encoding='utf-8') as file:
+            nomes = _parse_processed_names(file.read())
+        _processed_cache = (st.st_mtime_ns, st.st_size, nomes)
+    return filename in nomes
 
 def register_processed_file(filename):
     """
@@ -788,9 +1242,9 @@ def register_processed_file(filename):
         with open('processed_files.md', 'a+', encoding='utf-8') as file:
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             file.write(f"- {filename} - Processado em {timestamp}\n")
-            print(f"Arquivo {filename} registrado como processado.")
+            logger.info(f"Arquivo {filename} registrado como processado.")
     except Exception as e:
-        print(f"Erro ao registrar arquivo processado: {str(e)}")
+        logger.error(f"Erro ao registrar arquivo processado: {str(e)}")
 
 def save_processing_report(banco, report_content, arquivo_processado=None, output_dirs=None):
     """
@@ -814,17 +1268,17 @@ def save_processing_report(banco, report_content, arquivo_processado=None, outpu
         if not os.path.exists(reports_dir):
             try:
                 os.makedirs(reports_dir)
-                print(f"Diretório de relatórios criado: {reports_dir}")
+                logger.info(f"Diretório de relatórios criado: {reports_dir}")
             except Exception as e:
-                print(f"⚠️ Erro ao criar diretório de relatórios: {str(e)}")
+                logger.warning(f"⚠️ Erro ao criar diretório de relatórios: {str(e)}")
                 # Tenta salvar no diretório atual se não conseguir criar
                 reports_dir = os.path.dirname(os.path.abspath(__file__))
-                print(f"Usando diretório alternativo: {reports_dir}")
+                logger.info(f"Usando diretório alternativo: {reports_dir}")
         
         # Gera nome do relatório no formato ideal: <nome_arquivo>_relatorio.txt
         if arquivo_processado:
             # Remove extensão do nome do arquivo
-            nome_arquivo = os.path.splitext(os.path.basename(arquivo_processado))[0]
+            nome_arquivo = os.path.splitext(cnab_name(arquivo_processado))[0]
             report_filename = f"{nome_arquivo}_relatorio.txt"
         else:
             # Fallback para quando não há arquivo processado
@@ -839,37 +1293,38 @@ def save_processing_report(banco, report_content, arquivo_processado=None, outpu
             report_file.write(report_content)
         
         file_size = os.path.getsize(report_path) / 1024  # KB
-        print(f"\n📝 Relatório detalhado salvo em: {report_path} ({file_size:.2f} KB)")
+        logger.info(f"\n📝 Relatório detalhado salvo em: {report_path} ({file_size:.2f} KB)")
         
         # Copia o relatório para os diretórios de saída (pasta da rede)
         if output_dirs:
             for output_dir in output_dirs:
-                if output_dir and os.path.exists(output_dir):
+                if output_dir and (network_fs.guard_for(output_dir) or os.path.exists(output_dir)):
                     try:
-                        destino_report = os.path.join(output_dir, report_filename)
-                        shutil.copy2(report_path, destino_report)
-                        print(f"📝 Relatório copiado para: {destino_report} ({file_size:.2f} KB)")
+                        destino_report = network_fs.copy_to_dir(report_path, output_dir, report_filename)
+                        if not destino_report:
+                            continue
+                        logger.info(f"📝 Relatório copiado para: {destino_report} ({file_size:.2f} KB)")
                     except Exception as e:
-                        print(f"⚠️ Erro ao copiar relatório para {output_dir}: {str(e)}")
+                        logger.warning(f"⚠️ Erro ao copiar relatório para {output_dir}: {str(e)}")
         
         return report_path
         
     except Exception as e:
-        print(f"⚠️ Erro ao salvar relatório: {str(e)}")
-        print(traceback.format_exc())
+        logger.warning(f"⚠️ Erro ao salvar relatório: {str(e)}")
+        logger.error(traceback.format_exc())
         
         # Tenta método alternativo de salvamento
         try:
-            print("Tentando método alternativo de salvamento...")
+            logger.info("Tentando método alternativo de salvamento...")
             # Tenta salvar na raiz do projeto
             root_dir = os.path.dirname(os.path.abspath(__file__))
             alternative_path = os.path.join(root_dir, f"report_{banco}_{timestamp}.txt")
             with open(alternative_path, 'w', encoding='utf-8') as alt_file:
                 alt_file.write(report_content)
-            print(f"📄 Relatório salvo com método alternativo: {alternative_path}")
+            logger.info(f"📄 Relatório salvo com método alternativo: {alternative_path}")
             return alternative_path
         except Exception as e2:
-            print(f"❌ Falha final ao salvar relatório: {str(e2)}")
+            logger.error(f"❌ Falha final ao salvar relatório: {str(e2)}")
             return None
 
 def main():
@@ -886,38 +1341,46 @@ def main():
     if network_dir:
         output_dirs.append(network_dir)
     
-    print(f"Monitorando diretórios:")
-    print(f"Local: {local_dir}")
-    print(f"Rede: {network_dir}")
-    print(f"Salvando arquivos em: {', '.join(output_dirs)}")
-    print(f"Intervalo de verificação: {check_interval} segundos")
+    logger.info(f"Monitorando diretórios:")
+    logger.info(f"Local: {local_dir}")
+    logger.info(f"Rede: {network_dir}")
+    logger.info(f"Salvando arquivos em: {', '.join(output_dirs)}")
+    logger.info(f"Intervalo de verificação: {check_interval} segundos")
+    
+    # Arquivamento das saídas e backups antigos em segundo plano (RETENCAO_DIAS)
+    retencao = start_retention_worker(is_file_processed)
     
     while True:
         try:
-            print(f"\n{'='*80}")
-            print(f"Verificando arquivos em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"{'='*80}")
+            logger.info(f"\n{'='*80}")
+            logger.info(f"Verificando arquivos em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info(f"{'='*80}")
             
             # Processa diretório local
-            print("\nProcessando diretório local...")
+            logger.info("\nProcessando diretório local...")
             process_directory(local_dir, output_dirs)
             
+            # Envia saídas que ficaram pendentes durante uma queda do compartilhamento
+            network_fs.flush_pending()
+            
             # Processa diretório de rede
-            if network_dir and os.path.exists(network_dir):
-                print("\nProcessando diretório de rede...")
+            if network_dir and network_fs.path_exists(network_dir):
+                logger.info("\nProcessando diretório de rede...")
                 process_directory(network_dir, output_dirs)
             else:
-                print(f"\nDiretório de rede não encontrado: {network_dir}")
+                logger.info(f"\nDiretório de rede não encontrado: {network_dir}")
             
-            print(f"\nAguardando {check_interval} segundos para próxima verificação...")
+            logger.info(f"\nAguardando {check_interval} segundos para próxima verificação...")
             time.sleep(check_interval)
             
         except KeyboardInterrupt:
-            print("\nProcessamento interrompido pelo usuário.")
+            logger.info("\nProcessamento interrompido pelo usuário.")
+            if retencao:
+                retencao.stop()
             break
         except Exception as e:
-            print(f"\nErro durante o processamento: {str(e)}")
-            print(f"Tentando novamente em {check_interval} segundos...")
+            logger.error(f"\nErro durante o processamento: {str(e)}")
+            logger.info(f"Tentando novamente em {check_interval} segundos...")
             time.sleep(check_interval)
 
 if __name__ == "__main__":
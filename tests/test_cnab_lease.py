@@ -0,0 +1,161 @@
+"""
+Verificação do modo multi-nó com vários processos disputando o mesmo diretório
+
+Cada "nó" é um processo separado (multiprocessing, spawn) executando
+process_cnab.process_directory com MULTI_NODE=true e o próprio
+processed_files.md. Execute com: python -m unittest discover tests
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _campo(linha, inicio, fim, valor):
+    return linha[:inicio] + valor + linha[fim:]
+
+
+def make_cnab400(registros):
+    """Arquivo de retorno CNAB400 do BB com ``registros`` títulos (operações 06 e 09 alternadas)"""
+    header = _campo(_campo(' ' * 400, 0, 9, '02RETORNO'), 76, 79, '001')
+    linhas = [_campo(header, 394, 400, '000001')]
+    for i in range(registros):
+        linha = _campo(' ' * 400, 0, 1, '7')
+        linha = _campo(linha, 108, 110, '06' if i % 2 == 0 else '09')
+        linha = _campo(linha, 110, 116, f"{i % 28 + 1:02d}0825")
+        linha = _campo(linha, 116, 131, f"{10000 + i}-E".ljust(15))
+        linha = _campo(linha, 152, 165, f"{1000 + i:013d}")
+        linha = _campo(linha, 251, 267, f"{(1000 + i) * 10:016d}")
+        linha = _campo(linha, 318, 319, '2')
+        linhas.append(_campo(linha, 394, 400, f"{i + 2:06d}"))
+    trailer = _campo(' ' * 400, 0, 7, '9201001')
+    linhas.append(_campo(trailer, 394, 400, f"{registros + 2:06d}"))
+    return '\n'.join(linhas) + '\n'
+
+
+def run_node(diretorio, trabalho, node_id, cair_apos_saidas=False, cair_ao_assumir=False):
+    """
+    Um nó: processa o diretório monitorado
+
+    Com cair_apos_saidas, cai logo depois de gravar as saídas; com
+    cair_ao_assumir, cai ao remover um lease abandonado (marcador de tomada já criado).
+    """
+    os.makedirs(trabalho, exist_ok=True)
+    os.chdir(trabalho)
+    os.environ.update({
+        'MULTI_NODE': 'true', 'NODE_ID': node_id, 'LEASE_TTL': '1', 'LEASE_HEARTBEAT': '0.2',
+        'FILE_SETTLE_SECONDS': '0', 'BB_OPERACAO': '06', 'BB_ENABLE': 'true',
+        'BB_SEPARAR_ANTECIPACAO': 'false', 'REPORTS_DIR': os.path.join(trabalho, 'reports'),
+        'QUARENTENA_DIR': os.path.join(trabalho, 'quarentena'), 'NETWORK_CNAB_DIR': '',
+        'JOURNAL_DIR': os.path.join(trabalho, 'journal'),  # máquinas diferentes: nada local é compartilhado
+        'PARSE_CACHE': 'false', 'AGREGADOS': 'false', 'PROFILING': 'false',
+    })
+    sys.path.insert(0, RAIZ)
+    import process_cnab
+    if cair_apos_saidas:
+        # Queda do processo entre a gravação das saídas e o .done (sem liberar o lease)
+        process_cnab._finish_processing = lambda *args, **kwargs: os._exit(3)
+    if cair_ao_assumir:
+        import cnab_lease
+        remover = cnab_lease.LeaseManager._remove_quietly
+        cnab_lease.LeaseManager._remove_quietly = lambda self, path: (
+            os._exit(4) if path.endswith('.lease') else remover(self, path))
+    process_cnab.process_directory(diretorio)
+
+
+class MultiNodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='cnab_lease_')
+        self.diretorio = os.path.join(self.base, 'monitorado')
+        os.makedirs(self.diretorio)
+        self.nomes = [f"LEASE{os.getpid()}N{i}.RET" for i in range(4)]
+        for i, nome in enumerate(self.nomes):
+            with open(os.path.join(self.diretorio, nome), 'w', encoding='utf-8') as f:
+                f.write(make_cnab400(20 + i))
+        self.contexto = multiprocessing.get_context('spawn')
+
+    def tearDown(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+        # Backups vão para a pasta cnab/ do projeto (backup_original_file)
+        for nome in self.nomes:
+            for backup in glob.glob(os.path.join(RAIZ, 'cnab', f"{os.path.splitext(nome)[0]}*")):
+                os.remove(backup)
+
+    def _run_nodes(self, quantidade, rodada, cair_apos_saidas=False, cair_ao_assumir=False):
+        nos = [self.contexto.Process(target=run_node, args=(
+                   self.diretorio, os.path.join(self.base, f"no{i}"), f"no{i}-{rodada}", cair_apos_saidas,
+                   cair_ao_assumir))
+               for i in range(quantidade)]
+        for no in nos:
+            no.start()
+        for no in nos:
+            no.join(120)
+        return [no.exitcode for no in nos]
+
+    def _outputs(self, nome):
+        return glob.glob(os.path.join(self.diretorio, f"{os.path.splitext(nome)[0]}_*_alterado.RET"))
+
+    def _registrations(self):
+        registros = []
+        for caminho in glob.glob(os.path.join(self.base, 'no*', 'processed_files.md')):
+            with open(caminho, encoding='utf-8') as f:
+                registros.extend(linha.split(' - ')[0][2:] for linha in f if linha.startswith('- '))
+        return registros
+
+    def test_concurrent_nodes_process_each_file_once(self):
+        self._run_nodes(4, 'a')
+        lease_dir = os.path.join(self.diretorio, '.cnab_leases')
+        for nome in self.nomes:
+            self.assertTrue(os.path.exists(os.path.join(lease_dir, f"{nome}.done")), nome)
+            self.assertEqual(len(self._outputs(nome)), 1, nome)
+        self.assertEqual(sorted(self._registrations()), sorted(self.nomes))
+        self.assertEqual(glob.glob(os.path.join(lease_dir, '*.journal')), [])
+        self.assertEqual(glob.glob(os.path.join(lease_dir, '*.lease')), [])
+
+    def test_crashed_node_is_resumed_without_duplicate_outputs(self):
+        codigos = self._run_nodes(1, 'a', cair_apos_saidas=True)
+        self.assertEqual(codigos, [3])
+        antes = {nome: self._outputs(nome) for nome in self.nomes}
+        self.assertEqual(sum(len(saidas) for saidas in antes.values()), 1)
+
+        # Os nós restantes assumem o lease abandonado (LEASE_TTL=1) e retomam pelo journal compartilhado
+        time.sleep(1.5)
+        self._run_nodes(3, 'b')
+        lease_dir = os.path.join(self.diretorio, '.cnab_leases')
+        for nome in self.nomes:
+            self.assertTrue(os.path.exists(os.path.join(lease_dir, f"{nome}.done")), nome)
+            saidas = self._outputs(nome)
+            self.assertEqual(len(saidas), 1, nome)
+            if antes[nome]:
+                self.assertEqual(saidas, antes[nome])
+        self.assertEqual(sorted(self._registrations()), sorted(self.nomes))
+        self.assertEqual(glob.glob(os.path.join(lease_dir, '*.journal')), [])
+
+
+    def test_node_crashed_during_takeover_does_not_block_the_file(self):
+        self.assertEqual(self._run_nodes(1, 'a', cair_apos_saidas=True), [3])
+        time.sleep(1.5)
+        # O nó cai com o marcador de tomada criado e o lease abandonado ainda no lugar
+        self.assertEqual(self._run_nodes(1, 'b', cair_ao_assumir=True), [4])
+        lease_dir = os.path.join(self.diretorio, '.cnab_leases')
+        self.assertEqual(len(glob.glob(os.path.join(lease_dir, '*.takeover'))), 1)
+
+        # Depois de LEASE_TTL, o marcador também é considerado abandonado
+        time.sleep(1.5)
+        self._run_nodes(2, 'c')
+        for nome in self.nomes:
+            self.assertTrue(os.path.exists(os.path.join(lease_dir, f"{nome}.done")), nome)
+            self.assertEqual(len(self._outputs(nome)), 1, nome)
+        self.assertEqual(sorted(self._registrations()), sorted(self.nomes))
+        self.assertEqual(glob.glob(os.path.join(lease_dir, '*.takeover')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Verificação das saídas gravadas por process_cnab.write_cnab_outputs
+
+Execute com: python -m unittest discover tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from test_cnab_lease import make_cnab400
+from cnab_core import BankConfig, filter_cnab
+import process_cnab
+
+# Configuração padrão das saídas (sem .env): nenhuma ordenação nem recálculo do trailer
+AMBIENTE_PADRAO = {'RECALCULAR_TRAILER': '', 'ORDENAR_SAIDA': '', 'PARTICIONAR_SAIDA_POR_DATA': 'false',
+                   'DIVIDIR_SAIDA_REGISTROS': '0'}
+
+
+class OutputPiecesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp(prefix='cnab_saidas_')
+        self.arquivo = os.path.join(self.diretorio, 'SAIDAS.RET')
+        with open(self.arquivo, 'w', encoding='utf-8') as f:
+            f.write(make_cnab400(10))
+        with open(self.arquivo, 'rb') as f:
+            self.resultado = filter_cnab(f, BankConfig('BB', ['06']))
+
+    def tearDown(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _write(self, **ambiente):
+        with mock.patch.dict(os.environ, dict(AMBIENTE_PADRAO, **ambiente)):
+            return process_cnab.write_cnab_outputs(self.arquivo, self.resultado, False, '20261019120000', [])[0]
+
+    def _lines(self, caminho):
+        with open(caminho, encoding='utf-8') as f:
+            return f.read().split('\n')
+
+    def test_parts_are_renumbered_by_default(self):
+        saidas = self._write(DIVIDIR_SAIDA_REGISTROS='2')
+        self.assertEqual(len(saidas['partes']), 3)
+        for parte in saidas['partes']:
+            linhas = self._lines(parte)
+            self.assertEqual(linhas[0][:1], '0', parte)
+            self.assertEqual(linhas[-1][:1], '9', parte)
+            self.assertEqual([int(linha[394:400]) for linha in linhas], list(range(1, len(linhas) + 1)), parte)
+
+    def test_single_output_keeps_original_sequence_by_default(self):
+        saidas = self._write()
+        sequenciais = [int(linha[394:400]) for linha in self._lines(saidas['alterado'])]
+        # Registros 06 são os títulos pares do arquivo original (sequenciais 2, 4, 6, ...)
+        self.assertEqual(sequenciais, [1, 2, 4, 6, 8, 10, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()